@@ -0,0 +1,510 @@
+import numpy as np
+import pyarrow as pa
+import pyarrow.compute as pc
+from typing import Dict, List, Any, Optional, Union
+
+from mappings import transforms
+from mappings.row_view import row_views
+from mappings.mapper import Mapper, MappingPlan, MappingEntry, PathSegment, _CompiledEntry
+
+
+class _Unsupported(Exception):
+    """Il mapping non è esprimibile in forma colonnare per lo schema Arrow della sorgente"""
+
+
+class _Leaf:
+    """Valore mappato: la regola di mapping e il path sorgente relativo al contesto di valutazione"""
+    __slots__ = ("entry", "src_segments")
+
+    def __init__(self, entry: _CompiledEntry, src_segments: Optional[List[PathSegment]]):
+        self.entry = entry
+        self.src_segments = src_segments
+
+
+class _DictNode:
+    __slots__ = ("children",)
+
+    def __init__(self):
+        self.children: Dict[str, Any] = {}
+
+
+class _ListNode:
+    """Lista a lunghezza fissa creata da target indicizzati (es. messages[1].content)"""
+    __slots__ = ("items",)
+
+    def __init__(self):
+        self.items: List[Any] = []
+
+
+class _DynListNode:
+    """Lista creata da un target dinamico (es. messages[].role), lunga quanto l'array sorgente"""
+    __slots__ = ("src_base", "element")
+
+    def __init__(self, src_base: List[PathSegment]):
+        self.src_base = src_base
+        self.element: Any = None
+
+
+_Node = Union[_Leaf, _DictNode, _ListNode, _DynListNode]
+
+
+def _is_const_none(node: Any) -> bool:
+    entry = node.entry if isinstance(node, _Leaf) else None
+    return entry is not None and entry.src_segments is None and not isinstance(entry.transformation, dict) \
+        and (entry.caster(entry.transformation) if entry.caster else entry.transformation) is None
+
+
+def _is_list_like(t: pa.DataType) -> bool:
+    return pa.types.is_list(t) or pa.types.is_large_list(t) or pa.types.is_fixed_size_list(t)
+
+
+def _is_object_schema(schema: Any) -> bool:
+    if not isinstance(schema, dict):
+        return False
+    typ = schema.get("type")
+    if isinstance(typ, list):
+        types = [t for t in typ if t != "null"]
+        typ = types[0] if types else "null"
+    return typ == "object" or ("properties" in schema and typ is None)
+
+
+def _target_type(target_schema: Dict[str, Any]) -> Optional[str]:
+    if not target_schema:
+        return None
+    target_type = target_schema.get("type")
+    if isinstance(target_type, list):
+        target_type = next((t for t in target_type if t != "null"), "string")
+    return target_type
+
+
+def _constant(value: Any, length: int, type: Optional[pa.DataType] = None) -> pa.Array:
+    if value is None:
+        return pa.nulls(length, type or pa.null())
+    try:
+        single = pa.array([value], type=type)
+    except (pa.ArrowInvalid, pa.ArrowTypeError, TypeError) as e:
+        raise _Unsupported(f"costante non rappresentabile in Arrow: {value!r}") from e
+    return single.take(pa.array(np.zeros(length, dtype=np.int64)))
+
+
+def _list_lengths(arr: pa.Array) -> np.ndarray:
+    return pc.fill_null(pc.list_value_length(arr), 0).to_numpy(zero_copy_only=False).astype(np.int64)
+
+
+def _list_element(arr: pa.Array, index: int) -> pa.Array:
+    """Elemento index di ogni lista; null se la lista è null o troppo corta (come _get_by_segments)"""
+    lengths = _list_lengths(arr)
+    starts = np.concatenate(([0], np.cumsum(lengths)[:-1])) if len(lengths) else lengths
+    positions = pa.array(starts + index, mask=lengths <= index)
+    return arr.flatten().take(positions)
+
+
+def _offsets(lengths: np.ndarray) -> pa.Array:
+    return pa.array(np.concatenate(([0], np.cumsum(lengths))).astype(np.int32))
+
+
+def _merge_types(a: pa.DataType, b: pa.DataType) -> pa.DataType:
+    """Tipo comune di due colonne, come lo otterrebbe pa.Table.from_pylist sugli stessi valori"""
+    if a == b or pa.types.is_null(b):
+        return a
+    if pa.types.is_null(a):
+        return b
+    if pa.types.is_struct(a) and pa.types.is_struct(b):
+        fields = {f.name: f.type for f in a}
+        for f in b:
+            fields[f.name] = _merge_types(fields[f.name], f.type) if f.name in fields else f.type
+        return pa.struct(list(fields.items()))
+    if _is_list_like(a) and _is_list_like(b):
+        return pa.list_(_merge_types(a.value_type, b.value_type))
+    if pa.types.is_integer(a) and pa.types.is_floating(b) or pa.types.is_floating(a) and pa.types.is_integer(b):
+        return pa.float64()
+    raise _Unsupported(f"tipi incompatibili nello stesso campo: {a} / {b}")
+
+
+def _conform(arr: pa.Array, type: pa.DataType) -> pa.Array:
+    if arr.type == type:
+        return arr
+    if pa.types.is_null(arr.type):
+        return pa.nulls(len(arr), type)
+    if pa.types.is_struct(type):
+        children = dict(zip([f.name for f in arr.type], arr.flatten()))
+        arrays = [_conform(children[f.name], f.type) if f.name in children else pa.nulls(len(arr), f.type) for f in type]
+        return pa.StructArray.from_arrays(arrays, fields=list(type), mask=arr.is_null())
+    if _is_list_like(type):
+        values = _conform(arr.flatten(), type.value_type)
+        return pa.ListArray.from_arrays(_offsets(_list_lengths(arr)), values, mask=arr.is_null())
+    return arr.cast(type)
+
+
+def _unify(arrays: List[pa.Array]) -> List[pa.Array]:
+    merged = arrays[0].type
+    for arr in arrays[1:]:
+        merged = _merge_types(merged, arr.type)
+    return [_conform(arr, merged) for arr in arrays]
+
+
+def _insert_node(root: Any, segments: List[PathSegment], leaf: _Leaf) -> Any:
+    """Replica _set_by_segments sulla forma dell'output; restituisce la nuova radice"""
+    if not segments:
+        return leaf
+    cur = root
+    for i, seg in enumerate(segments):
+        last = i == len(segments) - 1
+        if isinstance(seg, int):
+            if not isinstance(cur, _ListNode):
+                raise _Unsupported("lista creata su un nodo non-lista")
+            while len(cur.items) <= seg:
+                cur.items.append(None)
+            if last:
+                cur.items[seg] = leaf
+                return root
+            child = cur.items[seg]
+            if child is None or _is_const_none(child):
+                child = _ListNode() if isinstance(segments[i + 1], int) else _DictNode()
+                cur.items[seg] = child
+            elif isinstance(child, _Leaf):
+                raise _Unsupported("container creato su un valore mappato")
+            cur = child
+        else:
+            if not isinstance(cur, _DictNode):
+                raise _Unsupported("dict creato su un nodo non-dict")
+            if last:
+                cur.children[seg] = leaf
+                return root
+            child = cur.children.get(seg)
+            if child is None or _is_const_none(child):
+                child = _ListNode() if isinstance(segments[i + 1], int) else _DictNode()
+                cur.children[seg] = child
+            elif isinstance(child, (_Leaf, _DynListNode)):
+                raise _Unsupported("container creato su un valore mappato")
+            cur = child
+    return root
+
+
+def build_output_shape(plan: MappingPlan) -> _DictNode:
+    """
+    Forma dell'output (dict, liste fisse, liste dinamiche, foglie) prodotta dal piano compilato,
+    indipendente dai dati. Solleva _Unsupported per i mapping il cui output cambia forma riga per riga.
+    """
+    root = _DictNode()
+    for entry in plan.static_entries:
+        if entry.target_segments:
+            _insert_node(root, entry.target_segments, _Leaf(entry, entry.src_segments))
+
+    for level in plan.array_levels:
+        if level.children or any(unpaired for _, unpaired in level.entries):
+            raise _Unsupported("annidazione multipla di '[]'")
+        base = level.target_path
+        if any(isinstance(seg, int) for seg in base):
+            raise _Unsupported("indici fissi in un target dinamico")
+        parent = root
+        for seg in base[:-1]:
+            parent = parent.children.get(seg) if isinstance(parent, _DictNode) else None
+            if not isinstance(parent, _DictNode):
+                raise _Unsupported("target dinamico sotto un container creato dinamicamente")
+        if not base or base[-1] in parent.children:
+            raise _Unsupported("target dinamico condiviso con altre regole")
+        node = _DynListNode(level.src_path)
+        parent.children[base[-1]] = node
+        for entry, _ in level.entries:
+            rest = entry.target_segments
+            if any(isinstance(seg, int) for seg in rest):
+                raise _Unsupported("indici fissi in un target dinamico")
+            leaf = _Leaf(entry, entry.src_segments)
+            if not rest:
+                node.element = leaf
+            else:
+                if node.element is None or _is_const_none(node.element):
+                    node.element = _DictNode()
+                elif not isinstance(node.element, _DictNode):
+                    raise _Unsupported("container creato su un valore mappato")
+                _insert_node(node.element, rest, leaf)
+    return root
+
+
+def _schema_fill_value(mapper: Mapper, pschema: Dict[str, Any]) -> Any:
+    """Valore che _populate_required_and_defaults assegna a una proprietà assente o None"""
+    if "default" in pschema:
+        d = pschema["default"]
+        return None if d == "null" else d
+    if "enum" in pschema and isinstance(pschema["enum"], list) and pschema["enum"]:
+        return pschema["enum"][0]
+    ptype = pschema.get("type")
+    if isinstance(ptype, list) and "null" in ptype:
+        return None
+    return mapper.instantiate_from_schema_minimal(pschema)
+
+
+def _fill_compatible(value: Any, t: pa.DataType) -> bool:
+    return (
+        (isinstance(value, bool) and pa.types.is_boolean(t))
+        or (isinstance(value, int) and not isinstance(value, bool) and (pa.types.is_integer(t) or pa.types.is_floating(t)))
+        or (isinstance(value, float) and pa.types.is_floating(t))
+        or (isinstance(value, str) and (pa.types.is_string(t) or pa.types.is_large_string(t)))
+        or (isinstance(value, dict) and pa.types.is_struct(t))
+        or (isinstance(value, list) and _is_list_like(t))
+    )
+
+
+def _check_untouched(t: pa.DataType, schema: Any):
+    """Un valore annidato copiato dalla sorgente verrebbe completato con i default: non supportato"""
+    if pa.types.is_struct(t) and isinstance(schema, dict) and schema.get("properties"):
+        raise _Unsupported("struct sorgente completata con i default dello schema")
+    if _is_list_like(t) and pa.types.is_struct(t.value_type):
+        items = schema.get("items", {}) if isinstance(schema, dict) else {}
+        if isinstance(items, dict) and items.get("properties"):
+            raise _Unsupported("lista di struct sorgente completata con i default dello schema")
+
+
+def _fill_nulls(col: pa.Array, value: Any) -> pa.Array:
+    if value is None or col.null_count == 0:
+        return col
+    if pa.types.is_null(col.type):
+        return _constant(value, len(col))
+    if not _fill_compatible(value, col.type):
+        raise _Unsupported(f"default {value!r} incompatibile con colonna {col.type}")
+    return pc.if_else(col.is_null(), _constant(value, len(col), col.type), col)
+
+
+class ArrowMapper:
+    """
+    Esegue un mapping (lista di regole src_field/target_field/transformation) direttamente sulle
+    colonne di un pyarrow.RecordBatch, senza materializzare un dict Python per riga.
+
+    Il risultato coincide con pa.Table.from_pylist sulle righe prodotte da Mapper.apply_mapping.
+    Se il mapping, o lo schema della sorgente, usa casi non esprimibili in forma colonnare
+    (cast dipendenti dal valore, conflitti di path, tipi Arrow esotici) il batch viene mappato
+    riga per riga con il Mapper, e la decisione viene memorizzata per quello schema sorgente.
+    """
+
+    def __init__(self, mapping: List[MappingEntry], dst_schema: Dict[str, Any], mapper: Optional[Mapper] = None):
+        self.mapper = mapper or Mapper()
+        self.dst_schema = dst_schema
+        self.plan = self.mapper.compile(mapping, dst_schema)
+        self._columnar: Dict[pa.Schema, bool] = {}
+        try:
+            self.root: Optional[_DictNode] = build_output_shape(self.plan)
+        except _Unsupported as e:
+            print(f"Mapping non esprimibile in forma colonnare, uso il Mapper riga per riga: {e}")
+            self.root = None
+
+    # ------------------------------------------------------------------
+    # Esecuzione colonnare
+    # ------------------------------------------------------------------
+    def _resolve(self, arr: pa.Array, segments: List[PathSegment]) -> pa.Array:
+        """Equivalente colonnare di _get_by_segments"""
+        for seg in segments:
+            if pa.types.is_dictionary(arr.type):
+                arr = arr.dictionary_decode()
+            t = arr.type
+            if pa.types.is_map(t):
+                raise _Unsupported("colonne di tipo map")
+            if pa.types.is_null(t):
+                return arr
+            if isinstance(seg, int):
+                if not _is_list_like(t):
+                    return pa.nulls(len(arr))
+                arr = _list_element(arr, seg)
+            elif seg == '[]':
+                return pa.nulls(len(arr))
+            else:
+                if not pa.types.is_struct(t) or t.get_field_index(seg) < 0:
+                    return pa.nulls(len(arr))
+                arr = pc.struct_field(arr, [t.get_field_index(seg)])
+        if pa.types.is_dictionary(arr.type):
+            arr = arr.dictionary_decode()
+        if pa.types.is_map(arr.type):
+            raise _Unsupported("colonne di tipo map")
+        return arr
+
+    def _cast(self, col: pa.Array, target_type: Optional[str]) -> pa.Array:
+        """Equivalente colonnare di Mapper._compile_caster, limitato ai casi indipendenti dal valore"""
+        t = col.type
+        if target_type is None or pa.types.is_null(t):
+            return col
+        nested = pa.types.is_struct(t) or _is_list_like(t)
+        is_str = pa.types.is_string(t) or pa.types.is_large_string(t)
+        if target_type == "string":
+            if is_str or nested:
+                return col
+            if pa.types.is_integer(t):
+                return col.cast(pa.string())
+            if pa.types.is_boolean(t):
+                return pc.if_else(col, "True", "False")
+        elif target_type == "integer":
+            if not is_str and not pa.types.is_floating(t):
+                return col
+        elif target_type == "number":
+            if not is_str:
+                return col
+        elif target_type == "boolean":
+            if pa.types.is_boolean(t):
+                return col
+            if is_str:
+                return pc.if_else(col.is_null(), None, pc.is_in(pc.utf8_lower(col), value_set=pa.array(["true", "1", "yes", "on"])))
+            if pa.types.is_integer(t) or pa.types.is_floating(t):
+                return pc.not_equal(col, 0)
+        else:
+            return col
+        raise _Unsupported(f"cast di {t} verso '{target_type}' dipendente dal valore")
+
+    def _lookup(self, col: pa.Array, entry: _CompiledEntry) -> pa.Array:
+        """Enum mapping (transformation dict) tramite index_in + take"""
+        table = entry.transformation
+        if not all(isinstance(k, str) for k in table):
+            raise _Unsupported("chiavi non stringa in una transformation enum")
+        if pa.types.is_null(col.type):
+            return col
+        if not (pa.types.is_string(col.type) or pa.types.is_large_string(col.type)):
+            raise _Unsupported(f"transformation enum su colonna {col.type}")
+        values = [table[k] for k in table]
+        if entry.caster:
+            values = [entry.caster(v) if v is not None else None for v in values]
+        try:
+            value_array = pa.array(values)
+        except (pa.ArrowInvalid, pa.ArrowTypeError) as e:
+            raise _Unsupported("valori eterogenei in una transformation enum") from e
+        return value_array.take(pc.index_in(col, value_set=pa.array(list(table), type=col.type)))
+
+    def _evaluate(self, leaf: _Leaf, ctx: pa.Array) -> pa.Array:
+        entry = leaf.entry
+        if isinstance(entry.transformation, dict):
+            src = self._resolve(ctx, leaf.src_segments) if leaf.src_segments is not None else pa.nulls(len(ctx))
+            return self._lookup(src, entry)
+        if leaf.src_segments is None:
+            value = entry.caster(entry.transformation) if entry.caster else entry.transformation
+            return _constant(value, len(ctx))
+        src = self._resolve(ctx, leaf.src_segments)
+        if entry.transform is not None:
+            src = self._transform(src, entry)
+        return self._cast(src, _target_type(entry.target_schema))
+
+    def _transform(self, col: pa.Array, entry: _CompiledEntry) -> pa.Array:
+        """Trasformazione registrata nel Mapper, eseguita dalla sua implementazione batch"""
+        if entry.batch_transform is None:
+            raise _Unsupported(f"trasformazione '{entry.transformation}' senza implementazione batch")
+        if pa.types.is_null(col.type):
+            return col
+        try:
+            return transforms.apply_batch(entry.batch_transform, col)
+        except (ValueError, TypeError, pa.ArrowException) as e:
+            raise _Unsupported(f"trasformazione '{entry.transformation}' non applicabile a {col.type}: {e}") from e
+
+    def _build(self, node: _Node, ctx: pa.Array, schema: Any, targets: set, active: bool) -> pa.Array:
+        """Materializza un nodo presente; con active applica la logica di _populate_required_and_defaults"""
+        if isinstance(node, _DictNode):
+            return self._build_dict(node, ctx, schema, targets, active)
+        if isinstance(node, _ListNode):
+            return self._build_static_list(node, ctx, schema, active)
+        if isinstance(node, _DynListNode):
+            built = self._build_dyn_list(node, ctx, schema, active)
+            return pa.nulls(len(ctx)) if built is None else built[0]
+        col = self._evaluate(node, ctx)
+        if active:
+            _check_untouched(col.type, schema)
+        return col
+
+    def _build_present(self, node: _Node, ctx: pa.Array, pschema: Dict[str, Any], targets: set) -> pa.Array:
+        """Proprietà dello schema presente nel nodo: ricorsione sui container, default sui valori None"""
+        fill = _schema_fill_value(self.mapper, pschema)
+        if isinstance(node, _DynListNode):
+            built = self._build_dyn_list(node, ctx, pschema, True)
+            if built is None:
+                return _constant(fill, len(ctx))
+            lists, present = built
+            if fill is None:
+                return lists
+            fill_array = _constant(fill, len(ctx))
+            lists, fill_array = _unify([lists, fill_array])
+            return pc.if_else(present, lists, fill_array)
+        col = self._build(node, ctx, pschema, targets, True)
+        return _fill_nulls(col, fill) if isinstance(node, _Leaf) else col
+
+    def _build_dict(self, node: _DictNode, ctx: pa.Array, schema: Any, targets: set, active: bool) -> pa.Array:
+        length = len(ctx)
+        populate = active and _is_object_schema(schema)
+        props = schema.get("properties", {}) if populate else {}
+        names: List[str] = []
+        arrays: List[pa.Array] = []
+        for key, child in node.children.items():
+            if key in props:
+                sub_targets = {t[len(key) + 1:] for t in targets if t.startswith(key + ".")}
+                arrays.append(self._build_present(child, ctx, props[key], sub_targets))
+            else:
+                arrays.append(self._build(child, ctx, None, set(), False))
+            names.append(key)
+        if populate:
+            required = schema.get("required", [])
+            for pname, pschema in props.items():
+                if pname in node.children:
+                    continue
+                should_create = (pname in required) or any(t.startswith(pname + ".") or t == pname or t.startswith(pname + "[") for t in targets) or ("default" in pschema) or ("enum" in pschema)
+                if should_create:
+                    names.append(pname)
+                    arrays.append(_constant(_schema_fill_value(self.mapper, pschema), length))
+        if not arrays:
+            return _constant({}, length, pa.struct([]))
+        return pa.StructArray.from_arrays(arrays, names=names)
+
+    def _build_static_list(self, node: _ListNode, ctx: pa.Array, schema: Any, active: bool) -> pa.Array:
+        length = len(ctx)
+        items_schema = schema.get("items", {}) if active and isinstance(schema, dict) else None
+        elements: List[pa.Array] = []
+        for item in node.items:
+            if item is None:
+                elements.append(pa.nulls(length))
+            elif isinstance(item, _DictNode):
+                elements.append(self._build_dict(item, ctx, items_schema, set(), active))
+            elif isinstance(item, _Leaf):
+                col = self._evaluate(item, ctx)
+                if active:
+                    _check_untouched(col.type, {"properties": (items_schema or {}).get("properties")})
+                elements.append(col)
+            else:
+                # Liste dentro liste: _populate_required_and_defaults non le visita
+                elements.append(self._build(item, ctx, None, set(), False))
+        elements = _unify(elements)
+        k = len(elements)
+        order = (np.arange(k)[None, :] * length + np.arange(length)[:, None]).ravel()
+        values = pa.concat_arrays(elements).take(pa.array(order))
+        return pa.ListArray.from_arrays(pa.array(np.arange(0, length * k + 1, k, dtype=np.int32)), values)
+
+    def _build_dyn_list(self, node: _DynListNode, ctx: pa.Array, schema: Any, active: bool):
+        src = self._resolve(ctx, node.src_base)
+        if not _is_list_like(src.type):
+            return None
+        lengths = _list_lengths(src)
+        present = pa.array(lengths > 0)
+        values = src.flatten()
+        items_schema = schema.get("items", {}) if active and isinstance(schema, dict) else None
+        element = node.element
+        if isinstance(element, _DictNode):
+            elements = self._build_dict(element, values, items_schema, set(), active)
+        else:
+            elements = self._evaluate(element, values)
+            if active:
+                _check_untouched(elements.type, {"properties": (items_schema or {}).get("properties")})
+        lists = pa.ListArray.from_arrays(_offsets(lengths), elements, mask=pc.invert(present))
+        return lists, present
+
+    def _map_columnar(self, batch: pa.RecordBatch) -> pa.RecordBatch:
+        ctx = batch.to_struct_array()
+        mapping_targets = self.plan.mapping_targets
+        out = self._build_dict(self.root, ctx, self.dst_schema, mapping_targets, True)
+        return pa.RecordBatch.from_struct_array(out)
+
+    def _map_rows(self, batch: pa.RecordBatch) -> pa.RecordBatch:
+        return pa.RecordBatch.from_pylist([self.plan.apply(row) for row in row_views(batch)])
+
+    def map_batch(self, batch: pa.RecordBatch) -> pa.RecordBatch:
+        """Mappa un RecordBatch sorgente e restituisce il RecordBatch nel formato di dst_schema"""
+        if self.root is None or self._columnar.get(batch.schema) is False:
+            return self._map_rows(batch)
+        try:
+            out = self._map_columnar(batch)
+            self._columnar[batch.schema] = True
+            return out
+        except _Unsupported as e:
+            print(f"Schema sorgente non supportato dal motore colonnare, uso il Mapper riga per riga: {e}")
+            self._columnar[batch.schema] = False
+            return self._map_rows(batch)
@@ -0,0 +1,149 @@
+import pyarrow as pa
+import pyarrow.compute as pc
+from typing import Dict, List, Any, Optional
+
+from mappings.mapper import Mapper, MappingEntry, PathSegment
+
+_SCALAR_TYPES = {
+    "string": pa.string(),
+    "integer": pa.int64(),
+    "number": pa.float64(),
+    "boolean": pa.bool_(),
+    "null": pa.null(),
+}
+
+
+def _arrow_type(node: Dict[str, Any], path: str) -> pa.DataType:
+    json_type = node.get("type")
+    if isinstance(json_type, list):
+        # Un tipo con "null" diventa un campo nullable: in Arrow lo sono tutti
+        non_null = [t for t in json_type if t != "null"]
+        if len(non_null) > 1:
+            raise ValueError(f"{path}: unione di tipi {json_type} non rappresentabile")
+        json_type = non_null[0] if non_null else "null"
+    if json_type is None:
+        if "properties" in node:
+            json_type = "object"
+        elif "items" in node:
+            json_type = "array"
+        elif node.get("enum") and all(isinstance(v, str) for v in node["enum"]):
+            json_type = "string"
+        else:
+            raise ValueError(f"{path}: tipo non dichiarato")
+    if json_type == "object":
+        properties = node.get("properties")
+        if not properties:
+            raise ValueError(f"{path}: oggetto senza properties")
+        return pa.struct([pa.field(name, _arrow_type(child, f"{path}.{name}")) for name, child in properties.items()])
+    if json_type == "array":
+        items = node.get("items")
+        if not isinstance(items, dict):
+            raise ValueError(f"{path}: array senza items")
+        return pa.list_(_arrow_type(items, f"{path}[]"))
+    if json_type in _SCALAR_TYPES:
+        return _SCALAR_TYPES[json_type]
+    raise ValueError(f"{path}: tipo {json_type} non supportato")
+
+
+def json_schema_to_arrow(schema: Dict[str, Any]) -> pa.Schema:
+    """
+    Schema Arrow equivalente a uno JSON Schema con radice object: properties nell'ordine dichiarato,
+    oggetti come struct, array come list, tipi con "null" come campi nullable.
+    Solleva ValueError per costrutti senza un tipo Arrow fisso (oggetti liberi, unioni, anyOf...).
+    """
+    root = _arrow_type(schema, "$")
+    if not pa.types.is_struct(root):
+        raise ValueError("$: la radice dello schema deve essere un object")
+    return pa.schema(list(root))
+
+
+def _covers(arrow_type: pa.DataType, segments: List[PathSegment]) -> bool:
+    for seg in segments:
+        if isinstance(seg, str) and seg != '[]':
+            if not pa.types.is_struct(arrow_type) or arrow_type.get_field_index(seg) < 0:
+                return False
+            arrow_type = arrow_type.field(seg).type
+        else:
+            if not pa.types.is_list(arrow_type):
+                return False
+            arrow_type = arrow_type.value_type
+    return True
+
+
+def output_schema(dst_schema: Dict[str, Any], mapping: List[MappingEntry]) -> Optional[pa.Schema]:
+    """
+    Schema Arrow fisso per l'output del mapping, oppure None (tipi inferiti dai dati) se dst_schema
+    non è rappresentabile o se un target del mapping cade fuori dallo schema e andrebbe perso.
+    Con lo schema fisso ogni campo di dst_schema è una colonna (o un campo di struct): chi rilegge lo shard
+    trova come null espliciti i campi opzionali che il mapping non valorizza. Per validarlo contro dst_schema
+    vanno tolti (mappings.validation.without_nulls), come fa ValidationReport.
+    """
+    if not dst_schema:
+        return None
+    try:
+        schema = json_schema_to_arrow(dst_schema)
+    except ValueError as e:
+        print(f"Schema di destinazione non convertibile in Arrow, i tipi verranno inferiti: {e}")
+        return None
+    root = pa.struct(list(schema))
+    parser = Mapper()
+    for entry in mapping:
+        target = entry.get("target_field")
+        if target and not _covers(root, parser._parse_path(target)):
+            print(f"Target '{target}' non previsto dallo schema di destinazione, i tipi verranno inferiti")
+            return None
+    return schema
+
+
+def conform_array(arr: Any, arrow_type: pa.DataType) -> pa.Array:
+    """Porta arr al tipo arrow_type: campi di struct per nome (mancanti a null, extra scartati), poi cast"""
+    if isinstance(arr, pa.ChunkedArray):
+        arr = arr.combine_chunks()
+    if arr.type == arrow_type:
+        return arr
+    if pa.types.is_null(arr.type):
+        return pa.nulls(len(arr), arrow_type)
+    if pa.types.is_struct(arrow_type) and pa.types.is_struct(arr.type):
+        children = [
+            conform_array(arr.field(field.name), field.type) if arr.type.get_field_index(field.name) >= 0 else pa.nulls(len(arr), field.type)
+            for field in arrow_type
+        ]
+        return pa.StructArray.from_arrays(children, fields=list(arrow_type), mask=pc.is_null(arr))
+    if pa.types.is_list(arrow_type) and (pa.types.is_list(arr.type) or pa.types.is_large_list(arr.type)):
+        if pa.types.is_large_list(arr.type):
+            arr = arr.cast(pa.list_(arr.type.value_type))
+        # offsets rispetta lo slice dell'array e indicizza values per intero
+        values = conform_array(arr.values, arrow_type.value_type)
+        return pa.ListArray.from_arrays(arr.offsets, values, type=arrow_type, mask=pc.is_null(arr))
+    return arr.cast(arrow_type)
+
+
+def rows_to_table(rows: List[Dict[str, Any]], schema: pa.Schema) -> pa.Table:
+    """Tabella con esattamente le colonne di schema costruita da dict Python, senza inferenza dei tipi"""
+    arrays = []
+    for field in schema:
+        values = [row.get(field.name) for row in rows]
+        try:
+            arrays.append(pa.array(values, type=field.type))
+        except (pa.ArrowInvalid, pa.ArrowTypeError, TypeError):
+            # Valori di un tipo diverso da quello dichiarato (es. int in un campo string): cast esplicito
+            try:
+                arrays.append(conform_array(pa.array(values), field.type))
+            except (pa.ArrowInvalid, pa.ArrowTypeError, pa.ArrowNotImplementedError) as e:
+                raise ValueError(f"colonna '{field.name}' non conforme allo schema ({field.type}): {e}") from e
+    return pa.Table.from_arrays(arrays, schema=schema)
+
+
+def conform_table(table: pa.Table, schema: pa.Schema) -> pa.Table:
+    """Riporta una tabella (es. l'output di ArrowMapper) alle colonne e ai tipi di schema"""
+    arrays = []
+    for field in schema:
+        index = table.schema.get_field_index(field.name)
+        if index < 0:
+            arrays.append(pa.nulls(table.num_rows, field.type))
+            continue
+        try:
+            arrays.append(conform_array(table.column(index), field.type))
+        except (pa.ArrowInvalid, pa.ArrowTypeError, pa.ArrowNotImplementedError) as e:
+            raise ValueError(f"colonna '{field.name}' non conforme allo schema ({field.type}): {e}") from e
+    return pa.Table.from_arrays(arrays, schema=schema)
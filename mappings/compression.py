@@ -0,0 +1,52 @@
+import bz2
+import gzip
+import lzma
+import pyarrow as pa
+from typing import BinaryIO, Dict, Optional
+
+# zstandard serve solo se pyarrow è stato compilato senza il codec zstd
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+# Estensioni dei file compressi letti in streaming (decompressi un blocco alla volta)
+COMPRESSION_EXTENSIONS = (".gz", ".zst", ".xz", ".bz2")
+# Rapporto di espansione stimato dei file compressi, per il costo delle unità di lavoro
+COMPRESSION_RATIOS: Dict[str, float] = {".gz": 4.0, ".zst": 5.0, ".xz": 6.0, ".bz2": 5.0}
+
+
+def compression_of(file_path: str) -> Optional[str]:
+    """Estensione di compressione del file (".gz", ".zst"...), None se non è compresso"""
+    for extension in COMPRESSION_EXTENSIONS:
+        if file_path.endswith(extension):
+            return extension
+    return None
+
+
+def strip_compression(file_path: str) -> str:
+    """Il nome senza l'estensione di compressione: "dump.jsonl.zst" -> "dump.jsonl\""""
+    extension = compression_of(file_path)
+    return file_path[:-len(extension)] if extension else file_path
+
+
+def _open_zstd(file_path: str) -> BinaryIO:
+    if pa.Codec.is_available("zstd"):
+        return pa.input_stream(file_path, compression="zstd")
+    if zstandard is None:
+        raise ImportError(f"{file_path}: per leggere i file .zst serve pyarrow con il codec zstd oppure il pacchetto zstandard")
+    return zstandard.ZstdDecompressor().stream_reader(open(file_path, "rb"), closefd=True)
+
+
+def open_source(file_path: str) -> BinaryIO:
+    """Apre il file in lettura binaria, decomprimendolo in streaming se compresso"""
+    extension = compression_of(file_path)
+    if extension == ".gz":
+        return gzip.open(file_path, "rb")
+    if extension == ".zst":
+        return _open_zstd(file_path)
+    if extension == ".xz":
+        return lzma.open(file_path, "rb")
+    if extension == ".bz2":
+        return bz2.open(file_path, "rb")
+    return open(file_path, "rb")
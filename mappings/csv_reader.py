@@ -0,0 +1,125 @@
+import csv
+import pyarrow as pa
+import pyarrow.csv as pa_csv
+from typing import BinaryIO, Dict, List, Iterator, Optional, Tuple
+
+from mappings.compression import open_source, strip_compression
+from mappings.jsonl_reader import iter_line_chunks
+from mappings.mapper import PathSegment
+from mappings.dead_letters import DeadLetter, error_message, record_snippet
+
+# Byte decodificati per volta da pyarrow.csv: i tipi delle colonne si deducono dal primo blocco
+CSV_BLOCK_BYTES = 4 * 1024 * 1024
+
+
+def csv_delimiter(file_path: str) -> str:
+    return "\t" if strip_compression(file_path).endswith(".tsv") else ","
+
+
+def csv_header(file_path: str) -> List[str]:
+    """Nomi delle colonne dalla prima riga del file"""
+    first = next(iter_line_chunks(file_path, 1), [b""])[0]
+    return next(csv.reader([first.decode("utf-8-sig").rstrip("\r")], delimiter=csv_delimiter(file_path)), [])
+
+
+def csv_columns(file_path: str, paths: Optional[List[List[PathSegment]]]) -> Optional[List[str]]:
+    """
+    Colonne da decodificare per i path sorgente (la prima parte del path è il nome della colonna);
+    None se vanno lette tutte. Se il mapping non legge nessuna colonna se ne legge una sola,
+    per avere comunque il numero di righe.
+    """
+    if paths is None:
+        return None
+    header = csv_header(file_path)
+    wanted = {segments[0] for segments in paths if isinstance(segments[0], str)}
+    columns = [name for name in header if name in wanted]
+    if len(columns) == len(header):
+        return None
+    return columns or header[:1]
+
+
+def _open_reader(source: BinaryIO, file_path: str, columns: Optional[List[str]], column_types: Dict[str, pa.DataType]) -> pa_csv.CSVStreamingReader:
+    return pa_csv.open_csv(
+        source,
+        read_options=pa_csv.ReadOptions(use_threads=False, block_size=CSV_BLOCK_BYTES),
+        parse_options=pa_csv.ParseOptions(delimiter=csv_delimiter(file_path), newlines_in_values=True),
+        # Campi vuoti nulli anche nelle colonne stringa, come nei campioni letti con pandas
+        convert_options=pa_csv.ConvertOptions(include_columns=columns or [], column_types=column_types, timestamp_parsers=[],
+                                              strings_can_be_null=True),
+    )
+
+
+def _inferred_schema(file_path: str, columns: Optional[List[str]]) -> pa.Schema:
+    """Tipi dedotti da Arrow sul primo blocco, con stringa per le date e per le colonne senza valori"""
+    with open_source(file_path) as source:
+        schema = _open_reader(source, file_path, columns, {}).schema
+    return pa.schema([
+        pa.field(field.name, pa.string()) if pa.types.is_null(field.type) or pa.types.is_temporal(field.type) else field
+        for field in schema
+    ])
+
+
+def _cast_rows(batch: pa.RecordBatch, schema: pa.Schema, position: int) -> Tuple[pa.RecordBatch, List[int], List[DeadLetter]]:
+    """
+    Converte nei tipi dedotti un batch che non si converte tutto insieme, riga per riga nelle colonne
+    che falliscono: (righe convertite, loro indice nel file, righe scartate).
+    """
+    failing = []
+    for name, field in zip(batch.schema.names, schema):
+        try:
+            batch.column(name).cast(field.type)
+        except pa.ArrowInvalid:
+            failing.append((name, field.type))
+    errors: Dict[int, str] = {}
+    for name, arrow_type in failing:
+        column = batch.column(name)
+        for index in range(batch.num_rows):
+            if index in errors:
+                continue
+            try:
+                column.slice(index, 1).cast(arrow_type)
+            except pa.ArrowInvalid as e:
+                errors[index] = f"colonna {name!r}: {error_message(e)}"
+    kept = [index for index in range(batch.num_rows) if index not in errors]
+    rejected = [
+        DeadLetter(position + index, "decode", error, record_snippet(batch.slice(index, 1).to_pylist()[0]))
+        for index, error in sorted(errors.items())
+    ]
+    rows = batch.take(pa.array(kept, type=pa.int64())).cast(schema)
+    return rows, [position + index for index in kept], rejected
+
+
+def iter_csv_batches(file_path: str, batch_size: int, paths: Optional[List[List[PathSegment]]] = None,
+                     lenient: bool = False) -> Iterator[Tuple[pa.RecordBatch, List[int], List[DeadLetter]]]:
+    """
+    RecordBatch di un file CSV o TSV (anche compresso) letto in streaming, con al più batch_size righe,
+    ognuno con l'indice nel file delle sue righe e le righe scartate.
+    Si decodificano solo le colonne lette dai path sorgente, come stringhe, e si convertono nei tipi che Arrow
+    deduce dal primo blocco. Date e orari restano stringhe, come nel JSON, e le colonne tutte vuote nel primo
+    blocco diventano stringhe invece del tipo null; i campi vuoti sono null.
+    Una riga successiva con un valore non convertibile nel tipo dedotto diventa un dead letter con lenient,
+    altrimenti solleva ValueError.
+    """
+    columns = csv_columns(file_path, paths)
+    schema = _inferred_schema(file_path, columns)
+    position = 0
+    with open_source(file_path) as source:
+        # Tutto come stringa: la conversione per batch permette di isolare le righe non conformi
+        reader = _open_reader(source, file_path, columns, {field.name: pa.string() for field in schema})
+        while True:
+            try:
+                text = reader.read_next_batch()
+            except StopIteration:
+                return
+            for start in range(0, text.num_rows, batch_size):
+                chunk = text.slice(start, batch_size)
+                try:
+                    batch = chunk.cast(schema)
+                except pa.ArrowInvalid as e:
+                    if not lenient:
+                        raise ValueError(f"{file_path}: {e} (tipi dedotti dalle righe nei primi {CSV_BLOCK_BYTES} byte)") from e
+                    batch, indices, rejected = _cast_rows(chunk, schema, position)
+                    yield batch, indices, rejected
+                else:
+                    yield batch, list(range(position, position + batch.num_rows)), []
+                position += chunk.num_rows
@@ -0,0 +1,109 @@
+import os
+import json
+import pyarrow as pa
+import pyarrow.parquet as pq
+from typing import Any, List, NamedTuple, Optional
+
+from mappings.row_view import LazyView
+
+DEAD_LETTER_FORMATS = ("parquet", "jsonl")
+# Sottocartella dell'output con i dead letter: fuori dalla cartella degli shard, che contiene solo dati mappati
+DEAD_LETTER_DIRNAME = "dead_letters"
+# Caratteri del record sorgente conservati in ogni dead letter
+DEAD_LETTER_RECORD_CHARS = 1000
+
+DEAD_LETTER_SCHEMA = pa.schema([
+    ("file", pa.string()),
+    ("offset", pa.int64()),
+    ("stage", pa.string()),
+    ("error", pa.string()),
+    ("record", pa.string()),
+])
+
+
+class DeadLetter(NamedTuple):
+    """
+    Riga sorgente scartata. offset è il byte di inizio della riga nei file a righe (JSON Lines, array
+    con un record per riga), altrimenti l'indice del record nel file. stage è la fase che ha fallito:
+    "decode" (JSON non valido o valore CSV non convertibile nel tipo della colonna), "mapping" (eccezione del Mapper) o "schema" (valore non conforme a dst_schema).
+    """
+    offset: int
+    stage: str
+    error: str
+    record: Optional[str] = None
+
+
+def record_snippet(record: Any) -> str:
+    """Il record sorgente come testo (la riga grezza, o il JSON dei valori), troncato a DEAD_LETTER_RECORD_CHARS"""
+    if isinstance(record, bytes):
+        text = record[:DEAD_LETTER_RECORD_CHARS * 4].decode("utf-8", errors="replace")
+    else:
+        if isinstance(record, LazyView):
+            record = record.materialize()
+        text = json.dumps(record, ensure_ascii=False, default=str)
+    return text[:DEAD_LETTER_RECORD_CHARS]
+
+
+def error_message(error: BaseException) -> str:
+    return f"{type(error).__name__}: {error}"
+
+
+class DeadLetterWriter:
+    """
+    Dead letter di un'unità di lavoro in output_path/DEAD_LETTER_DIRNAME/{nome}.errors.parquet (o .jsonl):
+    una riga per record scartato con file sorgente, offset, fase ed errore. Il file viene creato solo al
+    primo scarto, scritto come .partial e rinominato da close() insieme agli shard dell'unità.
+    """
+
+    def __init__(self, output_path: str, name: str, file_path: str, dead_letter_format: str = "parquet"):
+        if dead_letter_format not in DEAD_LETTER_FORMATS:
+            raise ValueError(f"Formato dei dead letter non supportato: {dead_letter_format}. Valori ammessi: {DEAD_LETTER_FORMATS}")
+        stem = os.path.splitext(name)[0]
+        self.path = os.path.join(output_path, DEAD_LETTER_DIRNAME, f"{stem}.errors.{dead_letter_format}")
+        self.file_path = file_path
+        self.format = dead_letter_format
+        self.count = 0
+        self._writer: Any = None
+
+    def _open(self) -> None:
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        if self.format == "parquet":
+            self._writer = pq.ParquetWriter(self.path + ".partial", DEAD_LETTER_SCHEMA, compression="zstd")
+        else:
+            self._writer = open(self.path + ".partial", "w", encoding="utf-8")
+
+    def write(self, letters: List[DeadLetter]) -> None:
+        if not letters:
+            return
+        if self._writer is None:
+            self._open()
+        if self.format == "parquet":
+            self._writer.write_table(pa.Table.from_pydict({
+                "file": [self.file_path] * len(letters),
+                "offset": [letter.offset for letter in letters],
+                "stage": [letter.stage for letter in letters],
+                "error": [letter.error for letter in letters],
+                "record": [letter.record for letter in letters],
+            }, schema=DEAD_LETTER_SCHEMA))
+        else:
+            for letter in letters:
+                self._writer.write(json.dumps({"file": self.file_path, **letter._asdict()}, ensure_ascii=False) + "\n")
+        self.count += len(letters)
+
+    def close(self) -> Optional[str]:
+        """Rende definitivo il file; restituisce il suo path, None se non ci sono stati scarti"""
+        if self._writer is None:
+            # Nessuno scarto: un file di un'esecuzione precedente della stessa unità non vale più
+            if os.path.exists(self.path):
+                os.remove(self.path)
+            return None
+        self._writer.close()
+        self._writer = None
+        os.replace(self.path + ".partial", self.path)
+        return self.path
+
+    def abort(self) -> None:
+        if self._writer is not None:
+            self._writer.close()
+            self._writer = None
+            os.remove(self.path + ".partial")
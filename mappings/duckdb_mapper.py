@@ -0,0 +1,463 @@
+import os
+import math
+import duckdb
+import pyarrow as pa
+from typing import Dict, List, Any, Optional, NamedTuple, Set, Tuple
+
+from mappings import transforms
+from mappings.arrow_schema import output_schema
+from mappings.parquet_writer import ParquetOptions
+from mappings.json_array_reader import is_json_array
+from mappings.mapper import Mapper, MappingEntry, PathSegment, _CompiledEntry
+from mappings.arrow_mapper import (
+    _Unsupported, _Leaf, _DictNode, _ListNode, _DynListNode, _Node, build_output_shape,
+    _is_list_like, _is_object_schema, _target_type, _merge_types, _schema_fill_value, _fill_compatible, _check_untouched,
+)
+
+# Tipi DuckDB che la lettura JSON inferisce ma che json.loads non produrrebbe mai
+_JSON_INFERRED_TYPES = ("JSON", "DATE", "TIME", "UUID", "DECIMAL", "HUGEINT", "BLOB")
+
+_ELEMENT_VAR = "__elem"
+
+
+class _Expr(NamedTuple):
+    """Espressione SQL con il tipo Arrow del risultato"""
+    sql: str
+    type: pa.DataType
+
+
+_NULL = _Expr("NULL", pa.null())
+
+
+def _ident(name: str) -> str:
+    return '"' + name.replace('"', '""') + '"'
+
+
+def _quote(value: str) -> str:
+    return "'" + value.replace("'", "''") + "'"
+
+
+def _is_string(t: pa.DataType) -> bool:
+    return pa.types.is_string(t) or pa.types.is_large_string(t) or pa.types.is_string_view(t)
+
+
+def _duckdb_type(con: duckdb.DuckDBPyConnection, t: pa.DataType) -> Any:
+    """Tipo DuckDB corrispondente a un tipo Arrow, come lo vede DuckDB importando una colonna vuota"""
+    return con.from_arrow(pa.table({"value": pa.array([], type=t)})).types[0]
+
+
+def _copy_options(options: Optional[ParquetOptions], metadata: Optional[Dict[bytes, bytes]] = None) -> str:
+    """Opzioni del COPY ... TO ... parquet corrispondenti a ParquetOptions, più i metadati key-value del footer"""
+    clauses = ["FORMAT PARQUET"]
+    if options is not None:
+        # Per DuckDB l'assenza di compressione si chiama "uncompressed"
+        compression = "uncompressed" if options.compression == "none" else options.compression
+        clauses += [f"COMPRESSION {_quote(compression)}", f"ROW_GROUP_SIZE {int(options.row_group_rows)}"]
+        if options.compression_level is not None:
+            clauses.append(f"COMPRESSION_LEVEL {int(options.compression_level)}")
+    if metadata:
+        pairs = ", ".join(f"{_quote(key.decode('utf-8'))}: {_quote(value.decode('utf-8'))}" for key, value in metadata.items())
+        clauses.append(f"KV_METADATA {{{pairs}}}")
+    return ", ".join(clauses)
+
+
+def _arrow_udf(batch: Any, param_type: pa.DataType, return_type: pa.DataType) -> Any:
+    """Adatta un'implementazione batch alla firma delle UDF Arrow di DuckDB (tipi esattamente quelli dichiarati)"""
+    def udf(arr: Any) -> pa.Array:
+        if isinstance(arr, pa.ChunkedArray):
+            arr = arr.combine_chunks()
+        if arr.type != param_type:
+            arr = arr.cast(param_type)
+        result = transforms.apply_batch(batch, arr)
+        return result if result.type == return_type else result.cast(return_type)
+    return udf
+
+
+def _sql_type(t: pa.DataType) -> str:
+    if _is_string(t):
+        return "VARCHAR"
+    if pa.types.is_boolean(t):
+        return "BOOLEAN"
+    if pa.types.is_integer(t):
+        names = {8: "TINYINT", 16: "SMALLINT", 32: "INTEGER", 64: "BIGINT"}
+        return ("U" if pa.types.is_unsigned_integer(t) else "") + names[t.bit_width]
+    if pa.types.is_float32(t):
+        return "FLOAT"
+    if pa.types.is_floating(t):
+        return "DOUBLE"
+    if pa.types.is_struct(t) and t.num_fields:
+        return "STRUCT(" + ", ".join(f"{_ident(f.name)} {_sql_type(f.type)}" for f in t) + ")"
+    if _is_list_like(t):
+        return _sql_type(t.value_type) + "[]"
+    raise _Unsupported(f"tipo {t} senza equivalente DuckDB")
+
+
+def _literal(value: Any, hint: Optional[pa.DataType] = None) -> _Expr:
+    """Costante SQL; hint è il tipo della colonna con cui la costante deve combaciare"""
+    if value is None:
+        if hint is None or pa.types.is_null(hint):
+            return _NULL
+        try:
+            return _Expr(f"CAST(NULL AS {_sql_type(hint)})", hint)
+        except _Unsupported:
+            return _NULL
+    if isinstance(value, bool):
+        return _Expr("TRUE" if value else "FALSE", pa.bool_())
+    if isinstance(value, int) and not (hint is not None and pa.types.is_floating(hint)):
+        return _Expr(f"CAST({value} AS BIGINT)", pa.int64())
+    if isinstance(value, (int, float)):
+        text = repr(float(value)) if math.isfinite(value) else _quote(str(float(value)))
+        return _Expr(f"CAST({text} AS DOUBLE)", pa.float64())
+    if isinstance(value, str):
+        return _Expr(_quote(value), pa.string())
+    if isinstance(value, dict):
+        hint_fields = {f.name: f.type for f in hint} if hint is not None and pa.types.is_struct(hint) else {}
+        keys = list(hint_fields) + [k for k in value if k not in hint_fields]
+        if not keys:
+            raise _Unsupported("struct vuota non rappresentabile in DuckDB")
+        fields = [(k, _literal(value.get(k), hint_fields.get(k))) for k in keys]
+        return _Expr(
+            "struct_pack(" + ", ".join(f"{_ident(k)} := {e.sql}" for k, e in fields) + ")",
+            pa.struct([(k, e.type) for k, e in fields]),
+        )
+    if isinstance(value, list):
+        value_hint = hint.value_type if hint is not None and _is_list_like(hint) else None
+        items = [_literal(v, value_hint) for v in value]
+        if not items:
+            try:
+                return _Expr(f"CAST([] AS {_sql_type(hint)})", hint) if hint is not None else _Expr("[]", pa.list_(pa.null()))
+            except _Unsupported:
+                return _Expr("[]", pa.list_(pa.null()))
+        item_type = items[0].type
+        for item in items[1:]:
+            item_type = _merge_types(item_type, item.type)
+        return _Expr("list_value(" + ", ".join(e.sql for e in items) + ")", pa.list_(item_type))
+    raise _Unsupported(f"costante non rappresentabile in SQL: {value!r}")
+
+
+class DuckDBMapper:
+    """
+    Traduce un mapping in una proiezione SELECT DuckDB (struct_pack, list_value, list_transform, CAST),
+    così che la conversione di un intero dataset sia un solo COPY (SELECT ...) TO ... (FORMAT PARQUET)
+    eseguito dal motore multithread di DuckDB.
+
+    Copre gli stessi casi di ArrowMapper; per i mapping (o gli schemi sorgente) non esprimibili
+    in SQL copy_files restituisce None e i file vanno mappati con il Mapper riga per riga.
+    """
+
+    def __init__(self, mapping: List[MappingEntry], dst_schema: Dict[str, Any], mapper: Optional[Mapper] = None):
+        self.mapper = mapper or Mapper()
+        self.dst_schema = dst_schema
+        self.plan = self.mapper.compile(mapping, dst_schema)
+        # Schema fisso dell'output (None: tipi decisi da DuckDB), lo stesso usato dai worker del Mapper
+        self.output_schema = output_schema(dst_schema, mapping)
+        # UDF Arrow richieste dall'ultima select_sql: nome -> (batch, tipo parametro, tipo di ritorno)
+        self._udfs: Dict[str, Tuple[Any, pa.DataType, pa.DataType]] = {}
+        try:
+            self.root: Optional[_DictNode] = build_output_shape(self.plan)
+        except _Unsupported as e:
+            print(f"Mapping non traducibile in SQL: {e}")
+            self.root = None
+
+    # ------------------------------------------------------------------
+    # Espressioni
+    # ------------------------------------------------------------------
+    def _resolve(self, expr: _Expr, segments: List[PathSegment]) -> _Expr:
+        """Equivalente SQL di _get_by_segments (gli indici DuckDB partono da 1)"""
+        for seg in segments:
+            t = expr.type.value_type if pa.types.is_dictionary(expr.type) else expr.type
+            if pa.types.is_map(t):
+                raise _Unsupported("colonne di tipo map")
+            if pa.types.is_null(t):
+                return _NULL
+            if isinstance(seg, int):
+                if not _is_list_like(t):
+                    return _NULL
+                expr = _Expr(f"({expr.sql})[{seg + 1}]", t.value_type)
+            elif seg == '[]':
+                return _NULL
+            else:
+                if not pa.types.is_struct(t) or t.get_field_index(seg) < 0:
+                    return _NULL
+                # Il contesto radice (sql vuoto) è la riga stessa: i campi sono colonne
+                column = _ident(seg) if not expr.sql else f"struct_extract({expr.sql}, {_quote(seg)})"
+                expr = _Expr(column, t.field(seg).type)
+        if pa.types.is_dictionary(expr.type):
+            expr = _Expr(expr.sql, expr.type.value_type)
+        if pa.types.is_map(expr.type):
+            raise _Unsupported("colonne di tipo map")
+        return expr
+
+    def _cast(self, expr: _Expr, target_type: Optional[str]) -> _Expr:
+        """Equivalente SQL di Mapper._compile_caster, limitato ai casi indipendenti dal valore"""
+        t = expr.type
+        if target_type is None or pa.types.is_null(t):
+            return expr
+        nested = pa.types.is_struct(t) or _is_list_like(t)
+        is_str = _is_string(t)
+        if target_type == "string":
+            if is_str or nested:
+                return expr
+            if pa.types.is_integer(t):
+                return _Expr(f"CAST({expr.sql} AS VARCHAR)", pa.string())
+            if pa.types.is_boolean(t):
+                return _Expr(f"CASE WHEN {expr.sql} THEN 'True' WHEN NOT {expr.sql} THEN 'False' END", pa.string())
+        elif target_type == "integer":
+            if not is_str and not pa.types.is_floating(t):
+                return expr
+        elif target_type == "number":
+            if not is_str:
+                return expr
+        elif target_type == "boolean":
+            if pa.types.is_boolean(t):
+                return expr
+            if is_str:
+                return _Expr(f"(lower({expr.sql}) IN ('true', '1', 'yes', 'on'))", pa.bool_())
+            if pa.types.is_integer(t) or pa.types.is_floating(t):
+                return _Expr(f"({expr.sql} <> 0)", pa.bool_())
+        else:
+            return expr
+        raise _Unsupported(f"cast di {t} verso '{target_type}' dipendente dal valore")
+
+    def _lookup(self, expr: _Expr, entry: _CompiledEntry) -> _Expr:
+        """Enum mapping (transformation dict) come CASE ... WHEN"""
+        table = entry.transformation
+        if not all(isinstance(k, str) for k in table):
+            raise _Unsupported("chiavi non stringa in una transformation enum")
+        if pa.types.is_null(expr.type) or not table:
+            return _NULL
+        if not _is_string(expr.type):
+            raise _Unsupported(f"transformation enum su colonna {expr.type}")
+        values = [table[k] for k in table]
+        if entry.caster:
+            values = [entry.caster(v) if v is not None else None for v in values]
+        try:
+            value_type = pa.array(values).type
+        except (pa.ArrowInvalid, pa.ArrowTypeError) as e:
+            raise _Unsupported("valori eterogenei in una transformation enum") from e
+        whens = " ".join(f"WHEN {_quote(k)} THEN {_literal(v, value_type).sql}" for k, v in zip(table, values))
+        return _Expr(f"CASE {expr.sql} {whens} ELSE NULL END", value_type)
+
+    def _evaluate(self, leaf: _Leaf, ctx: _Expr) -> _Expr:
+        entry = leaf.entry
+        if isinstance(entry.transformation, dict):
+            src = self._resolve(ctx, leaf.src_segments) if leaf.src_segments is not None else _NULL
+            return self._lookup(src, entry)
+        if leaf.src_segments is None:
+            return _literal(entry.caster(entry.transformation) if entry.caster else entry.transformation)
+        src = self._resolve(ctx, leaf.src_segments)
+        if entry.transform is not None:
+            src = self._transform(src, entry)
+        return self._cast(src, _target_type(entry.target_schema))
+
+    def _transform(self, expr: _Expr, entry: _CompiledEntry) -> _Expr:
+        """
+        Trasformazione registrata nel Mapper come UDF Arrow di DuckDB: la stessa implementazione
+        batch usata da ArrowMapper riceve interi vettori della colonna.
+        """
+        if entry.batch_transform is None:
+            raise _Unsupported(f"trasformazione '{entry.transformation}' senza implementazione batch")
+        if pa.types.is_null(expr.type):
+            return expr
+        try:
+            # Il tipo di ritorno della UDF va dichiarato: lo ricavo da un batch vuoto
+            return_type = transforms.apply_batch(entry.batch_transform, pa.array([], type=expr.type)).type
+        except (ValueError, TypeError, pa.ArrowException) as e:
+            raise _Unsupported(f"trasformazione '{entry.transformation}' non applicabile a {expr.type}: {e}") from e
+        if pa.types.is_null(return_type):
+            return _NULL
+        name = f"__transform_{len(self._udfs)}"
+        self._udfs[name] = (entry.batch_transform, expr.type, return_type)
+        return _Expr(f"{name}({expr.sql})", return_type)
+
+    def _register_udfs(self, con: duckdb.DuckDBPyConnection) -> None:
+        for name, (batch, param_type, return_type) in self._udfs.items():
+            con.create_function(name, _arrow_udf(batch, param_type, return_type),
+                                [_duckdb_type(con, param_type)], _duckdb_type(con, return_type),
+                                type="arrow", null_handling="special")
+
+    @staticmethod
+    def _fill_nulls(expr: _Expr, value: Any) -> _Expr:
+        if value is None:
+            return expr
+        if pa.types.is_null(expr.type):
+            return _literal(value)
+        if not _fill_compatible(value, expr.type):
+            raise _Unsupported(f"default {value!r} incompatibile con colonna {expr.type}")
+        fill = _literal(value, expr.type)
+        return _Expr(f"COALESCE({expr.sql}, {fill.sql})", _merge_types(expr.type, fill.type))
+
+    # ------------------------------------------------------------------
+    # Struttura dell'output (stessa logica di ArrowMapper._build*)
+    # ------------------------------------------------------------------
+    def _build(self, node: _Node, ctx: _Expr, schema: Any, targets: set, active: bool) -> _Expr:
+        if isinstance(node, _DictNode):
+            return self._build_dict(node, ctx, schema, targets, active)
+        if isinstance(node, _ListNode):
+            return self._build_static_list(node, ctx, schema, active)
+        if isinstance(node, _DynListNode):
+            built = self._build_dyn_list(node, ctx, schema, active)
+            if built is None:
+                return _NULL
+            lists, present = built
+            return _Expr(f"CASE WHEN {present} THEN {lists.sql} END", lists.type)
+        expr = self._evaluate(node, ctx)
+        if active:
+            _check_untouched(expr.type, schema)
+        return expr
+
+    def _build_present(self, node: _Node, ctx: _Expr, pschema: Dict[str, Any], targets: set) -> _Expr:
+        fill = _schema_fill_value(self.mapper, pschema)
+        if isinstance(node, _DynListNode):
+            built = self._build_dyn_list(node, ctx, pschema, True)
+            if built is None:
+                return _literal(fill)
+            lists, present = built
+            fill_expr = _literal(fill, lists.type)
+            merged = _merge_types(lists.type, fill_expr.type)
+            return _Expr(f"CASE WHEN {present} THEN {lists.sql} ELSE {fill_expr.sql} END", merged)
+        expr = self._build(node, ctx, pschema, targets, True)
+        return self._fill_nulls(expr, fill) if isinstance(node, _Leaf) else expr
+
+    def _build_fields(self, node: _DictNode, ctx: _Expr, schema: Any, targets: set, active: bool) -> List[Tuple[str, _Expr]]:
+        populate = active and _is_object_schema(schema)
+        props = schema.get("properties", {}) if populate else {}
+        fields: List[Tuple[str, _Expr]] = []
+        for key, child in node.children.items():
+            if key in props:
+                sub_targets = {t[len(key) + 1:] for t in targets if t.startswith(key + ".")}
+                fields.append((key, self._build_present(child, ctx, props[key], sub_targets)))
+            else:
+                fields.append((key, self._build(child, ctx, None, set(), False)))
+        if populate:
+            required = schema.get("required", [])
+            for pname, pschema in props.items():
+                if pname in node.children:
+                    continue
+                should_create = (pname in required) or any(t.startswith(pname + ".") or t == pname or t.startswith(pname + "[") for t in targets) or ("default" in pschema) or ("enum" in pschema)
+                if should_create:
+                    fields.append((pname, _literal(_schema_fill_value(self.mapper, pschema))))
+        return fields
+
+    def _build_dict(self, node: _DictNode, ctx: _Expr, schema: Any, targets: set, active: bool) -> _Expr:
+        fields = self._build_fields(node, ctx, schema, targets, active)
+        if not fields:
+            raise _Unsupported("struct vuota non rappresentabile in DuckDB")
+        return _Expr(
+            "struct_pack(" + ", ".join(f"{_ident(k)} := {e.sql}" for k, e in fields) + ")",
+            pa.struct([(k, e.type) for k, e in fields]),
+        )
+
+    def _build_static_list(self, node: _ListNode, ctx: _Expr, schema: Any, active: bool) -> _Expr:
+        items_schema = schema.get("items", {}) if active and isinstance(schema, dict) else None
+        elements: List[_Expr] = []
+        for item in node.items:
+            if item is None:
+                elements.append(_NULL)
+            elif isinstance(item, _DictNode):
+                elements.append(self._build_dict(item, ctx, items_schema, set(), active))
+            elif isinstance(item, _Leaf):
+                expr = self._evaluate(item, ctx)
+                if active:
+                    _check_untouched(expr.type, {"properties": (items_schema or {}).get("properties")})
+                elements.append(expr)
+            else:
+                elements.append(self._build(item, ctx, None, set(), False))
+        item_type = elements[0].type
+        for element in elements[1:]:
+            item_type = _merge_types(item_type, element.type)
+        return _Expr("list_value(" + ", ".join(e.sql for e in elements) + ")", pa.list_(item_type))
+
+    def _build_dyn_list(self, node: _DynListNode, ctx: _Expr, schema: Any, active: bool) -> Optional[Tuple[_Expr, str]]:
+        src = self._resolve(ctx, node.src_base)
+        if not _is_list_like(src.type):
+            return None
+        element_ctx = _Expr(_ELEMENT_VAR, src.type.value_type)
+        items_schema = schema.get("items", {}) if active and isinstance(schema, dict) else None
+        element = node.element
+        if isinstance(element, _DictNode):
+            element_expr = self._build_dict(element, element_ctx, items_schema, set(), active)
+        else:
+            element_expr = self._evaluate(element, element_ctx)
+            if active:
+                _check_untouched(element_expr.type, {"properties": (items_schema or {}).get("properties")})
+        lists = _Expr(f"list_transform({src.sql}, lambda {_ELEMENT_VAR}: {element_expr.sql})", pa.list_(element_expr.type))
+        return lists, f"len({src.sql}) > 0"
+
+    # ------------------------------------------------------------------
+    # API
+    # ------------------------------------------------------------------
+    def select_sql(self, src_schema: pa.Schema, relation: str) -> str:
+        """SELECT che applica il mapping alle righe di relation; solleva _Unsupported se non esprimibile"""
+        if self.root is None:
+            raise _Unsupported("mapping non traducibile in SQL")
+        ctx = _Expr("", pa.struct(list(src_schema)))
+        self._udfs = {}
+        fields = []
+        for key, expr in self._build_fields(self.root, ctx, self.dst_schema, self.plan.mapping_targets, True):
+            fields.append(f"{expr.sql} AS {_ident(key)}")
+        if not fields:
+            raise _Unsupported("nessuna colonna in output")
+        return f"SELECT {', '.join(fields)} FROM {relation}"
+
+    def copy_files(self, files: List[str], output_file: str, con: Optional[duckdb.DuckDBPyConnection] = None,
+                   options: Optional[ParquetOptions] = None, metadata: Optional[Dict[bytes, bytes]] = None) -> Optional[int]:
+        """
+        Mappa tutti i file (parquet, JSON Lines oppure array JSON, non misti) in un solo COPY verso output_file.
+        Restituisce il numero di righe scritte, oppure None se il mapping va eseguito con il Mapper.
+        Di options si applicano codec, livello e righe per row group; metadata finisce nel footer.
+        Come gli shard del Mapper, il file si scrive come .partial e prende il nome definitivo solo se il COPY riesce.
+        """
+        file_list = "[" + ", ".join(_quote(f) for f in files) + "]"
+        is_parquet = all(f.endswith('.parquet') for f in files)
+        if is_parquet:
+            relation = f"read_parquet({file_list}, union_by_name = true)"
+        else:
+            json_format = "array" if all(f.endswith('.json') and is_json_array(f) for f in files) else "newline_delimited"
+            relation = f"read_json({file_list}, format = '{json_format}', union_by_name = true)"
+        own_connection = con is None
+        con = con or duckdb.connect()
+        try:
+            described = con.execute(f"SELECT * FROM {relation} LIMIT 0")
+            src_schema = described.arrow().schema
+            if not is_parquet:
+                referenced = self._referenced_columns()
+                for name, type_name, *_ in described.description:
+                    if name in referenced and any(t in str(type_name).upper() for t in _JSON_INFERRED_TYPES):
+                        raise _Unsupported(f"tipo inferito da DuckDB per '{name}' ({type_name}) diverso da json.loads")
+            select = self.select_sql(src_schema, relation)
+        except _Unsupported as e:
+            print(f"Mapping non traducibile in SQL per {len(files)} file, uso il Mapper riga per riga: {e}")
+            if own_connection:
+                con.close()
+            return None
+        try:
+            self._register_udfs(con)
+            if self.output_schema is not None:
+                select = self._conform_sql(con, select)
+            partial_file = output_file + ".partial"
+            try:
+                written = con.execute(f"COPY ({select}) TO {_quote(partial_file)} ({_copy_options(options, metadata)})").fetchone()
+            except BaseException:
+                if os.path.exists(partial_file):
+                    os.remove(partial_file)
+                raise
+            os.replace(partial_file, output_file)
+            return int(written[0]) if written else 0
+        finally:
+            if own_connection:
+                con.close()
+
+    def _conform_sql(self, con: duckdb.DuckDBPyConnection, select: str) -> str:
+        """Proietta select sulle colonne e sui tipi di output_schema (struct convertite per nome)"""
+        produced = {row[0] for row in con.execute(f"DESCRIBE {select}").fetchall()}
+        columns = []
+        for field in self.output_schema:
+            value = _ident(field.name) if field.name in produced else "NULL"
+            columns.append(f"CAST({value} AS {_duckdb_type(con, field.type)}) AS {_ident(field.name)}")
+        return f"SELECT {', '.join(columns)} FROM ({select})"
+
+    def _referenced_columns(self) -> Set[str]:
+        """Colonne top-level lette dal mapping (i livelli '[]' leggono tutto sotto il proprio array)"""
+        paths = [e.src_segments for e in self.plan.static_entries] + [level.src_path for level in self.plan.array_levels]
+        return {p[0] for p in paths if p and isinstance(p[0], str)}
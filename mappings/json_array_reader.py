@@ -0,0 +1,229 @@
+import re
+import codecs
+from typing import List, Any, Iterator, Optional, Tuple
+
+from mappings.compression import open_source
+from mappings.dead_letters import DeadLetter, error_message, record_snippet
+from mappings.jsonl_reader import JSONL_BLOCK_BYTES, iter_line_offsets, parse_lines, _raw_decode
+
+# Byte letti dall'inizio di un array JSON per capire se ha un record per riga
+ARRAY_SAMPLE_BYTES = 1024 * 1024
+
+_WHITESPACE = re.compile(r"[ \t\n\r]*")
+_BOM = b"\xef\xbb\xbf"
+
+
+def is_json_array(file_path: str) -> bool:
+    """True se il primo carattere significativo del file (dopo BOM e spazi) è '[': array JSON e non JSON Lines"""
+    with open_source(file_path) as f:
+        head = f.read(4096)
+        if head.startswith(_BOM):
+            head = head[len(_BOM):]
+        while head:
+            stripped = head.lstrip()
+            if stripped:
+                return stripped.startswith(b"[")
+            head = f.read(4096)
+    return False
+
+
+def _element_end(text: str, pos: int) -> Optional[int]:
+    """
+    Posizione della ',' o della ']' che chiude l'elemento che inizia in pos, saltando stringhe e parentesi
+    annidate; None se non è nel testo (elemento troncato dal blocco o con parentesi non bilanciate)
+    """
+    depth, in_string, escaped = 0, False, False
+    for index in range(pos, len(text)):
+        char = text[index]
+        if in_string:
+            if escaped:
+                escaped = False
+            elif char == "\\":
+                escaped = True
+            elif char == '"':
+                in_string = False
+        elif char == '"':
+            in_string = True
+        elif char in "[{":
+            depth += 1
+        elif char in "]}":
+            if depth == 0:
+                return index if char == "]" else None
+            depth -= 1
+        elif char == "," and depth == 0:
+            return index
+    return None
+
+
+def iter_array_records(file_path: str, block_bytes: int = JSONL_BLOCK_BYTES, lenient: bool = False) -> Iterator[Any]:
+    """
+    Elementi di un file che contiene un unico array JSON, decodificati uno alla volta.
+    In memoria resta solo il blocco corrente (più il record a cavallo tra due blocchi), qualunque sia
+    la formattazione del file. Un array non chiuso o con contenuto dopo ']' solleva ValueError.
+    Un elemento non valido solleva ValueError, oppure con lenient diventa un DeadLetter (offset: indice
+    dell'elemento) e la lettura riprende dall'elemento successivo. Se le parentesi dell'elemento non sono
+    bilanciate non si trova dove finisce e il file fallisce anche con lenient.
+    """
+    decoder = codecs.getincrementaldecoder("utf-8-sig")()
+    text, pos, eof = "", 0, False
+    index = 0
+    # "start": si attende '['; "first"/"value": un elemento (o ']' per l'array vuoto); "sep": ',' o ']'
+    state = "start"
+    read_size = block_bytes
+    with open_source(file_path) as f:
+        while True:
+            pos = _WHITESPACE.match(text, pos).end()
+            need_more = pos == len(text)
+            if not need_more:
+                char = text[pos]
+                if state == "start":
+                    if char != "[":
+                        raise ValueError(f"{file_path}: il file non contiene un array JSON")
+                    pos, state = pos + 1, "first"
+                elif state == "first" and char == "]":
+                    pos, state = pos + 1, "done"
+                elif state in ("first", "value"):
+                    error = None
+                    try:
+                        value, end = _raw_decode(text, pos)
+                        # Un numero troncato a fine blocco ("2." di "2.5") si decodifica lo stesso:
+                        # l'elemento vale solo se nel blocco c'è già la ',' o la ']' che lo segue
+                        following = _WHITESPACE.match(text, end).end()
+                        need_more = not eof and following == len(text)
+                        if following < len(text) and text[following] not in ",]":
+                            error = ValueError(f"{file_path}: atteso ',' o ']' dopo un elemento dell'array (carattere {text[following]!r})")
+                    except ValueError as e:
+                        error, need_more = e, False
+                    if error is not None:
+                        # L'errore è dell'elemento solo se il blocco lo contiene tutto, fino alla ',' o ']' che lo chiude
+                        boundary = _element_end(text, pos)
+                        if boundary is None:
+                            if eof:
+                                raise error
+                            need_more = True
+                        elif not lenient:
+                            raise error
+                    # Un record più grande del blocco si rilegge raddoppiando la lettura: costo lineare
+                    if need_more:
+                        read_size *= 2
+                    elif error is not None:
+                        yield DeadLetter(index, "decode", error_message(error), record_snippet(text[pos:boundary].rstrip().encode("utf-8")))
+                        index += 1
+                        pos, state = boundary, "sep"
+                        read_size = block_bytes
+                    else:
+                        yield value
+                        index += 1
+                        pos, state = end, "sep"
+                        read_size = block_bytes
+                elif state == "sep":
+                    if char not in ",]":
+                        raise ValueError(f"{file_path}: atteso ',' o ']' dopo un elemento dell'array (carattere {char!r})")
+                    pos, state = pos + 1, "value" if char == "," else "done"
+                else:
+                    raise ValueError(f"{file_path}: contenuto dopo la chiusura dell'array JSON")
+            if need_more:
+                if eof:
+                    if state != "done":
+                        raise ValueError(f"{file_path}: array JSON non terminato")
+                    return
+                block = f.read(read_size)
+                eof = not block
+                text = text[pos:] + decoder.decode(block, final=eof)
+                pos = 0
+
+
+def _strip_closing(line: bytes) -> bytes:
+    """Toglie la ']' che chiude l'array da una riga che termina con ']' (l'elemento può essere a sua volta una lista)"""
+    text = line.decode("utf-8")
+    try:
+        _, end = _raw_decode(text)
+    except ValueError:
+        return line[:-1].rstrip()
+    if text[end:].strip() in ("", "]"):
+        return text[:end].encode("utf-8")
+    # Più elementi sulla stessa riga: la riga resta così e la decodifica segnala l'errore
+    return line
+
+
+def _record_line(line: bytes, first: bool) -> bytes:
+    """Il record contenuto in una riga di un array con un record per riga, senza '[' iniziale e ',' o ']' finali"""
+    line = line.strip()
+    if first:
+        if line.startswith(_BOM):
+            line = line[len(_BOM):].lstrip()
+        if line.startswith(b"["):
+            line = line[1:].lstrip()
+    if line.startswith(b","):
+        line = line[1:].lstrip()
+    if line.endswith(b","):
+        line = line[:-1].rstrip()
+    elif line.endswith(b"]"):
+        line = _strip_closing(line)
+    return line
+
+
+_CLOSING = {ord("{"): ord("}"), ord("["): ord("]"), ord('"'): ord('"')}
+_SCALAR_START = frozenset(b"-0123456789tfn")
+
+
+def _is_whole_record(record: bytes) -> bool:
+    """
+    True se la riga ha la forma di un record intero: un oggetto, una lista o una stringa chiusi sulla
+    stessa riga, o uno scalare. Le righe di un elemento su più righe ('{', '"k": 1', '}') non lo sono.
+    """
+    closing = _CLOSING.get(record[0])
+    if closing is None:
+        return record[0] in _SCALAR_START
+    return len(record) > 1 and record[-1] == closing
+
+
+def iter_array_line_chunks(file_path: str, batch_size: int, byte_range: Optional[Tuple[int, int]] = None) -> Iterator[Tuple[List[bytes], List[int]]]:
+    """
+    Come iter_line_offsets, per un array JSON con un record per riga: ogni riga restituita è un record,
+    quindi l'array si divide per intervalli di byte come un JSON Lines.
+    has_record_per_line controlla solo l'inizio del file: un elemento su più righe dopo il campione solleva
+    ValueError (anche con i dead letter), invece di spezzarsi in frammenti scartati uno per uno.
+    """
+    first = byte_range is None or byte_range[0] == 0
+    for lines, offsets in iter_line_offsets(file_path, batch_size, byte_range):
+        records, kept = [], []
+        for line, offset in zip(lines, offsets):
+            record = _record_line(line, first)
+            first = False
+            if record:
+                if not _is_whole_record(record):
+                    raise ValueError(f"{file_path}: la riga all'offset {offset} non contiene un record intero: "
+                                     f"l'array non ha un record per riga oltre i primi {ARRAY_SAMPLE_BYTES} byte")
+                records.append(record)
+                kept.append(offset)
+        if records:
+            yield records, kept
+
+
+def has_record_per_line(file_path: str, sample_bytes: int = ARRAY_SAMPLE_BYTES) -> bool:
+    """
+    True se nelle righe iniziali dell'array ogni riga contiene esattamente un record (come nei dump
+    scritti elemento per elemento): solo allora il file si può dividere per intervalli di byte.
+    """
+    with open_source(file_path) as f:
+        sample = f.read(sample_bytes)
+    lines = sample.split(b"\n")
+    if len(sample) == sample_bytes:
+        # L'ultima riga del campione può essere troncata
+        lines.pop()
+    records = 0
+    first = True
+    for line in lines:
+        if not line.strip():
+            continue
+        record = _record_line(line, first)
+        first = False
+        if not record:
+            continue
+        try:
+            parse_lines([record])
+        except ValueError:
+            return False
+        records += 1
+    return records > 0
@@ -0,0 +1,134 @@
+import io
+import re
+import json
+import pyarrow as pa
+import pyarrow.json as pa_json
+from typing import List, Any, Iterator, Optional, Tuple
+
+from mappings.compression import open_source
+from mappings.dead_letters import DeadLetter, error_message, record_snippet
+
+# orjson, se installato, decodifica direttamente i byte ed è il parser più veloce;
+# altrimenti si usa il decoder della libreria standard senza l'overhead di json.loads
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# Byte letti per volta dal file (già decompressi per i file compressi): le righe vengono separate sui byte
+JSONL_BLOCK_BYTES = 4 * 1024 * 1024
+
+_raw_decode = json.JSONDecoder().raw_decode
+# orjson e pyarrow.json leggono come float gli interi oltre i 64 bit: le righe con interi così lunghi
+# passano dal decoder standard, che li mantiene esatti come json.loads (le cifre decimali non contano)
+_LONG_DIGITS = re.compile(rb"(?<![\d.])\d{19,}(?![\d.eE])")
+
+
+def iter_line_offsets(file_path: str, batch_size: int, byte_range: Optional[Tuple[int, int]] = None,
+                      block_bytes: int = JSONL_BLOCK_BYTES) -> Iterator[Tuple[List[bytes], List[int]]]:
+    """
+    Righe non vuote di un file JSON Lines (anche compresso) in blocchi da batch_size, come byte senza "\\n",
+    con l'offset del primo byte di ogni riga (nel file decompresso).
+    Con byte_range=(start, end) legge solo le righe il cui primo byte cade in [start, end), così
+    intervalli contigui coprono ogni riga esattamente una volta.
+    """
+    start, end = byte_range if byte_range is not None else (0, None)
+    with open_source(file_path) as f:
+        # Offset della prossima riga da leggere, cioè dell'inizio di pending
+        position = start
+        if start > 0:
+            # La riga a cavallo di start appartiene all'intervallo precedente
+            f.seek(start - 1)
+            position = start - 1 + len(f.readline())
+        lines: List[bytes] = []
+        offsets: List[int] = []
+        pending = b""
+        while end is None or position < end:
+            block = f.read(block_bytes)
+            if not block:
+                break
+            parts = (pending + block).split(b"\n")
+            pending = parts.pop()
+            for line in parts:
+                if end is not None and position >= end:
+                    break
+                if line.strip():
+                    lines.append(line)
+                    offsets.append(position)
+                    if len(lines) == batch_size:
+                        yield lines, offsets
+                        lines, offsets = [], []
+                position += len(line) + 1
+        if pending.strip() and (end is None or position < end):
+            lines.append(pending)
+            offsets.append(position)
+        if lines:
+            yield lines, offsets
+
+
+def iter_line_chunks(file_path: str, batch_size: int, byte_range: Optional[Tuple[int, int]] = None,
+                     block_bytes: int = JSONL_BLOCK_BYTES) -> Iterator[List[bytes]]:
+    """Come iter_line_offsets, senza gli offset"""
+    for lines, _ in iter_line_offsets(file_path, batch_size, byte_range, block_bytes):
+        yield lines
+
+
+def parse_line(line: bytes) -> Any:
+    """Decodifica una riga JSON; gli errori sono quelli di json.loads"""
+    if orjson is not None and not _LONG_DIGITS.search(line):
+        try:
+            return orjson.loads(line)
+        except orjson.JSONDecodeError:
+            return json.loads(line)
+    try:
+        text = line.decode("utf-8")
+        value, end = _raw_decode(text)
+        if end == len(text) or text[end:].isspace():
+            return value
+    except ValueError:
+        pass
+    # Spazi iniziali, BOM o riga non valida: json.loads gestisce i primi e dà il messaggio d'errore
+    return json.loads(line)
+
+
+def parse_lines(lines: List[bytes]) -> List[Any]:
+    return [parse_line(line) for line in lines]
+
+
+def parse_lines_lenient(lines: List[bytes], offsets: List[int]) -> Tuple[List[Any], List[int], List[DeadLetter]]:
+    """Come parse_lines, ma una riga non valida diventa un dead letter invece di sollevare: (valori, loro offset, scarti)"""
+    values: List[Any] = []
+    kept: List[int] = []
+    rejected: List[DeadLetter] = []
+    for line, offset in zip(lines, offsets):
+        try:
+            values.append(parse_line(line))
+            kept.append(offset)
+        except ValueError as e:
+            rejected.append(DeadLetter(offset, "decode", error_message(e), record_snippet(line)))
+    return values, kept, rejected
+
+
+def _has_temporal(arrow_type: pa.DataType) -> bool:
+    if pa.types.is_temporal(arrow_type):
+        return True
+    return any(_has_temporal(arrow_type.field(i).type) for i in range(arrow_type.num_fields))
+
+
+def lines_to_arrow(lines: List[bytes]) -> Optional[pa.RecordBatch]:
+    """
+    RecordBatch decodificato da pyarrow.json, oppure None se i tipi inferiti da Arrow non
+    corrispondono ai valori JSON: righe non oggetto o con tipi in conflitto, stringhe ISO lette come
+    timestamp, interi oltre i 64 bit, nessuna colonna. Interi e decimali nella stessa colonna diventano double.
+    """
+    data = b"\n".join(lines)
+    if _LONG_DIGITS.search(data):
+        return None
+    read_options = pa_json.ReadOptions(use_threads=False, block_size=max(len(data) + 1, 1 << 20))
+    try:
+        table = pa_json.read_json(io.BytesIO(data), read_options=read_options)
+    except (pa.ArrowInvalid, pa.ArrowNotImplementedError):
+        return None
+    if table.num_columns == 0 or table.num_rows != len(lines) or any(_has_temporal(field.type) for field in table.schema):
+        return None
+    return table.combine_chunks().to_batches()[0]
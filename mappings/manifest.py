@@ -0,0 +1,271 @@
+import os
+import glob
+import json
+import hashlib
+import pyarrow.parquet as pq
+from typing import Dict, List, Any, Optional, Tuple
+
+from mappings.parquet_writer import read_roll_metadata, rolled_path
+from mappings.validation import schema_hash
+from mappings.work_units import WorkUnit
+from mappings.dead_letters import DEAD_LETTER_DIRNAME
+
+MANIFEST_FILENAME = "mapping_manifest.jsonl"
+# Chiave dei metadati key-value parquet in cui ogni shard registra da cosa è stato prodotto
+SHARD_METADATA_KEY = b"etl_agent.unit"
+
+
+def file_checksum(path: str, chunk_size: int = 1 << 20) -> str:
+    """sha256 del contenuto del file, letto a blocchi"""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def source_fingerprint(path: str, with_hash: bool = False) -> Dict[str, Any]:
+    """Impronta di un file sorgente: dimensione e mtime, più lo sha256 del contenuto se richiesto"""
+    stat = os.stat(path)
+    fingerprint: Dict[str, Any] = {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns}
+    if with_hash:
+        fingerprint["sha256"] = file_checksum(path)
+    return fingerprint
+
+
+def run_key(mapping: List, dst_schema: Dict[str, Any], engine: str, unit_bytes: int) -> str:
+    """Identità di un'esecuzione: un'unità completata è riusabile solo se mapping, schema e unità coincidono"""
+    return schema_hash({"mapping": mapping, "dst_schema": dst_schema, "engine": engine, "unit_bytes": unit_bytes})
+
+
+def _unit_source(unit: WorkUnit) -> Tuple[str, Optional[List[int]], Optional[List[int]]]:
+    """Porzione sorgente dell'unità in forma JSON (le tuple diventano liste)"""
+    return (
+        unit.file_path,
+        list(unit.row_groups) if unit.row_groups else None,
+        list(unit.byte_range) if unit.byte_range else None,
+    )
+
+
+def _source_key(file_path: str, row_groups: Optional[List[int]], byte_range: Optional[List[int]]) -> str:
+    return json.dumps([file_path, row_groups, byte_range])
+
+
+def shard_metadata(key: str, unit: WorkUnit, source: Dict[str, Any]) -> Dict[bytes, bytes]:
+    """Metadati per il footer dello shard di unit: esecuzione, porzione sorgente e sua impronta"""
+    file_path, row_groups, byte_range = _unit_source(unit)
+    value = {"run_key": key, "file": file_path, "row_groups": row_groups, "byte_range": byte_range, "source": source}
+    return {SHARD_METADATA_KEY: json.dumps(value).encode("utf-8")}
+
+
+def group_metadata(key: str, group: str, files: List[str], sources: Dict[str, Dict[str, Any]]) -> Dict[bytes, bytes]:
+    """Metadati per il footer dell'output di un COPY DuckDB, che mappa più file sorgente interi in un solo file"""
+    value = {"run_key": key, "group": group, "files": files, "sources": [sources.get(f) for f in files]}
+    return {SHARD_METADATA_KEY: json.dumps(value).encode("utf-8")}
+
+
+def read_shard_metadata(path: str) -> Optional[Tuple[Dict[str, Any], int]]:
+    """(metadati, righe) dal footer dello shard; None se il file non è stato prodotto dal mapping"""
+    try:
+        metadata = pq.ParquetFile(path).metadata
+    except Exception:
+        return None
+    value = (metadata.metadata or {}).get(SHARD_METADATA_KEY)
+    if value is None:
+        return None
+    return json.loads(value), metadata.num_rows
+
+
+class RunManifest:
+    """
+    Manifest delle unità di lavoro completate, in output_path/MANIFEST_FILENAME.
+    Il file è append-only: la prima riga contiene la chiave dell'esecuzione, poi una riga per unità
+    (file e porzione sorgente con la sua impronta, righe, righe scartate nei dead letter, shard di output
+    con dimensione e checksum),
+    scritta solo dopo il commit degli shard. Una riga troncata da un crash viene ignorata e l'unità rifatta.
+    """
+
+    def __init__(self, output_path: str, key: str, resume: bool = True, hash_sources: bool = False):
+        self.output_path = output_path
+        self.path = os.path.join(output_path, MANIFEST_FILENAME)
+        self.key = key
+        self.resume = resume
+        self.hash_sources = hash_sources
+        self.completed: Dict[str, Dict[str, Any]] = {}
+        self.skipped_units = 0
+        self.removed_shards = 0
+        if not (resume and self._load()):
+            self._reset()
+
+    def _load(self) -> bool:
+        """Carica le unità completate; False se il manifest manca o appartiene a un'altra esecuzione"""
+        if not os.path.exists(self.path):
+            return False
+        with open(self.path, "r", encoding="utf-8") as f:
+            lines = f.read().splitlines()
+        try:
+            header = json.loads(lines[0]) if lines else {}
+        except json.JSONDecodeError:
+            return False
+        if header.get("run_key") != self.key:
+            print(f"Manifest {self.path} di un'altra esecuzione (mapping o schema cambiati): si riparte da zero")
+            return False
+        for line in lines[1:]:
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                continue
+            self.completed[record["unit"]] = record
+        return True
+
+    def _reset(self) -> None:
+        """Riparte da zero: elimina gli shard e i dead letter delle esecuzioni precedenti, qualunque sia il motore"""
+        for path in glob.glob(os.path.join(self.output_path, "*.parquet")):
+            if read_shard_metadata(path) is not None:
+                os.remove(path)
+                self.removed_shards += 1
+        for path in glob.glob(os.path.join(self.output_path, DEAD_LETTER_DIRNAME, "*.errors.*")):
+            os.remove(path)
+        self.completed = {}
+        self._rewrite()
+
+    def _rewrite(self) -> None:
+        temp_path = self.path + ".tmp"
+        with open(temp_path, "w", encoding="utf-8") as f:
+            f.write(json.dumps({"run_key": self.key}) + "\n")
+            for record in self.completed.values():
+                f.write(json.dumps(record) + "\n")
+        os.replace(temp_path, self.path)
+
+    def sources(self, files: List[str]) -> Dict[str, Dict[str, Any]]:
+        """Impronte correnti dei file sorgente"""
+        return {file_path: source_fingerprint(file_path, self.hash_sources) for file_path in files}
+
+    def reconcile(self, units: List[WorkUnit], sources: Dict[str, Dict[str, Any]]) -> None:
+        """
+        Allinea la cartella di output alle unità correnti leggendo i footer degli shard. Restano
+        completati gli shard di questo mapping prodotti da una sorgente con la stessa impronta,
+        rinominati se l'indice del file è cambiato; quelli di file cancellati o modificati, quelli
+        di un altro mapping e le sequenze a rotazione incomplete vengono eliminati, con i dead letter
+        delle unità che non esistono più. Gli output dei COPY
+        DuckDB, riscritti a ogni esecuzione, restano solo se prodotti con la stessa chiave.
+        I parquet senza metadati del mapping non vengono toccati.
+        """
+        wanted = {_source_key(*_unit_source(unit)): unit for unit in units}
+        # Per unità, i file della sua sequenza: indice -> (path, righe, ultimo)
+        found: Dict[str, Tuple[WorkUnit, Dict[int, Tuple[str, int, bool]]]] = {}
+        stale: List[str] = []
+        for path in sorted(glob.glob(os.path.join(self.output_path, "*.parquet"))):
+            shard = read_shard_metadata(path)
+            if shard is None:
+                continue
+            metadata, rows = shard
+            if "group" in metadata:
+                if metadata["run_key"] != self.key:
+                    stale.append(path)
+                continue
+            unit = wanted.get(_source_key(metadata["file"], metadata["row_groups"], metadata["byte_range"]))
+            if unit is None or metadata["run_key"] != self.key or metadata["source"] != sources[unit.file_path]:
+                stale.append(path)
+                continue
+            roll = read_roll_metadata(path) or {"index": 0, "last": True}
+            files = found.setdefault(unit.output_name(), (unit, {}))[1]
+            if roll["index"] in files:
+                stale.append(path)
+                continue
+            files[roll["index"]] = (path, rows, roll["last"])
+
+        reusable: Dict[str, Tuple[WorkUnit, List[Tuple[str, int]]]] = {}
+        for name, (unit, files) in found.items():
+            sequence = [files[i] for i in sorted(files)]
+            complete = sorted(files) == list(range(len(files))) and [last for _, _, last in sequence] == [False] * (len(files) - 1) + [True]
+            if complete:
+                reusable[name] = (unit, [(path, rows) for path, rows, _ in sequence])
+            else:
+                stale.extend(path for path, _, _ in sequence)
+        for path in stale:
+            os.remove(path)
+        self.removed_shards += len(stale)
+        names = {unit.output_name() for unit in units}
+        for path in glob.glob(os.path.join(self.output_path, DEAD_LETTER_DIRNAME, "*.errors.*")):
+            if os.path.basename(path).split(".errors.")[0] + ".parquet" not in names:
+                os.remove(path)
+
+        # Rinomina in due passi: il nuovo nome di uno shard può essere quello vecchio di un altro
+        staged = []
+        for name, (unit, sequence) in reusable.items():
+            paths = []
+            for index, (path, _) in enumerate(sequence):
+                if path != rolled_path(os.path.join(self.output_path, name), index):
+                    os.replace(path, path + ".reuse")
+                    path += ".reuse"
+                paths.append(path)
+            staged.append((name, unit, paths, sum(rows for _, rows in sequence)))
+        completed: Dict[str, Dict[str, Any]] = {}
+        for name, unit, paths, rows in staged:
+            outputs = []
+            for index, path in enumerate(paths):
+                final_path = rolled_path(os.path.join(self.output_path, name), index)
+                if path != final_path:
+                    os.replace(path, final_path)
+                outputs.append(os.path.basename(final_path))
+            record = self.completed.get(name)
+            if record is None or not self._intact(record) or [o["file"] for o in record["outputs"]] != outputs or record.get("source") != sources[unit.file_path]:
+                checksums = [(output, file_checksum(os.path.join(self.output_path, output))) for output in outputs]
+                record = self._record(unit, rows, checksums, sources[unit.file_path], record.get("errors", 0) if record is not None else 0)
+            completed[name] = record
+        # Unità senza righe (nessuno shard): valgono finché la sorgente non cambia
+        for name, record in self.completed.items():
+            unit = wanted.get(_source_key(record["file"], record["row_groups"], record["byte_range"]))
+            if record.get("outputs") == [] and unit is not None and unit.output_name() == name and record.get("source") == sources[unit.file_path]:
+                completed[name] = record
+        self.completed = completed
+        self._rewrite()
+
+    def _intact(self, record: Dict[str, Any]) -> bool:
+        """Gli shard del record esistono con la dimensione registrata"""
+        outputs = record.get("outputs")
+        if outputs is None:
+            return False
+        for output in outputs:
+            path = os.path.join(self.output_path, output["file"])
+            if not os.path.exists(path) or os.path.getsize(path) != output["bytes"]:
+                return False
+        return True
+
+    def completed_rows(self, unit: WorkUnit) -> Optional[int]:
+        """Righe dell'unità se è già completata e i suoi shard sono intatti, altrimenti None"""
+        record = self.completed.get(unit.output_name())
+        if record is None or (record["file"], record["row_groups"], record["byte_range"]) != _unit_source(unit):
+            return None
+        return record["rows"] if self._intact(record) else None
+
+    def completed_errors(self, unit: WorkUnit) -> int:
+        """Righe scartate nei dead letter da un'unità completata (0 per i manifest scritti senza conteggio)"""
+        record = self.completed.get(unit.output_name())
+        return record.get("errors", 0) if record is not None else 0
+
+    def _record(self, unit: WorkUnit, rows: int, outputs: List[Tuple[str, str]], source: Optional[Dict[str, Any]], errors: int = 0) -> Dict[str, Any]:
+        file_path, row_groups, byte_range = _unit_source(unit)
+        return {
+            "unit": unit.output_name(),
+            "file": file_path,
+            "row_groups": row_groups,
+            "byte_range": byte_range,
+            "source": source,
+            "rows": rows,
+            "errors": errors,
+            "outputs": [
+                {"file": name, "bytes": os.path.getsize(os.path.join(self.output_path, name)), "checksum": checksum}
+                for name, checksum in outputs
+            ],
+        }
+
+    def record(self, unit: WorkUnit, rows: int, outputs: List[Tuple[str, str]], source: Optional[Dict[str, Any]] = None, errors: int = 0) -> None:
+        """Registra un'unità completata con i suoi shard (nome, sha256); va chiamato dopo il loro rename"""
+        record = self._record(unit, rows, outputs, source, errors)
+        with open(self.path, "a", encoding="utf-8") as f:
+            f.write(json.dumps(record) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+        self.completed[record["unit"]] = record
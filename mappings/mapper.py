@@ -1,36 +1,69 @@
 import re
-import jsonschema
-from typing import Dict, List, Any, Optional, Callable, Tuple, Union
+import copy
+from typing import Dict, List, Any, Optional, Callable, Set, Tuple, Union
+
+from mappings import transforms
+from mappings.profiling import MappingProfile
+from mappings.row_view import LazyView, ListView
+from mappings.validation import get_validator
 
 PathSegment = Union[str, int]
 MappingEntry = Dict[str, Any]
 
+# Piani compilati tenuti da ogni Mapper per apply_mapping: oltre questo numero la cache si svuota
+PLAN_CACHE_SIZE = 32
+
 
 class Mapper:
     ARRAY_INDEX_RE = re.compile(r"^([^\[\]]+)\[(\d+)\]$")
     ARRAY_PLACEHOLDER_RE = re.compile(r"\[\]")
-    # Nuova regex per gestire annidazione multipla: messages[].attachments[].url
-    NESTED_ARRAY_RE = re.compile(r"(.+?)(\[\][^\[\]]*)*(\[\])(.*)") 
 
     def __init__(self):
         self.dummy_mode = "null"
         self.transform_registry: Dict[str, Callable[[Any], Any]] = {}
+        # Implementazioni colonnari (pa.Array -> pa.Array) usate da ArrowMapper e DuckDBMapper
+        self.batch_transform_registry: Dict[str, Callable[[Any], Any]] = {}
+        # Nomi registrati con register_transform: solo questi si applicano al valore sorgente
+        self.applied_transforms: Set[str] = set()
+        # (id del mapping, id dello schema) -> (mapping, schema, loro copie al momento della compilazione, piano)
+        self._plans: Dict[Tuple[int, int], Tuple[List[MappingEntry], Dict[str, Any], List[MappingEntry], Dict[str, Any], "MappingPlan"]] = {}
         self._register_default_transforms()
 
     def set_dummy_mode(self, mode: str):
         assert mode in {"null", "dummy"}
         self.dummy_mode = mode
+        self._plans.clear()
 
     def _register_default_transforms(self):
-        self.transform_registry["null"] = lambda _: None
-        self.transform_registry["N/A"] = lambda _: None
-        self.transform_registry["src"] = lambda src: src
-        self.transform_registry["USER"] = lambda _: "USER"
-        self.transform_registry["ASSISTANT"] = lambda _: "ASSISTANT"
-        self.transform_registry["chat_template"] = lambda src: src
-
-    def register_transform(self, name: str, fn: Callable[[Any], Any]) -> None:
+        # Non applicate al valore sorgente: con src_field valorizzato "USER", "null" e simili copiano la sorgente
+        for name, transform in [
+            ("null", transforms.constant(None)), ("N/A", transforms.constant(None)), ("src", transforms.identity()),
+            ("USER", transforms.constant("USER")), ("ASSISTANT", transforms.constant("ASSISTANT")),
+            ("chat_template", transforms.identity()),
+        ]:
+            self._store_transform(name, *transform)
+
+    def _store_transform(self, name: str, fn: Callable[[Any], Any], batch_fn: Optional[Callable[[Any], Any]] = None) -> None:
         self.transform_registry[name] = fn
+        if batch_fn is not None:
+            self.batch_transform_registry[name] = batch_fn
+        else:
+            self.batch_transform_registry.pop(name, None)
+        self._plans.clear()
+
+    def register_transform(self, name: str, fn: Callable[[Any], Any], batch_fn: Optional[Callable[[Any], Any]] = None) -> None:
+        """
+        Registra una trasformazione applicata al valore sorgente quando compare come transformation di
+        un mapping con src_field valorizzato. fn lavora sul singolo valore; batch_fn, se presente, sull'intero
+        pa.Array (vedi mappings.transforms) e permette ai motori colonnari di non ricadere sul Mapper riga per riga.
+
+        Un nome non registrato qui (compresi i default "null", "src", "USER"...) con src_field valorizzato
+        copia il valore sorgente, come sempre. Per applicare una trasformazione la si registra esplicitamente,
+        ad esempio register_transform("lower", *transforms.normalize_string(lower=True)); anche un nome di
+        default registrato di nuovo si applica da quel momento.
+        """
+        self._store_transform(name, fn, batch_fn)
+        self.applied_transforms.add(name)
 
     def _parse_path(self, path: Optional[str]) -> List[PathSegment]:
         if not path:
@@ -55,23 +88,7 @@ class Mapper:
     def _get_by_path(self, src: Any, path: Optional[str]) -> Any:
         if path is None or path == "":
             return None
-        cur = src
-        for seg in self._parse_path(path):
-            if cur is None:
-                return None
-            if isinstance(seg, int):
-                if isinstance(cur, list) and 0 <= seg < len(cur):
-                    cur = cur[seg]
-                else:
-                    return None
-            elif seg == '[]':
-                return None
-            else:
-                if isinstance(cur, dict):
-                    cur = cur.get(seg)
-                else:
-                    return None
-        return cur
+        return _get_by_segments(src, self._parse_path(path))
 
     def _get_target_field_schema(self, target_field: str, dst_schema: Dict[str, Any]) -> Dict[str, Any]:
         """Ottiene lo schema del campo target per validazione tipo"""
@@ -103,31 +120,8 @@ class Mapper:
         """Converte il valore al tipo richiesto dallo schema target, senza serializzare oggetti complessi a stringa"""
         if value is None or not target_schema:
             return value
-        target_type = target_schema.get("type")
-        if isinstance(target_type, list):
-            target_type = next((t for t in target_type if t != "null"), "string")
-        try:
-            if target_type == "integer" and not isinstance(value, int):
-                if isinstance(value, str) and value.isdigit():
-                    return int(value)
-                elif isinstance(value, float):
-                    return int(value)
-            elif target_type == "number" and not isinstance(value, (int, float)):
-                if isinstance(value, str):
-                    return float(value)
-            elif target_type == "boolean" and not isinstance(value, bool):
-                if isinstance(value, str):
-                    return value.lower() in ["true", "1", "yes", "on"]
-                else:
-                    return bool(value)
-            elif target_type == "string" and not isinstance(value, str):
-                # NON serializzare oggetti complessi a stringa
-                if isinstance(value, (dict, list)):
-                    return value  # <-- restituisci dict/list senza serializzare
-                return str(value)
-        except (ValueError, TypeError):
-            pass
-        return value
+        caster = self._compile_caster(target_schema)
+        return caster(value) if caster else value
 
     def _resolve_transformation(self, transformation: Optional[Any], src_value: Any, src_field: Optional[str], sample_root: Any, target_schema: Dict[str, Any] = None) -> Any:
         # Se transformation è un dict, è un enum mapping
@@ -146,7 +140,11 @@ class Mapper:
         # Se src_value è None, ritorna None
         if src_value is None:
             return None
-        
+
+        # Trasformazione registrata con register_transform, applicata al valore sorgente
+        if isinstance(transformation, str) and transformation in self.applied_transforms:
+            src_value = self.transform_registry[transformation](src_value)
+
         # Altrimenti, usa src_value e applica casting se necessario
         if target_schema:
             src_value = self._cast_to_schema_type(src_value, target_schema)
@@ -204,36 +202,20 @@ class Mapper:
         segments = self._parse_path(path)
         if not segments:
             return
-        
-        cur = root
-        for i, seg in enumerate(segments):
-            last = (i == len(segments) - 1)
-            if isinstance(seg, int):
-                if not isinstance(cur, list):
-                    raise TypeError("Cannot create list at non-list parent")
-                while len(cur) <= seg:
-                    cur.append(None)
-                if last:
-                    cur[seg] = value
-                    return
-                if cur[seg] is None:
-                    next_seg = segments[i + 1]
-                    cur[seg] = [] if isinstance(next_seg, int) or next_seg == '[]' else {}
-                cur = cur[seg]
-            else:
-                if not isinstance(cur, dict):
-                    raise TypeError("Cannot create dict at non-dict parent")
-                if last:
-                    cur[seg] = value
-                    return
-                if seg not in cur or cur[seg] is None:
-                    next_seg = segments[i + 1]
-                    cur[seg] = [] if isinstance(next_seg, int) or next_seg == '[]' else {}
-                cur = cur[seg]
+        _set_by_segments(root, segments, value)
 
     def _populate_required_and_defaults(self, root_obj: Dict[str, Any], schema: Dict[str, Any], mapping_targets: set):
+        defaults = self._compile_defaults(schema, mapping_targets)
+        if defaults is not None:
+            defaults.fill(root_obj)
+
+    def _compile_defaults(self, schema: Dict[str, Any], mapping_targets: set) -> Optional["_DefaultsPlan"]:
+        """
+        Precompila _populate_required_and_defaults per (schema, target del mapping): per ogni
+        proprietà decide una volta sola se va creata, con quale valore e con quale sotto-piano.
+        """
         if not isinstance(schema, dict):
-            return
+            return None
         typ = schema.get("type")
         if isinstance(typ, list):
             types = [t for t in typ if t != "null"]
@@ -241,134 +223,575 @@ class Mapper:
         else:
             typ_primary = typ
 
-        if typ_primary == "object" or ("properties" in schema and typ_primary is None):
-            props = schema.get("properties", {})
-            required = schema.get("required", [])
-            for pname, pschema in props.items():
-                should_create = (pname in required) or any(t.startswith(pname + ".") or t == pname or t.startswith(pname + "[") for t in mapping_targets) or ("default" in pschema) or ("enum" in pschema)
-                if not should_create:
-                    if pname not in root_obj:
-                        continue
-                if pname in root_obj and root_obj[pname] is not None:
-                    if isinstance(root_obj[pname], dict):
-                        self._populate_required_and_defaults(root_obj[pname], pschema, {t[len(pname)+1:] for t in mapping_targets if t.startswith(pname + ".")})
-                    elif isinstance(root_obj[pname], list):
-                        items_schema = pschema.get("items", {})
-                        for i, it in enumerate(root_obj[pname]):
-                            if isinstance(it, dict):
-                                self._populate_required_and_defaults(it, items_schema, set())
-                    continue
-                if "default" in pschema:
-                    d = pschema["default"]
-                    if d == "null":
-                        root_obj[pname] = None
-                    else:
-                        root_obj[pname] = d
-                    continue
-                if "enum" in pschema and isinstance(pschema["enum"], list) and pschema["enum"]:
-                    root_obj[pname] = pschema["enum"][0]
-                    continue
-                ptype = pschema.get("type")
-                if isinstance(ptype, list) and "null" in ptype:
-                    root_obj[pname] = None
-                    continue
-                root_obj[pname] = self.instantiate_from_schema_minimal(pschema)
-            return
+        if not (typ_primary == "object" or ("properties" in schema and typ_primary is None)):
+            return None
 
-        if typ_primary == "array":
-            return
+        props = schema.get("properties", {})
+        required = schema.get("required", [])
+        compiled = []
+        for pname, pschema in props.items():
+            should_create = (pname in required) or any(t.startswith(pname + ".") or t == pname or t.startswith(pname + "[") for t in mapping_targets) or ("default" in pschema) or ("enum" in pschema)
+            if "default" in pschema:
+                d = pschema["default"]
+                value = None if d == "null" else d
+            elif "enum" in pschema and isinstance(pschema["enum"], list) and pschema["enum"]:
+                value = pschema["enum"][0]
+            elif isinstance(pschema.get("type"), list) and "null" in pschema["type"]:
+                value = None
+            else:
+                value = self.instantiate_from_schema_minimal(pschema)
+            object_plan = self._compile_defaults(pschema, {t[len(pname)+1:] for t in mapping_targets if t.startswith(pname + ".")})
+            items_plan = self._compile_defaults(pschema.get("items", {}), set()) if isinstance(pschema, dict) else None
+            compiled.append((pname, should_create, value, isinstance(value, (dict, list)), object_plan, items_plan))
+        return _DefaultsPlan(compiled)
 
-    def _find_all_array_paths(self, mapping: List[MappingEntry]) -> Dict[str, List[str]]:
-        """Trova tutti i path degli array per gestire annidazione multipla"""
-        array_paths = {}
-        
-        for entry in mapping:
-            src_field = entry.get('src_field', '')
-            target_field = entry.get('target_field', '')
-            
-            if '[]' in src_field or '[]' in target_field:
-                # Estrai il base path dell'array (tutto prima del primo [])
-                src_base = src_field.split('[]')[0].rstrip('.') if '[]' in src_field else ""
-                target_base = target_field.split('[]')[0].rstrip('.') if '[]' in target_field else ""
-                
-                key = f"{src_base}→{target_base}"
-                if key not in array_paths:
-                    array_paths[key] = []
-                array_paths[key].append(entry)
-        
-        return array_paths
+    def _compile_caster(self, target_schema: Dict[str, Any]) -> Optional[Callable[[Any], Any]]:
+        """Specializza _cast_to_schema_type sul tipo target, risolto una sola volta"""
+        if not target_schema:
+            return None
+        target_type = target_schema.get("type")
+        if isinstance(target_type, list):
+            target_type = next((t for t in target_type if t != "null"), "string")
+
+        if target_type == "integer":
+            def cast(value: Any) -> Any:
+                if value is None or isinstance(value, int):
+                    return value
+                try:
+                    if isinstance(value, str) and value.isdigit():
+                        return int(value)
+                    elif isinstance(value, float):
+                        return int(value)
+                except (ValueError, TypeError):
+                    pass
+                return value
+        elif target_type == "number":
+            def cast(value: Any) -> Any:
+                if isinstance(value, str):
+                    try:
+                        return float(value)
+                    except (ValueError, TypeError):
+                        pass
+                return value
+        elif target_type == "boolean":
+            def cast(value: Any) -> Any:
+                if value is None or isinstance(value, bool):
+                    return value
+                if isinstance(value, str):
+                    return value.lower() in ["true", "1", "yes", "on"]
+                try:
+                    return bool(value)
+                except (ValueError, TypeError):
+                    return value
+        elif target_type == "string":
+            def cast(value: Any) -> Any:
+                # NON serializzare oggetti complessi a stringa
+                if value is None or isinstance(value, (str, dict, list)):
+                    return value
+                try:
+                    return str(value)
+                except (ValueError, TypeError):
+                    return value
+        else:
+            return None
+        return cast
+
+    def compile(self, mapping: List[MappingEntry], dst_schema: Dict[str, Any]) -> "MappingPlan":
+        """
+        Precompila il mapping per dst_schema: path già segmentati, sotto-schemi target
+        risolti e funzioni di cast specializzate. Il piano si riusa su ogni riga.
+        """
+        def compile_entry(entry: MappingEntry, src: Any, tgt: Any) -> "_CompiledEntry":
+            target_schema = self._get_target_field_schema(tgt, dst_schema)
+            transformation = entry.get("transformation")
+            # Le trasformazioni registrate si applicano solo al valore sorgente: con src N/A
+            # la transformation resta il valore fisso
+            named = isinstance(transformation, str) and transformation in self.applied_transforms and src not in {"N/A", None, ""}
+            return _CompiledEntry(
+                src_field=src,
+                src_segments=self._parse_path(src) if src not in {"N/A", None, ""} else None,
+                target_segments=self._parse_path(tgt) if tgt else None,
+                transformation=transformation,
+                target_schema=target_schema,
+                caster=self._compile_caster(target_schema),
+                transform=self.transform_registry.get(transformation) if named else None,
+                batch_transform=self.batch_transform_registry.get(transformation) if named else None,
+                label=f"{src} -> {tgt}",
+            )
 
-    def apply_mapping(self, sample: Dict[str, Any], mapping: List[MappingEntry], dst_schema: Dict[str, Any]) -> Dict[str, Any]:
-        T: Dict[str, Any] = {}
-        
         # Separo i mapping in categorie
         fixed_mappings = [e for e in mapping if not self.ARRAY_INDEX_RE.search(e.get('target_field', '')) and '[]' not in e.get('target_field', '')]
         indexed_mappings = [e for e in mapping if self.ARRAY_INDEX_RE.search(e.get('target_field', ''))]
         dynamic_mappings = [e for e in mapping if '[]' in e.get('target_field', '')]
 
-        # Applica i mapping fissi e indicizzati (statici)
-        for entry in fixed_mappings + indexed_mappings:
-            src = entry.get("src_field")
-            transf = entry.get("transformation")
-            tgt = entry.get("target_field")
-            
-            # Ottieni schema del campo target per type casting
-            target_schema = self._get_target_field_schema(tgt, dst_schema)
-            
-            src_val = None
-            if src not in {"N/A", None, ""}:
-                src_val = self._get_by_path(sample, src)
-            
-            val = self._resolve_transformation(transf, src_val, src, sample, target_schema)
-            if tgt:
-                self._create_containers_and_set(T, tgt, val)
+        static_entries = [
+            compile_entry(e, e.get("src_field"), e.get("target_field"))
+            for e in fixed_mappings + indexed_mappings
+        ]
+
+        # Ogni livello '[]' della sorgente è accoppiato al livello '[]' di pari posizione nel target
+        array_levels: List[_ArrayLevel] = []
+        for e in dynamic_mappings:
+            src, tgt = e.get('src_field', ''), e.get('target_field', '')
+            if src in {"N/A", None, ""} or '[]' not in src:
+                # Senza array sorgente non c'è nulla su cui iterare
+                continue
+            src_segments, target_segments = self._parse_path(src), self._parse_path(tgt)
+            if src_segments.index('[]') == 0:
+                continue
+            levels = min(src_segments.count('[]'), target_segments.count('[]'))
+            compiled = compile_entry(e, src, tgt)
+            _insert_level(array_levels, compiled, src_segments, target_segments, levels)
 
-        # Applica i mapping dinamici (con supporto annidazione multipla)
-        if dynamic_mappings:
-            array_paths = self._find_all_array_paths(dynamic_mappings)
-            
-            for path_key, entries in array_paths.items():
-                src_base, target_base = path_key.split('→')
-                
-                # Ottieni l'array sorgente
-                src_array = self._get_by_path(sample, src_base) if src_base else []
-                if not isinstance(src_array, list):
-                    src_array = []
-                
-                # Processa ogni elemento dell'array
-                for i, src_item in enumerate(src_array):
-                    for entry in entries:
-                        src_field = entry.get('src_field', '').replace('[]', f'[{i}]')
-                        target_field = entry.get('target_field', '').replace('[]', f'[{i}]')
-                        transf = entry.get("transformation")
-                        
-                        # Ottieni schema del campo target
-                        target_schema = self._get_target_field_schema(target_field, dst_schema)
-                        
-                        src_val = None
-                        if src_field not in {"N/A", None, ""}:
-                            src_val = self._get_by_path(sample, src_field)
-                        
-                        val = self._resolve_transformation(transf, src_val, src_field, sample, target_schema)
-                        if target_field:
-                            self._create_containers_and_set(T, target_field, val)
-        
         mapping_targets = {e['target_field'] for e in mapping if e.get('target_field')}
-        self._populate_required_and_defaults(T, dst_schema, mapping_targets)
-        return T
+        defaults = self._compile_defaults(dst_schema, mapping_targets)
+        return MappingPlan(self, dst_schema, static_entries, array_levels, mapping_targets, defaults)
+
+    def apply_mapping(self, sample: Dict[str, Any], mapping: List[MappingEntry], dst_schema: Dict[str, Any],
+                      profile: Optional[MappingProfile] = None) -> Dict[str, Any]:
+        return self._cached_plan(mapping, dst_schema).apply(sample, profile)
+
+    def _cached_plan(self, mapping: List[MappingEntry], dst_schema: Dict[str, Any]) -> "MappingPlan":
+        """
+        Il piano compilato per mapping e dst_schema, riusato finché si passano gli stessi oggetti, come in
+        get_validator. Oggetti e copie restano referenziati (gli id non possono essere riusati) e il confronto
+        con le copie, molto più economico della compilazione, ricompila se il mapping è stato modificato sul posto.
+        """
+        key = (id(mapping), id(dst_schema))
+        cached = self._plans.get(key)
+        if cached is not None and cached[0] is mapping and cached[1] is dst_schema and cached[2] == mapping and cached[3] == dst_schema:
+            return cached[4]
+        if len(self._plans) >= PLAN_CACHE_SIZE:
+            self._plans.clear()
+        plan = self.compile(mapping, dst_schema)
+        self._plans[key] = (mapping, dst_schema, copy.deepcopy(mapping), copy.deepcopy(dst_schema), plan)
+        return plan
 
     def validate(self, transformed: Dict[str, Any], dst_schema: Dict[str, Any]) -> Tuple[bool, List[str]]:
-        validator = jsonschema.Draft7Validator(dst_schema)
-        errors: List[str] = []
-        for err in validator.iter_errors(transformed):
-            path = ".".join([str(p) for p in err.absolute_path])
-            errors.append(f"{path}: {err.message}")
+        errors = get_validator(dst_schema).errors(transformed)
         return (len(errors) == 0, errors)
 
-    def map_and_validate(self, sample: Dict[str, Any], mapping: List[MappingEntry], dst_schema: Dict[str, Any]) -> Tuple[Dict[str, Any], bool, List[str]]:
-        transformed = self.apply_mapping(sample, mapping, dst_schema)
-        valid, errors = self.validate(transformed, dst_schema)
+    def validate_many(self, rows: List[Dict[str, Any]], dst_schema: Dict[str, Any]) -> List[List[str]]:
+        """Errori di validazione per ogni riga, con il validatore compilato una sola volta per schema"""
+        return get_validator(dst_schema).validate_many(rows)
+
+    def map_and_validate(self, sample: Dict[str, Any], mapping: List[MappingEntry], dst_schema: Dict[str, Any],
+                         profile: Optional[MappingProfile] = None) -> Tuple[Dict[str, Any], bool, List[str]]:
+        transformed = self.apply_mapping(sample, mapping, dst_schema, profile)
+        if profile is not None:
+            with profile.measure("validation"):
+                valid, errors = self.validate(transformed, dst_schema)
+        else:
+            valid, errors = self.validate(transformed, dst_schema)
         return transformed, valid, errors
 
 
+class _DefaultsPlan:
+    """Scheletro dei default di un oggetto dello schema, riempito su ogni riga senza rileggere lo schema"""
+    __slots__ = ("props",)
+
+    def __init__(self, props: List[Tuple[str, bool, Any, bool, Optional["_DefaultsPlan"], Optional["_DefaultsPlan"]]]):
+        self.props = props
+
+    def fill(self, obj: Dict[str, Any]) -> None:
+        for pname, should_create, value, mutable, object_plan, items_plan in self.props:
+            current = obj.get(pname)
+            if current is not None:
+                if isinstance(current, dict):
+                    if object_plan is not None:
+                        object_plan.fill(current)
+                elif isinstance(current, list):
+                    if items_plan is not None:
+                        for it in current:
+                            if isinstance(it, dict):
+                                items_plan.fill(it)
+                continue
+            if not should_create and pname not in obj:
+                continue
+            # I valori mutabili dello scheletro non vanno condivisi tra le righe
+            obj[pname] = copy.deepcopy(value) if mutable else value
+
 
+class _CompiledEntry:
+    """Singola regola di mapping con path, schema target e cast già risolti"""
+    __slots__ = ("src_field", "src_segments", "target_segments", "transformation", "target_schema", "caster",
+                 "transform", "batch_transform", "label")
+
+    def __init__(self, src_field: Any, src_segments: Optional[List[PathSegment]], target_segments: Optional[List[PathSegment]],
+                 transformation: Any, target_schema: Dict[str, Any], caster: Optional[Callable[[Any], Any]],
+                 transform: Optional[Callable[[Any], Any]] = None, batch_transform: Optional[Callable[[Any], Any]] = None,
+                 label: str = ""):
+        self.src_field = src_field
+        self.src_segments = src_segments
+        self.target_segments = target_segments
+        self.transformation = transformation
+        self.target_schema = target_schema
+        self.caster = caster
+        self.transform = transform
+        self.batch_transform = batch_transform
+        # "src -> target" della regola originale, usata nei profili
+        self.label = label
+
+    def resolve(self, src_value: Any) -> Any:
+        """Equivalente di Mapper._resolve_transformation con schema e cast precompilati"""
+        transformation = self.transformation
+        # Se transformation è un dict, è un enum mapping
+        if isinstance(transformation, dict):
+            result = transformation.get(src_value, None)
+            if result is not None and self.caster:
+                result = self.caster(result)
+            return result
+        # Se src_field è N/A, transformation contiene il valore fisso
+        if self.src_segments is None:
+            return self.caster(transformation) if self.caster else transformation
+        if src_value is None:
+            return None
+        if self.transform is not None:
+            src_value = self.transform(src_value)
+        return self.caster(src_value) if self.caster else src_value
+
+
+def _get_by_segments(src: Any, segments: List[PathSegment], materialize: bool = True) -> Any:
+    cur = src
+    for seg in segments:
+        if cur is None:
+            return None
+        if isinstance(cur, LazyView):
+            # Vista su un RecordBatch: si scende senza convertire i livelli intermedi
+            cur = cur.step(seg)
+            continue
+        if isinstance(seg, int):
+            if isinstance(cur, list) and 0 <= seg < len(cur):
+                cur = cur[seg]
+            else:
+                return None
+        elif seg == '[]':
+            return None
+        else:
+            if isinstance(cur, dict):
+                cur = cur.get(seg)
+            else:
+                return None
+    if materialize and isinstance(cur, LazyView):
+        return cur.materialize()
+    return cur
+
+
+def _set_by_segments(root: Any, segments: List[PathSegment], value: Any):
+    cur = root
+    last_index = len(segments) - 1
+    for i, seg in enumerate(segments):
+        if isinstance(seg, int):
+            if not isinstance(cur, list):
+                raise TypeError("Cannot create list at non-list parent")
+            while len(cur) <= seg:
+                cur.append(None)
+            if i == last_index:
+                cur[seg] = value
+                return
+            if cur[seg] is None:
+                next_seg = segments[i + 1]
+                cur[seg] = [] if isinstance(next_seg, int) or next_seg == '[]' else {}
+            cur = cur[seg]
+        else:
+            if not isinstance(cur, dict):
+                raise TypeError("Cannot create dict at non-dict parent")
+            if i == last_index:
+                cur[seg] = value
+                return
+            if seg not in cur or cur[seg] is None:
+                next_seg = segments[i + 1]
+                cur[seg] = [] if isinstance(next_seg, int) or next_seg == '[]' else {}
+            cur = cur[seg]
+
+
+def _bind_index(segments: List[PathSegment], index: int) -> List[PathSegment]:
+    """Sostituisce ogni placeholder '[]' con l'indice dell'elemento corrente"""
+    return [index if seg == '[]' else seg for seg in segments]
+
+
+def _new_container(next_seg: PathSegment) -> Any:
+    return [] if isinstance(next_seg, int) or next_seg == '[]' else {}
+
+
+def _descend(root: Any, segments: List[PathSegment], next_seg: PathSegment) -> Any:
+    """Come _set_by_segments, ma restituisce il container in fondo al path creandolo se manca"""
+    cur = root
+    last_index = len(segments) - 1
+    for i, seg in enumerate(segments):
+        following = segments[i + 1] if i < last_index else next_seg
+        if isinstance(seg, int):
+            if not isinstance(cur, list):
+                raise TypeError("Cannot create list at non-list parent")
+            while len(cur) <= seg:
+                cur.append(None)
+            if cur[seg] is None:
+                cur[seg] = _new_container(following)
+            cur = cur[seg]
+        else:
+            if not isinstance(cur, dict):
+                raise TypeError("Cannot create dict at non-dict parent")
+            if seg not in cur or cur[seg] is None:
+                cur[seg] = _new_container(following)
+            cur = cur[seg]
+    return cur
+
+
+def _element_container(target_list: Any, index: int, next_seg: PathSegment) -> Any:
+    if not isinstance(target_list, list):
+        raise TypeError("Cannot create list at non-list parent")
+    while len(target_list) <= index:
+        target_list.append(None)
+    if target_list[index] is None:
+        target_list[index] = _new_container(next_seg)
+    return target_list[index]
+
+
+class _ArrayLevel:
+    """
+    Livello di espansione '[]': coppia (array sorgente, lista target) con path relativi
+    all'elemento del livello superiore (o alla radice). Le regole del livello hanno path
+    relativi all'elemento corrente; i livelli annidati stanno in children.
+    """
+    __slots__ = ("src_path", "target_path", "entries", "children")
+
+    def __init__(self, src_path: List[PathSegment], target_path: List[PathSegment]):
+        self.src_path = src_path
+        self.target_path = target_path
+        self.entries: List[Tuple[_CompiledEntry, bool]] = []
+        self.children: List["_ArrayLevel"] = []
+
+    def expand(self, src_parent: Any, tgt_parent: Callable[[], Any], profile: Optional[MappingProfile] = None) -> None:
+        """
+        Itera l'array sorgente una volta sola, scrivendo nella lista target risolta una volta
+        per livello. tgt_parent crea il container padre solo alla prima scrittura, così un
+        array vuoto non lascia container vuoti nell'output.
+        """
+        src_array = _get_by_segments(src_parent, self.src_path, materialize=False)
+        if isinstance(src_array, ListView):
+            src_array = src_array.items()
+        elif not isinstance(src_array, list):
+            return
+        target_list = None
+        for i, item in enumerate(src_array):
+            for entry, unpaired in self.entries:
+                src_segments, target_segments = entry.src_segments, entry.target_segments
+                if unpaired:
+                    # '[]' in eccesso rispetto all'altro lato: legati all'indice corrente
+                    src_segments, target_segments = _bind_index(src_segments, i), _bind_index(target_segments, i)
+                if profile is not None:
+                    started = profile.start()
+                    src_val = _get_by_segments(item, src_segments)
+                    profile.stop("read", entry.label, started)
+                    started = profile.start()
+                    val = entry.resolve(src_val)
+                    profile.stop("cast", entry.label, started)
+                    started = profile.start()
+                else:
+                    val = entry.resolve(_get_by_segments(item, src_segments))
+                if target_list is None:
+                    target_list = _descend(tgt_parent(), self.target_path, 0)
+                if target_segments:
+                    _set_by_segments(_element_container(target_list, i, target_segments[0]), target_segments, val)
+                else:
+                    _set_by_segments(target_list, [i], val)
+                if profile is not None:
+                    profile.stop("containers", entry.label, started)
+            for child in self.children:
+                def element(child: "_ArrayLevel" = child, i: int = i) -> Any:
+                    nonlocal target_list
+                    if target_list is None:
+                        target_list = _descend(tgt_parent(), self.target_path, 0)
+                    return _element_container(target_list, i, child.target_path[0] if child.target_path else '[]')
+                child.expand(item, element, profile)
+            if self.children:
+                # Un elemento sorgente senza l'array interno (o con l'array vuoto) resta un elemento del target,
+                # senza quell'array: la lista target resta allineata alla sorgente e ogni elemento è un container
+                if target_list is None:
+                    target_list = _descend(tgt_parent(), self.target_path, 0)
+                first = self.children[0]
+                _element_container(target_list, i, first.target_path[0] if first.target_path else '[]')
+
+
+def _insert_level(levels: List[_ArrayLevel], entry: _CompiledEntry, src_segments: List[PathSegment],
+                  target_segments: List[PathSegment], depth: int) -> None:
+    """Inserisce la regola nell'albero dei livelli, condividendo i livelli con stessi path"""
+    src_cut, target_cut = src_segments.index('[]'), target_segments.index('[]')
+    src_path, target_path = src_segments[:src_cut], target_segments[:target_cut]
+    level = next((l for l in levels if l.src_path == src_path and l.target_path == target_path), None)
+    if level is None:
+        level = _ArrayLevel(src_path, target_path)
+        levels.append(level)
+    src_rest, target_rest = src_segments[src_cut + 1:], target_segments[target_cut + 1:]
+    if depth > 1:
+        _insert_level(level.children, entry, src_rest, target_rest, depth - 1)
+        return
+    relative = _CompiledEntry(entry.src_field, src_rest, target_rest, entry.transformation, entry.target_schema, entry.caster,
+                              entry.transform, entry.batch_transform, entry.label)
+    level.entries.append((relative, '[]' in src_rest or '[]' in target_rest))
+
+
+class _SourceTrie:
+    """
+    Path sorgente delle regole statiche organizzati per prefisso: ogni prefisso comune
+    (es. conversations[0] per conversations[0].value e conversations[0].from) si risolve una volta per riga.
+    """
+    __slots__ = ("children", "positions")
+
+    def __init__(self):
+        self.children: List[Tuple[List[PathSegment], "_SourceTrie"]] = []
+        self.positions: List[int] = []
+
+    def insert(self, segments: List[PathSegment], position: int) -> None:
+        node = self
+        for seg in segments:
+            child = next((c for (s,), c in node.children if s == seg and type(s) is type(seg)), None)
+            if child is None:
+                child = _SourceTrie()
+                node.children.append(([seg], child))
+            node = child
+        node.positions.append(position)
+
+    def read(self, value: Any, out: List[Any]) -> None:
+        """Scrive in out[posizione] il valore sorgente di ogni regola che termina in questo sottoalbero"""
+        if value is None:
+            return
+        for position in self.positions:
+            out[position] = value.materialize() if isinstance(value, LazyView) else value
+        for step, child in self.children:
+            child.read(_get_by_segments(value, step, materialize=False), out)
+
+
+class _TargetTrie:
+    """
+    Path target delle regole statiche come albero di container: ogni dict o lista dell'output
+    viene creato una volta sola e riempito con i valori delle regole, nell'ordine del mapping.
+    """
+    __slots__ = ("children", "positions", "length")
+
+    def __init__(self):
+        self.children: List[Tuple[PathSegment, "_TargetTrie"]] = []
+        self.positions: List[int] = []
+        self.length = 0
+
+    @staticmethod
+    def build(targets: List[Optional[List[PathSegment]]]) -> Optional["_TargetTrie"]:
+        """
+        None se le scritture non sono equivalenti a un albero di container nuovi: un target che è
+        prefisso di un altro (il secondo scrive dentro al valore del primo) o chiavi e indici misti.
+        """
+        root = _TargetTrie()
+        for position, segments in enumerate(targets):
+            if not segments:
+                continue
+            node = root
+            for seg in segments:
+                if node.positions:
+                    return None
+                if node.children and isinstance(node.children[0][0], int) != isinstance(seg, int):
+                    return None
+                if node is root and isinstance(seg, int):
+                    return None
+                child = next((c for key, c in node.children if key == seg and type(key) is type(seg)), None)
+                if child is None:
+                    child = _TargetTrie()
+                    node.children.append((seg, child))
+                    if isinstance(seg, int):
+                        node.length = max(node.length, seg + 1)
+                node = child
+            if node.children:
+                return None
+            node.positions.append(position)
+        return root
+
+    def value(self, values: List[Any]) -> Any:
+        if self.positions:
+            # Più regole sullo stesso target: vince l'ultima, come nelle scritture in sequenza
+            return values[self.positions[-1]]
+        if self.length:
+            container: Any = [None] * self.length
+            for index, child in self.children:
+                container[index] = child.value(values)
+            return container
+        return {key: child.value(values) for key, child in self.children}
+
+
+class MappingPlan:
+    """
+    Piano di mapping compilato da Mapper.compile per una coppia (mapping, dst_schema).
+    Tutto il lavoro che non dipende dalla riga viene fatto una volta sola in compilazione;
+    apply esegue solo letture, trasformazioni e scritture.
+    """
+
+    def __init__(self, mapper: Mapper, dst_schema: Dict[str, Any], static_entries: List[_CompiledEntry],
+                 array_levels: List[_ArrayLevel], mapping_targets: set, defaults: Optional[_DefaultsPlan] = None):
+        self.mapper = mapper
+        self.dst_schema = dst_schema
+        self.static_entries = static_entries
+        self.array_levels = array_levels
+        self.mapping_targets = mapping_targets
+        self.defaults = defaults
+
+        # Le regole con src N/A danno lo stesso valore su ogni riga: si risolvono qui
+        self._constants = [entry.resolve(None) if entry.src_segments is None else None for entry in static_entries]
+        self._source_trie = _SourceTrie()
+        for position, entry in enumerate(static_entries):
+            if entry.src_segments is not None:
+                self._source_trie.insert(entry.src_segments, position)
+        self._target_trie = _TargetTrie.build([entry.target_segments for entry in static_entries])
+
+    def apply(self, sample: Dict[str, Any], profile: Optional[MappingProfile] = None) -> Dict[str, Any]:
+        if profile is not None:
+            return self._apply_profiled(sample, profile)
+
+        # Applica i mapping fissi e indicizzati (statici): letture condivise per prefisso, poi trasformazioni
+        values = [None] * len(self.static_entries)
+        self._source_trie.read(sample, values)
+        for position, entry in enumerate(self.static_entries):
+            values[position] = entry.resolve(values[position]) if entry.src_segments is not None else self._constants[position]
+
+        if self._target_trie is not None:
+            T: Dict[str, Any] = self._target_trie.value(values)
+        else:
+            T = {}
+            for entry, val in zip(self.static_entries, values):
+                if entry.target_segments:
+                    _set_by_segments(T, entry.target_segments, val)
+
+        # Applica i mapping dinamici, un livello '[]' alla volta
+        for level in self.array_levels:
+            level.expand(sample, lambda: T)
+
+        # Required, default ed enum dallo scheletro precompilato
+        if self.defaults is not None:
+            self.defaults.fill(T)
+        return T
+
+    def _apply_profiled(self, sample: Dict[str, Any], profile: MappingProfile) -> Dict[str, Any]:
+        """
+        Come apply, ma regola per regola e misurando ogni fase. Le letture non passano dai trie,
+        così il costo di ogni path sorgente resta attribuito alla sua regola.
+        """
+        profile.rows += 1
+        T: Dict[str, Any] = {}
+        for entry in self.static_entries:
+            src_val = None
+            if entry.src_segments is not None:
+                started = profile.start()
+                src_val = _get_by_segments(sample, entry.src_segments)
+                profile.stop("read", entry.label, started)
+            started = profile.start()
+            val = entry.resolve(src_val)
+            profile.stop("cast", entry.label, started)
+            if entry.target_segments:
+                started = profile.start()
+                _set_by_segments(T, entry.target_segments, val)
+                profile.stop("containers", entry.label, started)
+
+        for level in self.array_levels:
+            level.expand(sample, lambda: T, profile)
+
+        if self.defaults is not None:
+            with profile.measure("defaults"):
+                self.defaults.fill(T)
+        return T
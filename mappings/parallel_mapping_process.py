@@ -1,91 +1,531 @@
 import os
-import json
-import gzip
-import pyarrow.parquet as pq
+import time
 import pyarrow as pa
-from typing import List, Dict, Any, Tuple, Callable
-from concurrent.futures import ProcessPoolExecutor, as_completed
+from itertools import islice
+from typing import List, Dict, Any, Iterable, Iterator, NamedTuple, Optional, Sequence, Tuple, Callable
+from concurrent.futures import ProcessPoolExecutor, Future, FIRST_COMPLETED, wait
 
 from tqdm import tqdm
-from mappings.mapper import Mapper
+from mappings.mapper import Mapper, PathSegment
+from mappings.row_view import row_views
+from mappings.profiling import MappingProfile
+from mappings.validation import CompiledValidator, ValidationReport, get_validator
+from mappings.work_units import WorkUnit, DEFAULT_UNIT_BYTES
+from mappings.scheduling import ScheduleReport, lpt_order
+from mappings.manifest import RunManifest, file_checksum, group_metadata, read_shard_metadata, run_key, shard_metadata
+from mappings.arrow_mapper import ArrowMapper
+from mappings.arrow_schema import output_schema, rows_to_table, conform_table
+from mappings.parquet_writer import ParquetOptions, RollingParquetWriter, rolled_path
+from mappings.duckdb_mapper import DuckDBMapper
+from mappings.projection import source_paths
+from mappings.readers import ReadRequest, SourceBatch, plan_work_units, reader_for, supported_extensions
+from mappings.dead_letters import DEAD_LETTER_DIRNAME, DEAD_LETTER_FORMATS, DeadLetter, DeadLetterWriter, error_message, record_snippet
+from mappings.compression import compression_of
+from mappings.json_array_reader import is_json_array
+from mappings.pipeline import DEFAULT_PIPELINE_DEPTH, BackgroundWriter, prefetch
+
+MAPPING_ENGINES = ("python", "arrow", "duckdb")
+MAPPING_PROFILE_FILENAME = "mapping_profile.json"
+# Righe lette, mappate e scritte per volta da ogni worker: limita la memoria per processo
+DEFAULT_BATCH_SIZE = 10_000
+# Esito di un'unità: (nome del file, riuscita, righe, errore, profilo serializzato, [(shard scritto, sha256)], righe scartate,
+# report di validazione serializzato)
+UnitResult = Tuple[str, bool, int, Any, Optional[Dict[str, Any]], List[Tuple[str, str]], int, Optional[Dict[str, Any]]]
+
+
+class MappingOptions(NamedTuple):
+    """
+    Impostazioni di un'esecuzione di run_parallel_mapping, passate così come sono a ogni worker.
+    batch_size: righe lette, mappate e scritte per volta da ogni worker; unit_bytes: oltre questa dimensione
+    un file si divide in unità parallele; resume e hash_sources: vedi RunManifest; pipeline_depth: batch in coda
+    tra gli stadi del worker (0: in sequenza); dead_letters: formato dei file di scarto (None: una riga non
+    valida fa fallire l'unità); validate_every: una riga mappata ogni N validata contro dst_schema (0: nessuna).
+    """
+    engine: str = "python"
+    profile: bool = False
+    batch_size: int = DEFAULT_BATCH_SIZE
+    unit_bytes: int = DEFAULT_UNIT_BYTES
+    resume: bool = False
+    hash_sources: bool = False
+    parquet: ParquetOptions = ParquetOptions()
+    pipeline_depth: int = DEFAULT_PIPELINE_DEPTH
+    dead_letters: Optional[str] = "parquet"
+    validate_every: int = 0
+
+    def check(self) -> None:
+        if self.batch_size < 1:
+            raise ValueError(f"batch_size deve essere positivo: {self.batch_size}")
+        if self.pipeline_depth < 0:
+            raise ValueError(f"pipeline_depth non può essere negativo: {self.pipeline_depth}")
+        if self.engine not in MAPPING_ENGINES:
+            raise ValueError(f"Motore di mapping non supportato: {self.engine}. Valori ammessi: {MAPPING_ENGINES}")
+        if self.dead_letters is not None and self.dead_letters not in DEAD_LETTER_FORMATS:
+            raise ValueError(f"Formato dei dead letter non supportato: {self.dead_letters}. Valori ammessi: {DEAD_LETTER_FORMATS}")
+        if self.validate_every < 0:
+            raise ValueError(f"validate_every non può essere negativo: {self.validate_every}")
 
 
 def parse_input_path(input_path: str) -> List[str]:
-    supported_extensions = ('.parquet', '.jsonl.gz', ".jsonl", ".json")
+    # Estensioni dei reader registrati (vedi mappings.readers)
+    extensions = supported_extensions()
     files_to_process = []
     if os.path.isfile(input_path):
-        if input_path.endswith(supported_extensions): files_to_process.append(input_path)
+        if input_path.endswith(extensions): files_to_process.append(input_path)
     elif os.path.isdir(input_path):
         for root, _, files in os.walk(input_path):
             for filename in files:
-                if filename.endswith(supported_extensions): files_to_process.append(os.path.join(root, filename))
+                if filename.endswith(extensions): files_to_process.append(os.path.join(root, filename))
     else: 
         print(f"Errore: Il percorso di input '{input_path}' non è valido.")
     return files_to_process
 
-def process_file(file_path: str, mapper_mapping: List, dst_schema: Dict[str, Any], output_path: str, file_index: int) -> Tuple[str, bool, int, Any]:
-    mapper = Mapper()
-    output_filename = os.path.splitext(os.path.basename(file_path))[0]
-    parquet_filepath = os.path.join(output_path, f"{output_filename}_mapped_{file_index}.parquet")
-    mapped_samples = []
-    processed_count = 0
-    try:
-        if file_path.endswith('.parquet'):
-            table = pq.read_table(file_path)
-            dict_rows = table.to_pylist()  # <-- usa pylist per dict annidati
-            for row in dict_rows:
-                mapped_sample = mapper.apply_mapping(row, mapper_mapping, dst_schema)
-                mapped_samples.append(mapped_sample)
-                processed_count += 1
-        elif file_path.endswith('.jsonl.gz'):
-            with gzip.open(file_path, 'rt', encoding='utf-8') as f:
-                for line in f:
-                    sample = json.loads(line)
-                    mapped_sample = mapper.apply_mapping(sample, mapper_mapping, dst_schema)
-                    mapped_samples.append(mapped_sample)
-                    processed_count += 1
-        elif file_path.endswith('.jsonl') or file_path.endswith('.json'):
-            with open(file_path, 'r', encoding='utf-8') as f:
-                for line in f:
-                    sample = json.loads(line)
-                    mapped_sample = mapper.apply_mapping(sample, mapper_mapping, dst_schema)
-                    mapped_samples.append(mapped_sample)
-                    processed_count += 1
-        # Scrittura solo in formato Parquet, senza serializzazione stringa
-        if mapped_samples:
-            table = pa.Table.from_pylist(mapped_samples)
-            pq.write_table(table, parquet_filepath)
-        return (os.path.basename(file_path), True, processed_count, None)
-    except Exception as e:
-        print(f"Errore durante l'elaborazione del file {file_path}: {e}")
-        return (os.path.basename(file_path), False, processed_count, e)
-
-
-def run_parallel_mapping(input_path: str, output_path: str, mapping: List, dst_schema: Dict[str, Any], progress_callback: Callable[[float], None]) -> Dict[str, int]:
+class _ParquetStream:
+    """
+    Scrive l'output di un'unità un batch alla volta con un RollingParquetWriter aperto, così la memoria
+    del worker dipende dalla dimensione del batch e del buffer dei row group, non da quella del file; oltre options.target_file_bytes
+    l'output continua in <nome>.r00001.parquet, <nome>.r00002.parquet...
+
+    Lo schema dei file coincide con quello che pa.Table.from_pylist inferirebbe su tutte le righe:
+    colonne prese dalla prima riga (o dal primo batch Arrow), tipi unificati tra i batch. Se un batch allarga lo schema
+    (es. una colonna tutta null nei primi batch, o un campo di struct che compare dopo) le righe
+    già scritte vengono riscritte in streaming con lo schema unificato.
+
+    I file vengono scritti come .partial e rinominati solo da close(): un file con il nome definitivo
+    è sempre completo, anche se il worker muore a metà. metadata finisce nei metadati key-value del footer.
+
+    Con schema (derivato da dst_schema, vedi mappings.arrow_schema) non c'è inferenza: ogni batch
+    viene costruito o riportato a quello schema, quindi tutti gli shard di un dataset sono identici.
+    Con dead_letters le righe non conformi a schema finiscono lì (con il loro offset sorgente) invece di
+    far fallire la scrittura; senza schema un batch non scrivibile fa fallire l'unità.
+    """
+
+    def __init__(self, path: str, metadata: Optional[Dict[bytes, bytes]] = None, schema: Optional[pa.Schema] = None,
+                 options: ParquetOptions = ParquetOptions(), dead_letters: Optional[DeadLetterWriter] = None):
+        self.path = path
+        self.metadata = metadata
+        self.fixed_schema = schema
+        self.options = options
+        self.dead_letters = dead_letters
+        self.rejected = 0
+        self.columns: Optional[List[str]] = None
+        self.schema: Optional[pa.Schema] = None
+        self.writer: Optional[RollingParquetWriter] = None
+
+    def write_rows(self, rows: List[Dict[str, Any]], offsets: Optional[Sequence[int]] = None) -> None:
+        if not rows:
+            return
+        if self.fixed_schema is not None:
+            try:
+                table = rows_to_table(rows, self.fixed_schema)
+            except (ValueError, TypeError, pa.ArrowException):
+                if self.dead_letters is None or offsets is None:
+                    raise
+                table = self._conforming_rows(rows, offsets)
+                if table.num_rows == 0:
+                    return
+            self.write_table(table)
+            return
+        if self.columns is None:
+            self.columns = self.schema.names if self.schema is not None else list(rows[0].keys())
+        arrays = [pa.array([row.get(column) for row in rows]) for column in self.columns]
+        self.write_table(pa.Table.from_arrays(arrays, names=self.columns))
+
+    def _conforming_rows(self, rows: List[Dict[str, Any]], offsets: Sequence[int]) -> pa.Table:
+        """Tabella delle sole righe conformi a fixed_schema, provate una alla volta; le altre vanno nei dead letter"""
+        kept, rejected = [], []
+        for row, offset in zip(rows, offsets):
+            try:
+                rows_to_table([row], self.fixed_schema)
+                kept.append(row)
+            except (ValueError, TypeError, pa.ArrowException) as e:
+                rejected.append(DeadLetter(offset, "schema", error_message(e), record_snippet(row)))
+        self.dead_letters.write(rejected)
+        self.rejected += len(rejected)
+        return rows_to_table(kept, self.fixed_schema)
+
+    def write_table(self, table: pa.Table, offsets: Optional[Sequence[int]] = None) -> None:
+        if self.fixed_schema is not None:
+            try:
+                table = conform_table(table, self.fixed_schema)
+            except (ValueError, TypeError, pa.ArrowException):
+                if self.dead_letters is None or offsets is None:
+                    raise
+                # Si ripassa dalle righe Python per trovare quelle non conformi
+                table = self._conforming_rows(table.to_pylist(), offsets)
+                if table.num_rows == 0:
+                    return
+        if self.writer is None:
+            self.schema = table.schema
+            self.writer = RollingParquetWriter(lambda index: rolled_path(self.path, index), self.schema, self.options, self.metadata)
+        elif table.schema != self.schema:
+            if table.column_names != self.schema.names:
+                # Colonne fissate dal primo batch come per le righe: le mancanti diventano null, le nuove si scartano
+                table = pa.Table.from_arrays([
+                    table.column(name) if name in table.column_names else pa.nulls(table.num_rows)
+                    for name in self.schema.names
+                ], names=self.schema.names)
+            unified = pa.unify_schemas([self.schema, table.schema], promote_options="permissive")
+            if unified != self.schema:
+                self.schema = unified
+                self.writer.widen(unified)
+            table = table.cast(self.schema)
+        self.writer.write_table(table)
+
+    def close(self) -> List[str]:
+        """Chiude e rende definitivi i file; restituisce i loro path (vuoto se non è stata scritta nessuna riga)"""
+        if self.writer is None:
+            return []
+        paths = self.writer.close()
+        self.writer = None
+        return paths
+
+    def abort(self) -> None:
+        """Scarta i file parziali"""
+        if self.writer is not None:
+            self.writer.abort()
+            self.writer = None
+
+
+def process_file(file_path: str, mapper_mapping: List, dst_schema: Dict[str, Any], output_path: str, file_index: int, options: MappingOptions = MappingOptions()) -> UnitResult:
+    """Mappa un file intero in {nome}_mapped_{file_index}.parquet (vedi process_unit)"""
+    return process_unit(WorkUnit(file_path, file_index), mapper_mapping, dst_schema, output_path, options)
+
+
+def process_unit(unit: WorkUnit, mapper_mapping: List, dst_schema: Dict[str, Any], output_path: str, options: MappingOptions = MappingOptions()) -> UnitResult:
+    """Mappa una singola unità di lavoro compilando il mapping solo per lei (vedi _MappingWorker)"""
+    return _MappingWorker(mapper_mapping, dst_schema, output_path, options).process(unit)
+
+
+class _MappingWorker:
+    """
+    Stato di un worker del pool: mapping, schema e mapping compilato (MappingPlan e, per il motore
+    arrow, ArrowMapper) vengono costruiti una volta e riusati per tutte le unità che il worker riceve.
+    Con options.dead_letters (formato dei file di scarto, vedi mappings.dead_letters) una riga che non si decodifica,
+    non si mappa o non è conforme allo schema viene scartata da sola; con None fa fallire l'unità.
+    Con options.validate_every=N una riga mappata ogni N viene validata contro dst_schema (vedi ValidationReport).
+    """
+
+    def __init__(self, mapper_mapping: List, dst_schema: Dict[str, Any], output_path: str, options: MappingOptions = MappingOptions(), run_key: Optional[str] = None):
+        self.output_path = output_path
+        self.options = options
+        self.dead_letters = options.dead_letters
+        self.validator: Optional[CompiledValidator] = None
+        self.run_key = run_key
+        self.plan = None
+        self.arrow_mapper: Optional[ArrowMapper] = None
+        self.output_schema: Optional[pa.Schema] = None
+        # Path sorgente letti dal mapping: dai parquet si leggono solo le colonne che li contengono
+        self.source_paths: Optional[List[List[PathSegment]]] = None
+        self.compile_error: Optional[Exception] = None
+        try:
+            mapper = Mapper()
+            self.plan = mapper.compile(mapper_mapping, dst_schema)
+            self.output_schema = output_schema(dst_schema, mapper_mapping)
+            self.source_paths = source_paths(mapper_mapping)
+            if options.validate_every > 0:
+                self.validator = get_validator(dst_schema)
+            if options.engine == "arrow":
+                self.arrow_mapper = ArrowMapper(mapper_mapping, dst_schema, mapper=mapper)
+        except Exception as e:
+            # Segnalato per ogni unità: un'eccezione nell'initializer romperebbe l'intero pool
+            self.compile_error = e
+
+    def process(self, unit: WorkUnit, source: Optional[Dict[str, Any]] = None) -> UnitResult:
+        """
+        Mappa un'unità di lavoro (file intero, gruppo di row group o intervallo di byte) in unit.output_name(),
+        leggendo, mappando e scrivendo batch_size righe alla volta in stadi sovrapposti (vedi mappings.pipeline):
+        la memoria resta limitata a circa 2 * pipeline_depth + 3 batch, più le righe che il writer accumula per
+        completare un row group (al massimo options.parquet.row_group_bytes). Con profile=True il Mapper misura ogni
+        regola e fase; il quinto elemento del risultato è il profilo serializzato (None altrimenti), il sesto
+        gli shard scritti con il loro checksum (vuoto se l'unità non ha righe o è fallita), il settimo le righe
+        scartate nei dead letter, l'ultimo il report di validazione serializzato (None senza validazione).
+        Con run_key e source (impronta del file sorgente) lo shard li registra nel footer.
+        """
+        file_path = unit.file_path
+        if self.compile_error is not None:
+            print(f"Errore durante l'elaborazione del file {file_path}: {self.compile_error}")
+            return (os.path.basename(file_path), False, 0, self.compile_error, None, [], 0, None)
+        row_profile = MappingProfile() if self.options.profile else None
+        validation = ValidationReport(self.options.validate_every) if self.validator is not None else None
+        parquet_filepath = os.path.join(self.output_path, unit.output_name())
+        processed_count = 0
+        metadata = shard_metadata(self.run_key, unit, source) if self.run_key and source else None
+        dead = DeadLetterWriter(self.output_path, unit.output_name(), file_path, self.dead_letters) if self.dead_letters else None
+        output = _ParquetStream(parquet_filepath, metadata, self.output_schema, self.options.parquet, dead)
+        # Tre stadi sovrapposti: un thread legge e decodifica, questo thread mappa, un thread scrive
+        writer = BackgroundWriter(self.options.pipeline_depth)
+        batches = prefetch(self._read_batches(unit), self.options.pipeline_depth)
+        try:
+            for batch in batches:
+                rows, offsets = batch.rows, batch.offsets
+                rejected = list(batch.rejected)
+                if self.arrow_mapper is not None and isinstance(rows, pa.RecordBatch):
+                    try:
+                        # Motore colonnare: il mapping lavora sui RecordBatch senza passare da dict Python
+                        table = pa.Table.from_batches([self.arrow_mapper.map_batch(rows)])
+                    except Exception:
+                        if dead is None:
+                            raise
+                        table = None
+                    if table is not None:
+                        if validation is not None:
+                            self._validate(validation, table, offsets, file_path, row_profile)
+                        writer.submit(output.write_table, table, offsets)
+                    else:
+                        # Il batch si rimappa riga per riga per isolare le righe che falliscono
+                        mapped, offsets, failed = self._map_rows(row_views(rows), offsets, row_profile)
+                        rejected.extend(failed)
+                        if validation is not None:
+                            self._validate(validation, mapped, offsets, file_path, row_profile)
+                        writer.submit(output.write_rows, mapped, offsets)
+                else:
+                    # Dai RecordBatch viste lazy sulle righe: si convertono in Python solo i valori letti dal mapping
+                    samples = row_views(rows) if isinstance(rows, pa.RecordBatch) else rows
+                    mapped, offsets, failed = self._map_rows(samples, offsets, row_profile)
+                    rejected.extend(failed)
+                    if validation is not None:
+                        self._validate(validation, mapped, offsets, file_path, row_profile)
+                    writer.submit(output.write_rows, mapped, offsets)
+                if rejected:
+                    writer.submit(dead.write, rejected)
+                processed_count += len(offsets)
+            writer.close()
+            outputs = [(os.path.basename(path), file_checksum(path)) for path in output.close()]
+            errors = 0
+            if dead is not None:
+                dead.close()
+                errors = dead.count
+            # Le righe non conformi allo schema vengono scartate dallo scrittore, dopo essere state contate
+            processed_count -= output.rejected
+            return (os.path.basename(file_path), True, processed_count, None, row_profile.to_dict() if row_profile else None, outputs, errors,
+                    validation.to_dict() if validation else None)
+        except Exception as e:
+            # Nessun output parziale: il file si considera non elaborato
+            batches.close()
+            writer.abort()
+            output.abort()
+            if dead is not None:
+                dead.abort()
+            print(f"Errore durante l'elaborazione del file {file_path}: {e}")
+            return (os.path.basename(file_path), False, processed_count, e, row_profile.to_dict() if row_profile else None, [], 0, None)
+
+    def _map_rows(self, samples: Iterable[Any], offsets: Sequence[int], profile: Optional[MappingProfile]) -> Tuple[List[Dict[str, Any]], Sequence[int], List[DeadLetter]]:
+        """Righe mappate con i loro offset; senza dead letter un'eccezione del Mapper fa fallire l'unità"""
+        if self.dead_letters is None:
+            return [self.plan.apply(sample, profile) for sample in samples], offsets, []
+        mapped: List[Dict[str, Any]] = []
+        kept: List[int] = []
+        rejected: List[DeadLetter] = []
+        for sample, offset in zip(samples, offsets):
+            try:
+                mapped.append(self.plan.apply(sample, profile))
+                kept.append(offset)
+            except Exception as e:
+                rejected.append(DeadLetter(offset, "mapping", error_message(e), record_snippet(sample)))
+        return mapped, kept, rejected
+
+    def _validate(self, report: ValidationReport, rows: Any, offsets: Sequence[int], file_path: str, profile: Optional[MappingProfile]) -> None:
+        """Valida le righe campionate da report tra quelle mappate (lista di dict o tabella di ArrowMapper)"""
+        picks = report.sample(len(offsets))
+        if not picks:
+            return
+        if isinstance(rows, pa.Table):
+            # Dalla tabella si convertono in Python solo le righe campionate
+            sampled = rows.to_pylist() if len(picks) == rows.num_rows else rows.take(list(picks)).to_pylist()
+        else:
+            sampled = [rows[i] for i in picks]
+        picked_offsets = [offsets[i] for i in picks]
+        if profile is not None:
+            with profile.measure("validation"):
+                report.check(self.validator, sampled, picked_offsets, file_path)
+        else:
+            report.check(self.validator, sampled, picked_offsets, file_path)
+
+    def _read_batches(self, unit: WorkUnit) -> Iterator[SourceBatch]:
+        """
+        Batch sorgente dell'unità dal reader del suo formato (vedi mappings.readers): RecordBatch per
+        parquet e CSV, liste di dict (o RecordBatch col motore arrow) per i JSON, con gli offset delle righe
+        """
+        reader = reader_for(unit.file_path)
+        if reader is None:
+            raise ValueError(f"Formato di input non supportato: {unit.file_path}")
+        yield from reader.read(unit, ReadRequest(self.options.batch_size, self.source_paths, self.arrow_mapper is not None, self.dead_letters is not None))
+
+
+# Worker del processo corrente, creato dall'initializer del pool
+_worker: Optional[_MappingWorker] = None
+
+
+def _init_worker(mapper_mapping: List, dst_schema: Dict[str, Any], output_path: str, options: MappingOptions, run_key: Optional[str]) -> None:
+    global _worker
+    _worker = _MappingWorker(mapper_mapping, dst_schema, output_path, options, run_key)
+
+
+def _process_in_worker(unit: WorkUnit, source: Optional[Dict[str, Any]]) -> UnitResult:
+    return _worker.process(unit, source)
+
+
+def _run_process_pool(files_to_process: List[str], mapping: List, dst_schema: Dict[str, Any], output_path: str, options: MappingOptions, progress_callback: Callable[[float], None], profile: Optional[MappingProfile] = None, schedule: Optional[ScheduleReport] = None, manifest: Optional[RunManifest] = None, validation: Optional[ValidationReport] = None) -> Tuple[int, int, Dict[str, int]]:
+    """
+    Mappa i file in parallelo, un task per unità di lavoro (i file grandi sono divisi in più unità);
+    restituisce (file riusciti, campioni elaborati, righe scartate nei dead letter per file sorgente con scarti).
+    Un file è riuscito se lo sono tutte le sue unità.
+    Le unità partono dalla più costosa e ne restano in volo quante sono i worker: ogni worker che si
+    libera prende la più grande rimasta, così i file grossi non finiscono in coda all'esecuzione.
+    Se profile è passato, i profili dei worker (options.profile) vengono sommati in profile;
+    se schedule è passato, vi si registrano costo stimato e durata di ogni unità; se validation è passato,
+    vi si sommano i report delle unità riuscite (options.validate_every).
+    Con un manifest ogni unità riuscita vi viene registrata con l'impronta del suo file sorgente;
+    se manifest.resume, prima si riconciliano gli shard esistenti e le unità ancora valide vengono saltate.
+    """
+    successful_files = 0
+    total_processed_samples = 0
+    file_errors: Dict[str, int] = {}
+    # Anche senza file la riconciliazione serve: elimina gli shard dei file passati ad altri motori
+    units = plan_work_units(files_to_process, options.unit_bytes)
+    sources: Dict[str, Dict[str, Any]] = {}
+    if manifest is not None:
+        # Impronte prese prima di leggere i file: una sorgente modificata durante l'esecuzione verrà rifatta
+        sources = manifest.sources(files_to_process)
+        if manifest.resume:
+            manifest.reconcile(units, sources)
+        remaining = []
+        for unit in units:
+            rows = manifest.completed_rows(unit)
+            if rows is None:
+                remaining.append(unit)
+            else:
+                manifest.skipped_units += 1
+                total_processed_samples += rows
+                errors = manifest.completed_errors(unit)
+                if errors:
+                    file_errors[unit.file_path] = file_errors.get(unit.file_path, 0) + errors
+        units = remaining
+    if not units:
+        return len(files_to_process), total_processed_samples, file_errors
+    scheduled = lpt_order(units)
+    pending = iter(scheduled)
+    completed_units = 0
+    workers = os.cpu_count() or 1
+    failed_files = set()
+    # Mapping e schema arrivano a ogni worker una sola volta; i task trasportano solo il WorkUnit
+    initargs = (mapping, dst_schema, output_path, options, manifest.key if manifest is not None else None)
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=initargs) as executor:
+        running: Dict[Future, Tuple[WorkUnit, float, float]] = {}
+
+        def submit_next() -> None:
+            for unit, cost in islice(pending, 1):
+                future = executor.submit(_process_in_worker, unit, sources.get(unit.file_path))
+                running[future] = (unit, cost, time.perf_counter())
+
+        for _ in range(workers):
+            submit_next()
+        while running:
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                unit, cost, submitted = running.pop(future)
+                submit_next()
+                filename, success, processed_count, error, file_profile, outputs, errors, file_validation = future.result()
+                completed_units += 1
+                progress_callback(completed_units / len(scheduled))
+                if schedule is not None:
+                    schedule.record(unit, cost, time.perf_counter() - submitted)
+                if profile is not None and file_profile is not None:
+                    profile.merge(MappingProfile.from_dict(file_profile))
+                total_processed_samples += processed_count if success else 0
+                if success and manifest is not None:
+                    manifest.record(unit, processed_count, outputs, sources[unit.file_path], errors)
+                if success and errors:
+                    file_errors[unit.file_path] = file_errors.get(unit.file_path, 0) + errors
+                if success and validation is not None and file_validation is not None:
+                    validation.merge(ValidationReport.from_dict(file_validation))
+                if not success:
+                    failed_files.add(unit.file_path)
+                    print(f"Elaborazione del file {filename} fallita: {error}")
+    successful_files = len(files_to_process) - len(failed_files)
+    return successful_files, total_processed_samples, file_errors
+
+
+def _run_duckdb_mapping(files_to_process: List[str], mapping: List, dst_schema: Dict[str, Any], output_path: str, options: MappingOptions, progress_callback: Callable[[float], None], profile: Optional[MappingProfile] = None, schedule: Optional[ScheduleReport] = None, manifest: Optional[RunManifest] = None, validation: Optional[ValidationReport] = None) -> Tuple[int, int, Dict[str, int]]:
+    """
+    Un solo COPY DuckDB per tutti i file parquet, uno per tutti i file JSON Lines e uno per i file
+    con un unico array JSON. I file di un gruppo che il compilatore SQL non sa esprimere, i CSV e i JSON
+    compressi con codec diversi da gzip passano dal Mapper in parallelo.
+    Un COPY è tutto o niente: se fallisce (es. per una riga non valida) e dead_letters è impostato,
+    i file del gruppo passano dal Mapper, che scarta solo le righe non valide.
+    La validazione in linea riguarda solo le righe mappate dal Mapper: quelle dei COPY non passano da Python.
+    """
+    duckdb_mapper = DuckDBMapper(mapping, dst_schema)
+    # read_json di DuckDB legge JSON non compressi o gzip; gli altri formati passano dal Mapper
+    json_files = [f for f in files_to_process if reader_for(f).name in ("jsonl", "json") and compression_of(f) in (None, ".gz")]
+    arrays = [f for f in json_files if reader_for(f).name == "json" and is_json_array(f)]
+    groups = {
+        "parquet": [f for f in files_to_process if f.endswith('.parquet')],
+        "jsonl": [f for f in json_files if f not in arrays],
+        "json_array": arrays,
+    }
+    successful_files = 0
+    total_processed_samples = 0
+    fallback_files = [f for f in files_to_process if not f.endswith('.parquet') and f not in json_files]
+    sources = manifest.sources(files_to_process) if manifest is not None else {}
+    for i, (group, files) in enumerate(groups.items()):
+        output_file = os.path.join(output_path, f"{group}_mapped_duckdb.parquet")
+        # L'output di un'esecuzione precedente vale solo se il COPY di questa lo riscrive
+        if os.path.exists(output_file) and read_shard_metadata(output_file) is not None:
+            os.remove(output_file)
+        if not files:
+            continue
+        metadata = group_metadata(manifest.key, group, files, sources) if manifest is not None else None
+        try:
+            written = duckdb_mapper.copy_files(files, output_file, options=options.parquet, metadata=metadata)
+        except Exception as e:
+            print(f"Elaborazione DuckDB dei file {group} fallita: {e}")
+            if options.dead_letters is not None:
+                # Il COPY è tutto o niente: il Mapper scarta solo le righe non valide
+                fallback_files.extend(files)
+            continue
+        if written is None:
+            fallback_files.extend(files)
+            continue
+        successful_files += len(files)
+        total_processed_samples += written
+        progress_callback((i + 1) / len(groups))
+
+    fallback_successful, fallback_samples, file_errors = _run_process_pool(fallback_files, mapping, dst_schema, output_path, options._replace(engine="python"), progress_callback, profile, schedule, manifest, validation)
+    return successful_files + fallback_successful, total_processed_samples + fallback_samples, file_errors
+
+
+def run_parallel_mapping(input_path: str, output_path: str, mapping: List, dst_schema: Dict[str, Any], progress_callback: Callable[[float], None], options: MappingOptions = MappingOptions()) -> Dict[str, Any]:
+    """Mappa in parallelo i file di input_path in shard parquet in output_path e restituisce il riepilogo dell'esecuzione"""
+    options.check()
     files_to_process = parse_input_path(input_path)
     if not files_to_process:
         return {"total_files": 0, "successful_files": 0, "total_processed_samples": 0}
     os.makedirs(output_path, exist_ok=True)
 
-    with ProcessPoolExecutor(max_workers=os.cpu_count()) as executor:
-        futures = {
-            executor.submit(process_file, file, mapping, dst_schema, output_path, idx): file
-            for idx, file in enumerate(files_to_process)
-        }
-        total_files = len(files_to_process)
-        successful_files = 0
-        total_processed_samples = 0
-        for i, future in enumerate(as_completed(futures)):
-            filename, success, processed_count, error = future.result()
-            progress_callback((i + 1) / total_files)
-            if success:
-                successful_files += 1
-                total_processed_samples += processed_count
-            else:
-                print(f"Elaborazione del file {filename} fallita: {error}")
-        return {
-            "total_files": total_files,
-            "successful_files": successful_files,
-            "total_processed_samples": total_processed_samples,
-        }
-
+    mapping_profile = MappingProfile() if options.profile else None
+    validation = ValidationReport(options.validate_every) if options.validate_every > 0 else None
+    schedule = ScheduleReport(os.cpu_count() or 1)
+    manifest = RunManifest(output_path, run_key(mapping, dst_schema, options.engine, options.unit_bytes), resume=options.resume, hash_sources=options.hash_sources)
+    run = _run_duckdb_mapping if options.engine == "duckdb" else _run_process_pool
+    successful_files, total_processed_samples, file_errors = run(files_to_process, mapping, dst_schema, output_path, options, progress_callback, mapping_profile, schedule, manifest, validation)
+    schedule.finish()
+    results: Dict[str, Any] = {
+        "total_files": len(files_to_process),
+        "successful_files": successful_files,
+        "total_processed_samples": total_processed_samples,
+        "skipped_units": manifest.skipped_units,
+        "removed_shards": manifest.removed_shards,
+        "schedule": schedule.to_dict(),
+        "dead_letter_rows": sum(file_errors.values()),
+        "file_errors": dict(sorted(file_errors.items())),
+    }
+    if file_errors:
+        results["dead_letters_path"] = os.path.join(output_path, DEAD_LETTER_DIRNAME)
+    if validation is not None:
+        results["validation"] = validation.to_dict()
+    if mapping_profile is not None:
+        report_path = os.path.join(output_path, MAPPING_PROFILE_FILENAME)
+        mapping_profile.write_json(report_path)
+        results["profile_report"] = report_path
+    return results
@@ -0,0 +1,184 @@
+import os
+import json
+import pyarrow as pa
+import pyarrow.parquet as pq
+from typing import Dict, List, Any, Callable, NamedTuple, Optional, Union
+
+# File di output attorno ai 128MB compressi: abbastanza grandi per le scansioni DuckDB,
+# abbastanza piccoli da distribuire il caricamento tra più worker
+DEFAULT_TARGET_FILE_BYTES = 128 * 1024 * 1024
+DEFAULT_ROW_GROUP_ROWS = 100_000
+# Tetto della memoria (in Arrow, non compressa) delle righe accumulate per completare un row group:
+# con righe larghe il row group si chiude prima di arrivare a row_group_rows
+DEFAULT_ROW_GROUP_BYTES = 64 * 1024 * 1024
+PARQUET_CODECS = ("zstd", "snappy", "gzip", "brotli", "lz4", "none")
+# Chiave dei metadati key-value con la posizione del file nella sequenza scritta dal RollingParquetWriter
+ROLL_METADATA_KEY = b"etl_agent.roll"
+
+
+class ParquetOptions(NamedTuple):
+    """
+    Impostazioni dei file parquet scritti dalla pipeline di mapping e dal salvataggio delle query.
+    target_file_bytes None scrive un solo file; un row group ha row_group_rows righe, o meno se le righe
+    accumulate superano row_group_bytes (None: nessun limite); use_dictionary è un bool per tutte le colonne
+    oppure l'elenco delle colonne da codificare a dizionario.
+    """
+    target_file_bytes: Optional[int] = DEFAULT_TARGET_FILE_BYTES
+    row_group_rows: int = DEFAULT_ROW_GROUP_ROWS
+    compression: str = "zstd"
+    compression_level: Optional[int] = None
+    use_dictionary: Union[bool, List[str]] = True
+    row_group_bytes: Optional[int] = DEFAULT_ROW_GROUP_BYTES
+
+    def writer_kwargs(self) -> Dict[str, Any]:
+        return {
+            "compression": self.compression,
+            "compression_level": self.compression_level,
+            "use_dictionary": self.use_dictionary,
+        }
+
+
+def rolled_path(path: str, index: int) -> str:
+    """
+    path per il primo file, poi <nome>.r00001.parquet, <nome>.r00002.parquet...:
+    ordinati per nome i file seguono l'ordine di scrittura.
+    """
+    if index == 0:
+        return path
+    stem, extension = os.path.splitext(path)
+    return f"{stem}.r{index:05d}{extension}"
+
+
+def read_roll_metadata(path: str) -> Optional[Dict[str, Any]]:
+    """Posizione del file nella sua sequenza ({"index", "last"}), None se non è stato scritto a rotazione"""
+    metadata = pq.ParquetFile(path).metadata.metadata or {}
+    value = metadata.get(ROLL_METADATA_KEY)
+    return json.loads(value) if value is not None else None
+
+
+class RollingParquetWriter:
+    """
+    Scrive tabelle con lo stesso schema in una sequenza di file, passando al successivo quando quello
+    corrente raggiunge options.target_file_bytes su disco (quindi già compressi). Le righe vengono
+    accumulate fino a options.row_group_rows, così i row group hanno la dimensione voluta a prescindere
+    da quella dei batch in ingresso; il buffer non supera però options.row_group_bytes in memoria Arrow
+    (più l'ultimo batch ricevuto), oltre i quali le righe accumulate diventano subito un row group.
+
+    I file vengono scritti come <path>.partial e rinominati tutti insieme da close(); abort() li scarta.
+    Ogni footer registra in ROLL_METADATA_KEY l'indice del file e se è l'ultimo della sequenza, così
+    chi trova i file su disco può capire se la sequenza è completa.
+    """
+
+    def __init__(self, path_for: Callable[[int], str], schema: pa.Schema, options: ParquetOptions = ParquetOptions(),
+                 metadata: Optional[Dict[bytes, bytes]] = None):
+        self.path_for = path_for
+        self.schema = schema.with_metadata(metadata) if metadata else schema
+        self.options = options
+        self.partial_paths: List[str] = []
+        self.num_rows = 0
+        self._writer: Optional[pq.ParquetWriter] = None
+        # Il file corrente ha raggiunto il target: si chiude solo quando arriva altro da scrivere,
+        # così l'ultimo file della sequenza sa di esserlo
+        self._full = False
+        self._pending: List[pa.Table] = []
+        self._pending_rows = 0
+        self._pending_bytes = 0
+
+    def write_table(self, table: pa.Table) -> None:
+        if table.num_rows == 0:
+            return
+        self._pending.append(table)
+        self._pending_rows += table.num_rows
+        self._pending_bytes += table.nbytes
+        self.num_rows += table.num_rows
+        limit = self.options.row_group_bytes
+        if limit is not None and self._pending_bytes >= limit:
+            self._flush(final=True)
+        elif self._pending_rows >= self.options.row_group_rows:
+            self._flush(final=False)
+
+    def _flush(self, final: bool) -> None:
+        """Scrive i row group pieni accumulati (e con final anche l'ultimo parziale)"""
+        if not self._pending:
+            return
+        pending = pa.concat_tables(self._pending)
+        row_group_rows = self.options.row_group_rows
+        written = 0
+        while pending.num_rows - written >= row_group_rows or (final and written < pending.num_rows):
+            self._write_row_group(pending.slice(written, row_group_rows))
+            written += row_group_rows
+        rest = pending.slice(written)
+        self._pending = [rest] if rest.num_rows else []
+        self._pending_rows = rest.num_rows
+        self._pending_bytes = rest.nbytes
+
+    def _write_row_group(self, table: pa.Table) -> None:
+        if self._full:
+            self._close_file(last=False)
+            self._full = False
+        if self._writer is None:
+            path = self.path_for(len(self.partial_paths)) + ".partial"
+            self._writer = pq.ParquetWriter(path, self.schema, **self.options.writer_kwargs())
+            self.partial_paths.append(path)
+        self._writer.write_table(table, row_group_size=table.num_rows)
+        target = self.options.target_file_bytes
+        if target is not None and os.path.getsize(self.partial_paths[-1]) >= target:
+            self._full = True
+
+    def _close_file(self, last: bool) -> None:
+        index = len(self.partial_paths) - 1
+        self._writer.add_key_value_metadata({ROLL_METADATA_KEY: json.dumps({"index": index, "last": last}).encode("utf-8")})
+        self._writer.close()
+        self._writer = None
+
+    def widen(self, schema: pa.Schema) -> None:
+        """Riapre la sequenza con uno schema più largo, ricopiando un batch alla volta le righe già scritte"""
+        if self._writer is not None:
+            self._writer.close()
+            self._writer = None
+        self._full = False
+        previous = []
+        for partial in self.partial_paths:
+            os.replace(partial, partial + ".tmp")
+            previous.append(partial + ".tmp")
+        pending = self._pending
+        self.partial_paths = []
+        self._pending = []
+        self._pending_rows = 0
+        self._pending_bytes = 0
+        self.num_rows = 0
+        self.schema = schema.with_metadata(self.schema.metadata) if self.schema.metadata else schema
+        for path in previous:
+            for batch in pq.ParquetFile(path).iter_batches():
+                self.write_table(pa.Table.from_batches([batch]).cast(schema))
+            os.remove(path)
+        for table in pending:
+            self.write_table(table.cast(schema))
+
+    def close(self) -> List[str]:
+        """Chiude la sequenza e rende definitivi i file; restituisce i loro path (vuoto se nessuna riga)"""
+        self._flush(final=True)
+        if self._writer is not None:
+            self._close_file(last=True)
+            self._full = False
+        paths = []
+        for partial in self.partial_paths:
+            path = partial[:-len(".partial")]
+            os.replace(partial, path)
+            paths.append(path)
+        self.partial_paths = []
+        return paths
+
+    def abort(self) -> None:
+        """Scarta tutti i file della sequenza"""
+        if self._writer is not None:
+            self._writer.close()
+            self._writer = None
+        self._full = False
+        for partial in self.partial_paths:
+            if os.path.exists(partial):
+                os.remove(partial)
+        self.partial_paths = []
+        self._pending = []
+        self._pending_rows = 0
+        self._pending_bytes = 0
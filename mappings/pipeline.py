@@ -0,0 +1,124 @@
+import queue
+import threading
+from typing import Any, Callable, Iterable, Iterator, NamedTuple, Optional
+
+# Batch in coda tra uno stadio e il successivo: oltre si blocca chi produce (backpressure)
+DEFAULT_PIPELINE_DEPTH = 2
+# Intervallo con cui uno stadio bloccato su una coda piena controlla se deve fermarsi
+_POLL_SECONDS = 0.1
+_DONE = object()
+
+
+class _Failure(NamedTuple):
+    error: BaseException
+
+
+def _put(q: queue.Queue, item: Any, stop: threading.Event) -> bool:
+    """put bloccante che rinuncia se stop viene impostato; False se l'elemento non è stato accodato"""
+    while not stop.is_set():
+        try:
+            q.put(item, timeout=_POLL_SECONDS)
+            return True
+        except queue.Full:
+            continue
+    return False
+
+
+def prefetch(iterable: Iterable[Any], depth: int = DEFAULT_PIPELINE_DEPTH) -> Iterator[Any]:
+    """
+    Itera iterable in un thread lettore, tenendo pronti al più depth elementi: decompressione e decodifica
+    (gzip, pyarrow) rilasciano il GIL e si sovrappongono al lavoro di chi consuma. Le eccezioni del
+    lettore vengono rilanciate al consumatore; chiudere il generatore ferma e attende il lettore.
+    Con depth < 1 itera nel thread corrente.
+    """
+    if depth < 1:
+        yield from iterable
+        return
+    items: queue.Queue = queue.Queue(maxsize=depth)
+    stop = threading.Event()
+
+    def read() -> None:
+        iterator = iter(iterable)
+        try:
+            for item in iterator:
+                if not _put(items, item, stop):
+                    return
+            _put(items, _DONE, stop)
+        except BaseException as e:
+            _put(items, _Failure(e), stop)
+        finally:
+            close = getattr(iterator, "close", None)
+            if close is not None:
+                close()
+
+    reader = threading.Thread(target=read, name="mapping-reader", daemon=True)
+    reader.start()
+    try:
+        while True:
+            item = items.get()
+            if item is _DONE:
+                return
+            if isinstance(item, _Failure):
+                raise item.error
+            yield item
+    finally:
+        stop.set()
+        reader.join()
+
+
+class BackgroundWriter:
+    """
+    Esegue le scritture (submit(fn, *args) -> fn(*args)) in un thread scrittore, nell'ordine di invio,
+    con al più depth scritture in attesa: la codifica e la compressione parquet si sovrappongono
+    al mapping del batch successivo. Un errore dello scrittore viene rilanciato dal primo submit()
+    o da close() successivi; abort() scarta le scritture in coda. Con depth < 1 scrive subito.
+    """
+
+    def __init__(self, depth: int = DEFAULT_PIPELINE_DEPTH):
+        self.depth = depth
+        self.error: Optional[BaseException] = None
+        self._discard = False
+        self._tasks: queue.Queue = queue.Queue(maxsize=max(depth, 1))
+        self._thread: Optional[threading.Thread] = None
+        if depth >= 1:
+            self._thread = threading.Thread(target=self._run, name="mapping-writer", daemon=True)
+            self._thread.start()
+
+    def _run(self) -> None:
+        while True:
+            task = self._tasks.get()
+            if task is _DONE:
+                return
+            if self.error is not None or self._discard:
+                # Dopo un errore si continua a svuotare la coda, così submit() non resta bloccato
+                continue
+            fn, args = task
+            try:
+                fn(*args)
+            except BaseException as e:
+                self.error = e
+
+    def submit(self, fn: Callable[..., None], *args: Any) -> None:
+        if self.error is not None:
+            raise self.error
+        if self._thread is None:
+            fn(*args)
+        else:
+            self._tasks.put((fn, args))
+
+    def close(self) -> None:
+        """Attende le scritture in coda e rilancia l'eventuale errore dello scrittore"""
+        if self._thread is not None:
+            self._tasks.put(_DONE)
+            self._thread.join()
+            self._thread = None
+        if self.error is not None:
+            raise self.error
+
+    def abort(self) -> None:
+        """Scarta le scritture non ancora iniziate e attende quella in corso"""
+        self._discard = True
+        if self._thread is not None:
+            self._tasks.put(_DONE)
+            self._thread.join()
+            self._thread = None
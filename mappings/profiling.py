@@ -0,0 +1,91 @@
+import sys
+import json
+import time
+from contextlib import contextmanager
+from typing import Dict, List, Any, Iterator, Tuple
+
+# Fasi misurate: lettura del path sorgente, trasformazione/cast, creazione dei container
+# e scrittura nel target, default dello schema, validazione
+PROFILE_PHASES = ("read", "cast", "containers", "defaults", "validation")
+
+# Etichetta delle fasi che non appartengono a una singola regola del mapping
+WHOLE_ROW = "*"
+
+
+class MappingProfile:
+    """
+    Costo del mapping per (fase, regola): numero di chiamate, tempo cumulato e blocchi di memoria
+    allocati (differenza di sys.getallocatedblocks, quindi al netto delle deallocazioni).
+    Si attiva passando un profilo a MappingPlan.apply; senza profilo il percorso veloce non cambia.
+    """
+
+    def __init__(self):
+        self.stats: Dict[Tuple[str, str], List[float]] = {}
+        self.rows = 0
+
+    @staticmethod
+    def start() -> Tuple[float, int]:
+        return time.perf_counter(), sys.getallocatedblocks()
+
+    def stop(self, phase: str, label: str, started: Tuple[float, int]) -> None:
+        elapsed = time.perf_counter() - started[0]
+        blocks = sys.getallocatedblocks() - started[1]
+        stat = self.stats.get((phase, label))
+        if stat is None:
+            stat = self.stats[(phase, label)] = [0, 0.0, 0]
+        stat[0] += 1
+        stat[1] += elapsed
+        stat[2] += blocks
+
+    @contextmanager
+    def measure(self, phase: str, label: str = WHOLE_ROW) -> Iterator[None]:
+        started = self.start()
+        try:
+            yield
+        finally:
+            self.stop(phase, label, started)
+
+    def merge(self, other: "MappingProfile") -> None:
+        """Somma un altro profilo (es. quello di un worker) in questo"""
+        self.rows += other.rows
+        for key, (calls, seconds, blocks) in other.stats.items():
+            stat = self.stats.setdefault(key, [0, 0.0, 0])
+            stat[0] += calls
+            stat[1] += seconds
+            stat[2] += blocks
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Forma serializzabile (picklable e JSON), usata per riportare il profilo dai worker"""
+        return {
+            "rows": self.rows,
+            "stats": [[phase, label, calls, seconds, blocks] for (phase, label), (calls, seconds, blocks) in self.stats.items()],
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "MappingProfile":
+        profile = cls()
+        profile.rows = data.get("rows", 0)
+        for phase, label, calls, seconds, blocks in data.get("stats", []):
+            profile.stats[(phase, label)] = [calls, seconds, blocks]
+        return profile
+
+    def report(self) -> Dict[str, Any]:
+        """Totali per fase e dettaglio per regola, ordinati per tempo decrescente"""
+        phases: Dict[str, Dict[str, Any]] = {}
+        for (phase, _), (calls, seconds, blocks) in self.stats.items():
+            total = phases.setdefault(phase, {"calls": 0, "seconds": 0.0, "allocated_blocks": 0})
+            total["calls"] += calls
+            total["seconds"] += seconds
+            total["allocated_blocks"] += blocks
+        entries = [
+            {"phase": phase, "entry": label, "calls": calls, "seconds": seconds, "allocated_blocks": blocks}
+            for (phase, label), (calls, seconds, blocks) in self.stats.items()
+        ]
+        entries.sort(key=lambda e: e["seconds"], reverse=True)
+        ordered_phases = {p: phases[p] for p in sorted(phases, key=lambda p: PROFILE_PHASES.index(p) if p in PROFILE_PHASES else len(PROFILE_PHASES))}
+        return {"rows": self.rows, "phases": ordered_phases, "entries": entries}
+
+    def write_json(self, path: str) -> None:
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(self.report(), f, indent=2, ensure_ascii=False)
+
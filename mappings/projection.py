@@ -0,0 +1,70 @@
+import pyarrow as pa
+import pyarrow.parquet as pq
+from typing import List, Optional, Set
+
+from mappings.mapper import Mapper, MappingEntry, PathSegment
+
+# src_field che indicano un valore fisso: la regola non legge nulla dalla sorgente
+_CONSTANT_SOURCES = {"N/A", None, ""}
+
+
+def source_paths(mapping: List[MappingEntry]) -> Optional[List[List[PathSegment]]]:
+    """
+    Path sorgente (in segmenti) letti dal mapping, senza duplicati; None se una regola legge
+    l'intera riga e quindi nessuna colonna può essere scartata.
+    """
+    parser = Mapper()
+    paths: List[List[PathSegment]] = []
+    for entry in mapping:
+        src = entry.get("src_field")
+        if src in _CONSTANT_SOURCES:
+            continue
+        segments = parser._parse_path(src)
+        if not segments:
+            return None
+        if segments not in paths:
+            paths.append(segments)
+    return paths
+
+
+def _element_path(leaves: Set[str], prefix: str, list_type: pa.DataType) -> Optional[str]:
+    """Path parquet degli elementi della lista in prefix (list.element a tre livelli o nome legacy)"""
+    for candidate in (f"{prefix}.list.{list_type.value_field.name}", f"{prefix}.list.element", f"{prefix}.list.item", f"{prefix}.{list_type.value_field.name}"):
+        if candidate in leaves or any(leaf.startswith(candidate + ".") for leaf in leaves):
+            return candidate
+    return None
+
+
+def parquet_columns(parquet_file: pq.ParquetFile, paths: Optional[List[List[PathSegment]]]) -> Optional[List[str]]:
+    """
+    Colonne (path parquet puntati, anche di sottocampi di struct e di elementi di liste) da passare a
+    iter_batches(columns=...) per leggere solo ciò che serve ai path sorgente; None se vanno lette tutte.
+    Un path che esce dallo schema del file legge la parte valida più profonda, così il mapping vede
+    gli stessi valori che vedrebbe sulla riga intera; un path su una colonna assente non legge nulla.
+    """
+    if paths is None:
+        return None
+    schema = parquet_file.schema_arrow
+    leaves = {parquet_file.schema.column(i).path for i in range(parquet_file.metadata.num_columns)}
+    columns: Set[str] = set()
+    for segments in paths:
+        name = segments[0]
+        if not isinstance(name, str) or name == '[]' or schema.get_field_index(name) < 0:
+            continue
+        prefix, arrow_type = name, schema.field(name).type
+        for seg in segments[1:]:
+            if isinstance(seg, str) and seg != '[]':
+                if not pa.types.is_struct(arrow_type) or arrow_type.get_field_index(seg) < 0:
+                    break
+                prefix, arrow_type = f"{prefix}.{seg}", arrow_type.field(seg).type
+            else:
+                if not (pa.types.is_list(arrow_type) or pa.types.is_large_list(arrow_type) or pa.types.is_fixed_size_list(arrow_type)):
+                    break
+                element = _element_path(leaves, prefix, arrow_type)
+                if element is None:
+                    break
+                prefix, arrow_type = element, arrow_type.value_type
+        columns.add(prefix)
+    if all(any(leaf == c or leaf.startswith(c + ".") for c in columns) for leaf in leaves):
+        return None
+    return sorted(columns)
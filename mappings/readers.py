@@ -0,0 +1,174 @@
+import pyarrow as pa
+import pyarrow.parquet as pq
+from itertools import islice
+from typing import Any, Callable, Dict, Iterator, List, NamedTuple, Optional, Sequence, Tuple, Union
+
+from mappings.mapper import PathSegment
+from mappings.work_units import WorkUnit, DEFAULT_UNIT_BYTES, _parquet_units, _byte_range_units
+from mappings.compression import COMPRESSION_EXTENSIONS, compression_of
+from mappings.projection import parquet_columns
+from mappings.jsonl_reader import iter_line_offsets, lines_to_arrow, parse_lines, parse_lines_lenient
+from mappings.json_array_reader import has_record_per_line, is_json_array, iter_array_line_chunks, iter_array_records
+from mappings.csv_reader import iter_csv_batches
+from mappings.dead_letters import DeadLetter
+
+# Batch letto da un'unità: RecordBatch, oppure lista di oggetti Python se Arrow non li rappresenta fedelmente
+Batch = Union[pa.RecordBatch, List[Any]]
+
+
+class ReadRequest(NamedTuple):
+    """
+    Parametri di lettura del worker: righe per batch, path letti dal mapping (None: tutti), RecordBatch
+    preferiti, righe non decodificabili scartate come dead letter invece di far fallire l'unità.
+    """
+    batch_size: int
+    source_paths: Optional[List[List[PathSegment]]] = None
+    arrow: bool = False
+    dead_letters: bool = False
+
+
+class SourceBatch(NamedTuple):
+    """
+    Righe lette da un'unità, con la posizione di ognuna nel file sorgente (offset in byte della riga
+    per i formati a righe, indice del record per gli altri) e le righe scartate dalla decodifica.
+    """
+    rows: Batch
+    offsets: Sequence[int]
+    rejected: List[DeadLetter] = []
+
+
+class SourceReader(NamedTuple):
+    """
+    Formato di input del mapping parallelo, riconosciuto dall'estensione del file.
+    plan(file_path, file_index, unit_bytes) divide il file in unità di lavoro; read(unit, request)
+    ne produce i batch, che il worker mappa allo stesso modo qualunque sia il formato.
+    """
+    name: str
+    extensions: Tuple[str, ...]
+    read: Callable[[WorkUnit, ReadRequest], Iterator[SourceBatch]]
+    plan: Callable[[str, int, int], List[WorkUnit]]
+
+
+_READERS: Dict[str, SourceReader] = {}
+
+
+def register_reader(reader: SourceReader) -> None:
+    """Aggiunge un formato di input (o sostituisce quello con lo stesso nome)"""
+    _READERS[reader.name] = reader
+
+
+def reader_for(file_path: str) -> Optional[SourceReader]:
+    """Il reader con l'estensione più lunga tra quelle che terminano file_path"""
+    best, best_length = None, 0
+    for reader in _READERS.values():
+        for extension in reader.extensions:
+            if file_path.endswith(extension) and len(extension) > best_length:
+                best, best_length = reader, len(extension)
+    return best
+
+
+def supported_extensions() -> Tuple[str, ...]:
+    return tuple(extension for reader in _READERS.values() for extension in reader.extensions)
+
+
+def plan_work_units(files: List[str], unit_bytes: int = DEFAULT_UNIT_BYTES) -> List[WorkUnit]:
+    """
+    Unità di lavoro per i file di input, decise dal reader di ogni file: i parquet grandi si dividono per
+    gruppi di row group, i JSON Lines non compressi per intervalli di byte, come gli array JSON con un
+    record per riga; i file compressi, i CSV e gli array formattati in altro modo restano interi.
+    """
+    units: List[WorkUnit] = []
+    for file_index, file_path in enumerate(files):
+        reader = reader_for(file_path)
+        if reader is None:
+            raise ValueError(f"Formato di input non supportato: {file_path}")
+        units.extend(reader.plan(file_path, file_index, unit_bytes))
+    return units
+
+
+def _with_compression(*extensions: str) -> Tuple[str, ...]:
+    return tuple(extension + compression for extension in extensions for compression in ("",) + COMPRESSION_EXTENSIONS)
+
+
+def _whole_file(file_path: str, file_index: int, unit_bytes: int) -> List[WorkUnit]:
+    return [WorkUnit(file_path, file_index)]
+
+
+def _text_units(file_path: str, file_index: int, unit_bytes: int) -> List[WorkUnit]:
+    # Un file compresso non si può leggere a partire da un offset
+    if compression_of(file_path) is not None:
+        return _whole_file(file_path, file_index, unit_bytes)
+    return _byte_range_units(file_path, file_index, unit_bytes)
+
+
+def _read_parquet(unit: WorkUnit, request: ReadRequest) -> Iterator[SourceBatch]:
+    # Proiezione: si decodificano solo le colonne (e i sottocampi) letti dal mapping
+    parquet_file = pq.ParquetFile(unit.file_path)
+    columns = parquet_columns(parquet_file, request.source_paths)
+    row_groups = list(range(*unit.row_groups)) if unit.row_groups else None
+    position = sum(parquet_file.metadata.row_group(i).num_rows for i in range(unit.row_groups[0])) if unit.row_groups else 0
+    for batch in parquet_file.iter_batches(batch_size=request.batch_size, row_groups=row_groups, columns=columns):
+        yield SourceBatch(batch, range(position, position + batch.num_rows))
+        position += batch.num_rows
+
+
+def _decode_lines(lines: List[bytes], offsets: List[int], request: ReadRequest) -> SourceBatch:
+    if request.arrow:
+        # Motore colonnare: blocchi decodificati da pyarrow.json quando i tipi inferiti sono fedeli
+        batch = lines_to_arrow(lines)
+        if batch is not None:
+            return SourceBatch(batch, offsets)
+    if request.dead_letters:
+        return SourceBatch(*parse_lines_lenient(lines, offsets))
+    return SourceBatch(parse_lines(lines), offsets)
+
+
+def _read_jsonl(unit: WorkUnit, request: ReadRequest) -> Iterator[SourceBatch]:
+    for lines, offsets in iter_line_offsets(unit.file_path, request.batch_size, unit.byte_range):
+        yield _decode_lines(lines, offsets, request)
+
+
+def _json_units(file_path: str, file_index: int, unit_bytes: int) -> List[WorkUnit]:
+    if is_json_array(file_path) and not has_record_per_line(file_path):
+        return _whole_file(file_path, file_index, unit_bytes)
+    return _text_units(file_path, file_index, unit_bytes)
+
+
+def _read_json(unit: WorkUnit, request: ReadRequest) -> Iterator[SourceBatch]:
+    if not is_json_array(unit.file_path):
+        yield from _read_jsonl(unit, request)
+    elif unit.byte_range is not None:
+        # Array con un record per riga: si legge a intervalli di byte come un JSON Lines
+        for lines, offsets in iter_array_line_chunks(unit.file_path, request.batch_size, unit.byte_range):
+            yield _decode_lines(lines, offsets, request)
+    else:
+        # Array intero con il parser incrementale; con i dead letter gli elementi non validi arrivano come DeadLetter
+        records = iter_array_records(unit.file_path, lenient=request.dead_letters)
+        position = 0
+        while True:
+            batch = list(islice(records, request.batch_size))
+            if not batch:
+                return
+            if request.dead_letters:
+                rows, offsets, rejected = [], [], []
+                for index, record in enumerate(batch, position):
+                    if isinstance(record, DeadLetter):
+                        rejected.append(record)
+                    else:
+                        rows.append(record)
+                        offsets.append(index)
+                yield SourceBatch(rows, offsets, rejected)
+            else:
+                yield SourceBatch(batch, range(position, position + len(batch)))
+            position += len(batch)
+
+
+def _read_csv(unit: WorkUnit, request: ReadRequest) -> Iterator[SourceBatch]:
+    for batch, indices, rejected in iter_csv_batches(unit.file_path, request.batch_size, request.source_paths, request.dead_letters):
+        yield SourceBatch(batch, indices, rejected)
+
+
+register_reader(SourceReader("parquet", (".parquet",), _read_parquet, _parquet_units))
+register_reader(SourceReader("jsonl", _with_compression(".jsonl"), _read_jsonl, _text_units))
+register_reader(SourceReader("json", _with_compression(".json"), _read_json, _json_units))
+register_reader(SourceReader("csv", _with_compression(".csv", ".tsv"), _read_csv, _whole_file))
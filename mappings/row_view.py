@@ -0,0 +1,196 @@
+import pyarrow as pa
+from abc import ABC, abstractmethod
+from collections.abc import Mapping, Sequence
+from typing import Any, Dict, Iterator, List, Optional, Union
+
+PathSegment = Union[str, int]
+
+
+class _Column:
+    """
+    Nodo dell'albero delle colonne di un RecordBatch, condiviso da tutte le viste del batch.
+    Figli, offset e validità vengono calcolati alla prima lettura; una colonna scalare viene
+    convertita in Python per intero, ma solo se un path del mapping la raggiunge.
+    """
+    __slots__ = ("arr", "_kind", "_valid", "_children", "_values", "_offsets", "_pylist")
+
+    def __init__(self, arr: pa.Array):
+        if isinstance(arr, pa.ChunkedArray):
+            arr = arr.combine_chunks()
+        t = arr.type
+        self.arr = arr
+        if pa.types.is_struct(t):
+            self._kind = "struct"
+        elif pa.types.is_list(t) or pa.types.is_large_list(t):
+            self._kind = "list"
+        else:
+            self._kind = "leaf"
+        self._valid: Optional[List[bool]] = None
+        self._children: Optional[Dict[str, Optional["_Column"]]] = None
+        self._values: Optional["_Column"] = None
+        self._offsets: Optional[List[int]] = None
+        self._pylist: Optional[List[Any]] = None
+
+    def value(self, index: int) -> Any:
+        """Elemento index: vista per struct e liste, valore Python per il resto"""
+        if self._kind == "leaf":
+            if self._pylist is None:
+                self._pylist = self.arr.to_pylist()
+            return self._pylist[index]
+        if self.arr.null_count:
+            if self._valid is None:
+                self._valid = self.arr.is_valid().to_pylist()
+            if not self._valid[index]:
+                return None
+        if self._kind == "struct":
+            return StructView(self, index)
+        return ListView(self, index)
+
+    def child(self, name: str) -> Optional["_Column"]:
+        if self._children is None:
+            self._children = {}
+        if name not in self._children:
+            field_index = self.arr.type.get_field_index(name)
+            # field() tiene già conto dell'offset della struct
+            self._children[name] = _Column(self.arr.field(field_index)) if field_index >= 0 else None
+        return self._children[name]
+
+    def offsets(self) -> List[int]:
+        if self._offsets is None:
+            # offsets rispetta lo slice dell'array, values no: gli offset sono assoluti in values
+            self._offsets = self.arr.offsets.to_pylist()
+            self._values = _Column(self.arr.values)
+        return self._offsets
+
+
+class LazyView(ABC):
+    """
+    Vista in sola lettura su un valore annidato di un RecordBatch. Navigare la vista non copia
+    nulla: i valori diventano oggetti Python solo quando un path del mapping li raggiunge.
+    """
+    __slots__ = ()
+
+    @abstractmethod
+    def step(self, seg: PathSegment) -> Any:
+        """Figlio raggiunto da seg (vista, valore Python o None), come un passo di _get_by_segments"""
+
+    @abstractmethod
+    def materialize(self) -> Any:
+        """Valore Python completo, identico a quello prodotto da to_pylist"""
+
+
+def _plain(value: Any) -> Any:
+    return value.materialize() if isinstance(value, LazyView) else value
+
+
+class StructView(LazyView, Mapping):
+    __slots__ = ("_col", "_index")
+
+    def __init__(self, col: _Column, index: int):
+        self._col = col
+        self._index = index
+
+    def step(self, seg: PathSegment) -> Any:
+        if not isinstance(seg, str) or seg == '[]':
+            return None
+        child = self._col.child(seg)
+        return child.value(self._index) if child is not None else None
+
+    def materialize(self) -> Any:
+        return self._col.arr[self._index].as_py()
+
+    def __getitem__(self, key: str) -> Any:
+        if self._col.child(key) is None:
+            raise KeyError(key)
+        return _plain(self.step(key))
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self._col.arr.type.names)
+
+    def __len__(self) -> int:
+        return self._col.arr.type.num_fields
+
+
+class ListView(LazyView, Sequence):
+    __slots__ = ("_col", "_index", "_start", "_length")
+
+    def __init__(self, col: _Column, index: int):
+        offsets = col.offsets()
+        self._col = col
+        self._index = index
+        self._start = offsets[index]
+        self._length = offsets[index + 1] - self._start
+
+    def step(self, seg: PathSegment) -> Any:
+        if not isinstance(seg, int) or not 0 <= seg < self._length:
+            return None
+        return self._col._values.value(self._start + seg)
+
+    def materialize(self) -> Any:
+        return self._col.arr[self._index].as_py()
+
+    def items(self) -> List[Any]:
+        """Elementi della lista come viste (o valori Python per i tipi scalari)"""
+        values = self._col._values
+        return [values.value(self._start + i) for i in range(self._length)]
+
+    def __getitem__(self, i: Any) -> Any:
+        if isinstance(i, slice):
+            return [self[j] for j in range(*i.indices(self._length))]
+        if i < 0:
+            i += self._length
+        if not 0 <= i < self._length:
+            raise IndexError(i)
+        return _plain(self.step(i))
+
+    def __len__(self) -> int:
+        return self._length
+
+
+class _BatchColumns:
+    """Colonne top-level del batch, avvolte in _Column solo alla prima lettura"""
+    __slots__ = ("_batch", "names", "_columns")
+
+    def __init__(self, batch: pa.RecordBatch):
+        self._batch = batch
+        self.names = {name: i for i, name in enumerate(batch.schema.names)}
+        self._columns: Dict[str, _Column] = {}
+
+    def get(self, name: str) -> Optional[_Column]:
+        column = self._columns.get(name)
+        if column is None and name in self.names:
+            column = self._columns[name] = _Column(self._batch.column(self.names[name]))
+        return column
+
+
+class RowView(LazyView, Mapping):
+    """Riga index di un RecordBatch vista come dict, navigabile da Mapper._get_by_path"""
+    __slots__ = ("_columns", "_index")
+
+    def __init__(self, columns: _BatchColumns, index: int):
+        self._columns = columns
+        self._index = index
+
+    def step(self, seg: PathSegment) -> Any:
+        column = self._columns.get(seg) if isinstance(seg, str) else None
+        return column.value(self._index) if column is not None else None
+
+    def materialize(self) -> Any:
+        return {name: self[name] for name in self._columns.names}
+
+    def __getitem__(self, key: str) -> Any:
+        if key not in self._columns.names:
+            raise KeyError(key)
+        return _plain(self.step(key))
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self._columns.names)
+
+    def __len__(self) -> int:
+        return len(self._columns.names)
+
+
+def row_views(batch: pa.RecordBatch) -> List[RowView]:
+    """Una vista per riga del batch, senza convertire le colonne in oggetti Python"""
+    columns = _BatchColumns(batch)
+    return [RowView(columns, i) for i in range(batch.num_rows)]
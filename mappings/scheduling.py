@@ -0,0 +1,95 @@
+import os
+import time
+import heapq
+import pyarrow.parquet as pq
+from typing import Dict, List, Any, Tuple
+
+from mappings.compression import COMPRESSION_RATIOS, compression_of, open_source
+from mappings.work_units import WorkUnit
+
+# Costo fisso per riga (in byte equivalenti): il Mapper paga per ogni riga anche se è piccola
+ROW_COST_BYTES = 2048
+# Byte letti dall'inizio di un file di testo (JSON, CSV) per stimare la lunghezza media delle righe
+LINE_SAMPLE_BYTES = 64 * 1024
+
+
+def _average_line_bytes(file_path: str) -> float:
+    try:
+        with open_source(file_path) as f:
+            sample = f.read(LINE_SAMPLE_BYTES)
+    except Exception:
+        # File illeggibile o decompressione fallita: l'errore vero emerge dal worker
+        return float(LINE_SAMPLE_BYTES)
+    lines = sample.count(b"\n")
+    return len(sample) / lines if lines else float(max(len(sample), 1))
+
+
+def estimate_cost(unit: WorkUnit) -> float:
+    """
+    Costo stimato di un'unità di lavoro in byte equivalenti: per i parquet dimensione non compressa
+    e righe dal footer, per JSON e CSV la dimensione del testo (scalata per i file compressi) e le righe
+    stimate dalla lunghezza media di quelle iniziali.
+    """
+    if unit.file_path.endswith('.parquet'):
+        metadata = pq.ParquetFile(unit.file_path).metadata
+        row_groups = range(*unit.row_groups) if unit.row_groups else range(metadata.num_row_groups)
+        cost = 0.0
+        for i in row_groups:
+            row_group = metadata.row_group(i)
+            cost += row_group.total_byte_size + row_group.num_rows * ROW_COST_BYTES
+        return cost
+    if unit.byte_range is not None:
+        size = float(unit.byte_range[1] - unit.byte_range[0])
+    else:
+        size = float(os.path.getsize(unit.file_path))
+        size *= COMPRESSION_RATIOS.get(compression_of(unit.file_path), 1.0)
+    return size + size / _average_line_bytes(unit.file_path) * ROW_COST_BYTES
+
+
+def lpt_order(units: List[WorkUnit]) -> List[Tuple[WorkUnit, float]]:
+    """Unità con il loro costo stimato, dalla più costosa (Longest Processing Time first)"""
+    costed = [(unit, estimate_cost(unit)) for unit in units]
+    costed.sort(key=lambda item: item[1], reverse=True)
+    return costed
+
+
+def simulate_makespan(durations: List[float], workers: int) -> float:
+    """Tempo di completamento assegnando le durate, nell'ordine dato, al primo worker libero"""
+    finish = [0.0] * max(1, min(workers, len(durations)))
+    for duration in durations:
+        heapq.heapreplace(finish, finish[0] + duration)
+    return max(finish)
+
+
+class ScheduleReport:
+    """
+    Confronto tra stima e realtà dello scheduling: per ogni unità il costo stimato e il tempo misurato.
+    fitted_seconds non è una previsione: converte i costi in secondi a posteriori, con il throughput medio
+    osservato nella stessa esecuzione, e ne simula il makespan. Lo scarto da actual_seconds misura quindi
+    la qualità della stima relativa (quella che decide l'ordine LPT), non della scala.
+    """
+
+    def __init__(self, workers: int):
+        self.workers = workers
+        self.units: List[Dict[str, Any]] = []
+        self._started = time.perf_counter()
+        self._wall_seconds = 0.0
+
+    def record(self, unit: WorkUnit, cost: float, seconds: float) -> None:
+        self.units.append({"unit": unit.output_name(), "estimated_cost": cost, "seconds": seconds})
+
+    def finish(self) -> None:
+        self._wall_seconds = time.perf_counter() - self._started
+
+    def to_dict(self) -> Dict[str, Any]:
+        total_cost = sum(u["estimated_cost"] for u in self.units)
+        total_seconds = sum(u["seconds"] for u in self.units)
+        seconds_per_cost = total_seconds / total_cost if total_cost else 0.0
+        ordered = sorted(self.units, key=lambda u: u["estimated_cost"], reverse=True)
+        units = [dict(u, fitted_seconds=u["estimated_cost"] * seconds_per_cost) for u in ordered]
+        return {
+            "workers": self.workers,
+            "fitted_seconds": simulate_makespan([u["fitted_seconds"] for u in units], self.workers),
+            "actual_seconds": self._wall_seconds,
+            "units": units,
+        }
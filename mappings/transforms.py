@@ -0,0 +1,127 @@
+import numpy as np
+import pyarrow as pa
+import pyarrow.compute as pc
+from typing import Any, Callable, List, NamedTuple, Optional
+
+
+class Transform(NamedTuple):
+    """
+    Trasformazione registrabile nel Mapper: fn lavora su un singolo valore (motore riga per riga),
+    batch sull'intero pa.Array della colonna (motori Arrow e DuckDB). batch riceve solo array
+    della stessa lunghezza dell'input e deve restituire un array lungo uguale; i null in input
+    restano null in output a prescindere da cosa restituisce.
+    """
+    fn: Callable[[Any], Any]
+    batch: Optional[Callable[[pa.Array], pa.Array]] = None
+
+
+def constant(value: Any) -> Transform:
+    """Valore fisso per ogni riga"""
+    value_type = pa.scalar(value).type
+    return Transform(lambda _: value, lambda arr: pa.array([value] * len(arr), type=value_type))
+
+
+def identity() -> Transform:
+    return Transform(lambda src: src, lambda arr: arr)
+
+
+def lookup(table: dict, default: Any = None) -> Transform:
+    """Enum mapping riusabile: valori non presenti in table diventano default"""
+    keys = list(table)
+    values = pa.array([table[k] for k in keys] + [default])
+
+    def batch(arr: pa.Array) -> pa.Array:
+        positions = pc.index_in(arr, value_set=pa.array(keys, type=arr.type))
+        return values.take(pc.fill_null(positions, len(keys)))
+
+    return Transform(lambda src: table.get(src, default), batch)
+
+
+def cast_to(target_type: pa.DataType) -> Transform:
+    """Cast Arrow (stesse regole di pyarrow.compute.cast) anche sul singolo valore"""
+    def fn(src: Any) -> Any:
+        return pa.array([src]).cast(target_type)[0].as_py()
+
+    return Transform(fn, lambda arr: arr.cast(target_type))
+
+
+def normalize_string(lower: bool = False, upper: bool = False, strip: bool = False) -> Transform:
+    """Normalizzazione di stringhe: trim degli spazi e/o cambio di maiuscole"""
+    def fn(src: Any) -> Any:
+        if not isinstance(src, str):
+            return src
+        if strip:
+            src = src.strip()
+        if lower:
+            src = src.lower()
+        if upper:
+            src = src.upper()
+        return src
+
+    def batch(arr: pa.Array) -> pa.Array:
+        if not (pa.types.is_string(arr.type) or pa.types.is_large_string(arr.type)):
+            return arr
+        if strip:
+            arr = pc.utf8_trim_whitespace(arr)
+        if lower:
+            arr = pc.utf8_lower(arr)
+        if upper:
+            arr = pc.utf8_upper(arr)
+        return arr
+
+    return Transform(fn, batch)
+
+
+def concat_fields(fields: List[str], separator: str = " ") -> Transform:
+    """
+    Concatena i campi indicati di un oggetto sorgente (src_field punta all'oggetto).
+    I campi mancanti o null vengono saltati, come fa str.join sui soli valori presenti.
+    """
+    def fn(src: Any) -> Any:
+        if not isinstance(src, dict):
+            return None
+        return separator.join(str(src[f]) for f in fields if src.get(f) is not None)
+
+    def batch(arr: pa.Array) -> pa.Array:
+        if not pa.types.is_struct(arr.type):
+            return pa.nulls(len(arr), pa.string())
+        parts = []
+        for f in fields:
+            index = arr.type.get_field_index(f)
+            if index < 0:
+                continue
+            part = pc.struct_field(arr, [index])
+            if pa.types.is_boolean(part.type):
+                part = pc.if_else(part, "True", "False")
+            elif pa.types.is_floating(part.type):
+                # Arrow scrive 1.0 come "1", str() come "1.0"
+                raise ValueError(f"concat_fields su campo float '{f}'")
+            elif not (pa.types.is_string(part.type) or pa.types.is_large_string(part.type)):
+                part = part.cast(pa.string())
+            parts.append(part)
+        if not parts:
+            return pa.array([""] * len(arr), type=pa.string())
+        # Una lista per riga con i soli valori presenti, poi binary_join: binary_join_element_wise
+        # con null_handling="skip" perde le righe in cui tutti i campi sono null
+        n, k = len(arr), len(parts)
+        values = pa.concat_arrays([p.cast(pa.string()) for p in parts]).take(pa.array(np.arange(n * k).reshape(k, n).T.ravel()))
+        present = values.is_valid()
+        counts = np.asarray(present).reshape(n, k).sum(axis=1)
+        offsets = np.concatenate([[0], np.cumsum(counts)]).astype(np.int32)
+        return pc.binary_join(pa.ListArray.from_arrays(pa.array(offsets), values.filter(present)), separator)
+
+    return Transform(fn, batch)
+
+
+def apply_batch(batch: Callable[[pa.Array], pa.Array], arr: pa.Array) -> pa.Array:
+    """Esegue l'implementazione batch di una trasformazione rimettendo a null le righe con input null"""
+    if isinstance(arr, pa.ChunkedArray):
+        arr = arr.combine_chunks()
+    result = batch(arr)
+    if isinstance(result, pa.ChunkedArray):
+        result = result.combine_chunks()
+    if len(result) != len(arr):
+        raise ValueError(f"la trasformazione batch ha restituito {len(result)} valori per {len(arr)} righe")
+    if arr.null_count and not pa.types.is_null(result.type):
+        result = pc.if_else(pc.is_valid(arr), result, pa.nulls(len(arr), result.type))
+    return result
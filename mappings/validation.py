@@ -0,0 +1,194 @@
+import json
+import hashlib
+import jsonschema
+from typing import Dict, List, Any, Callable, NamedTuple, Optional, Sequence, Tuple
+
+# fastjsonschema genera codice Python specializzato sullo schema: se installato
+# lo usiamo come controllo rapido, jsonschema resta la fonte dei messaggi d'errore
+try:
+    import fastjsonschema
+except ImportError:
+    fastjsonschema = None
+
+# Righe di esempio (file e offset) conservate per ogni violazione nel report di validazione
+VALIDATION_EXAMPLES = 5
+
+
+class Violation(NamedTuple):
+    """Errore di validazione di una riga: path del valore nella riga, path della regola nello schema, messaggio e valore"""
+    path: str
+    schema_path: str
+    message: str
+    instance: Any
+
+
+def schema_hash(schema: Dict[str, Any]) -> str:
+    """Hash stabile dello schema, indipendente dall'ordine delle chiavi"""
+    return hashlib.sha256(json.dumps(schema, sort_keys=True, default=str).encode("utf-8")).hexdigest()
+
+
+class CompiledValidator:
+    """
+    Validatore Draft 7 compilato una volta per schema. Le righe valide passano dal
+    controllo generato (se disponibile); solo quelle invalide vengono ripercorse
+    da jsonschema, che decide l'esito e dà l'elenco completo degli errori: fastjsonschema
+    controlla anche i "format" (date, email...), che jsonschema senza format checker ignora.
+    """
+
+    def __init__(self, schema: Dict[str, Any]):
+        self.schema = schema
+        self._validator = jsonschema.Draft7Validator(schema)
+        self._fast_check: Optional[Callable[[Any], Any]] = None
+        if fastjsonschema is not None:
+            try:
+                # use_default=False: la validazione non deve riempire i default nella riga
+                self._fast_check = fastjsonschema.compile(schema, use_default=False)
+            except Exception:
+                # Schema fuori da quanto supporta fastjsonschema: resta jsonschema, senza avvisi in ogni worker
+                self._fast_check = None
+
+    def _is_fast_valid(self, row: Any) -> bool:
+        try:
+            self._fast_check(row)
+            return True
+        except fastjsonschema.JsonSchemaException:
+            return False
+
+    def is_valid(self, row: Any) -> bool:
+        if self._fast_check is not None and self._is_fast_valid(row):
+            return True
+        return self._validator.is_valid(row)
+
+    def errors(self, row: Any) -> List[str]:
+        return [f"{violation.path}: {violation.message}" for violation in self.violations(row)]
+
+    def violations(self, row: Any) -> List[Violation]:
+        """Gli errori della riga; lista vuota se la riga è valida"""
+        if self._fast_check is not None and self._is_fast_valid(row):
+            return []
+        return [
+            Violation(".".join([str(p) for p in err.absolute_path]), ".".join([str(p) for p in err.absolute_schema_path]), err.message, err.instance)
+            for err in self._validator.iter_errors(row)
+        ]
+
+    def validate_many(self, rows: List[Any], drop_nulls: bool = False) -> List[List[str]]:
+        """
+        Lista di errori per ogni riga, nello stesso ordine (lista vuota se la riga è valida).
+        Con drop_nulls i campi a None contano come assenti (vedi without_nulls), come per le righe lette dagli shard.
+        """
+        if drop_nulls:
+            rows = [without_nulls(row) for row in rows]
+        return [self.errors(row) for row in rows]
+
+
+def _generic_message(message: str, instance: Any) -> str:
+    """Il messaggio senza il valore della riga in testa ("5 is not of type 'string'" -> "is not of type 'string'")"""
+    value = repr(instance)
+    return message[len(value):].lstrip() if message.startswith(value) else message
+
+
+def without_nulls(value: Any) -> Any:
+    """
+    Copia del valore senza le chiavi a None negli oggetti, a ogni livello. Gli shard scritti con lo schema
+    Arrow fisso riportano come null i campi opzionali che il mapping non valorizza: così tornano assenti.
+    """
+    if isinstance(value, dict):
+        return {key: without_nulls(item) for key, item in value.items() if item is not None}
+    if isinstance(value, list):
+        return [without_nulls(item) for item in value]
+    return value
+
+
+class ValidationReport:
+    """
+    Validazione in linea delle righe mappate: con every=N si controlla una riga ogni N (1: tutte).
+    Le violazioni si aggregano per (path nello schema, messaggio senza il valore della riga), con il
+    numero di occorrenze e le prime VALIDATION_EXAMPLES righe (file sorgente, offset, path nella riga).
+    Come MappingProfile, ogni worker ne riempie uno per unità e il processo principale li somma.
+
+    Un campo a None equivale a un campo assente: Arrow (motori arrow e duckdb, e i file parquet scritti)
+    non distingue i due casi e riempie di null i campi mancanti delle struct, mentre il Mapper li omette.
+    Le chiavi a None vengono tolte prima di validare, così il report non dipende dal motore; un campo
+    obbligatorio a None risulta mancante (required) invece che di tipo sbagliato.
+    """
+
+    def __init__(self, every: int = 1):
+        self.every = every
+        self.seen_rows = 0
+        self.checked_rows = 0
+        self.invalid_rows = 0
+        # (path nello schema, messaggio) -> [occorrenze, [[file, offset, path nella riga], ...]]
+        self.violations: Dict[Tuple[str, str], List[Any]] = {}
+
+    def sample(self, count: int) -> Sequence[int]:
+        """Posizioni da controllare tra le prossime count righe"""
+        first = -self.seen_rows % self.every
+        self.seen_rows += count
+        return range(first, count, self.every)
+
+    def check(self, validator: CompiledValidator, rows: List[Any], offsets: Sequence[int], file_path: str) -> None:
+        """Valida le righe (già campionate) e ne aggrega le violazioni"""
+        for row, offset in zip(rows, offsets):
+            self.checked_rows += 1
+            errors = validator.violations(without_nulls(row))
+            if not errors:
+                continue
+            self.invalid_rows += 1
+            for error in errors:
+                key = (error.schema_path, _generic_message(error.message, error.instance))
+                violation = self.violations.get(key)
+                if violation is None:
+                    violation = self.violations[key] = [0, []]
+                violation[0] += 1
+                if len(violation[1]) < VALIDATION_EXAMPLES:
+                    violation[1].append([file_path, offset, error.path])
+
+    def merge(self, other: "ValidationReport") -> None:
+        """Somma un altro report (es. quello di un'unità) in questo"""
+        self.seen_rows += other.seen_rows
+        self.checked_rows += other.checked_rows
+        self.invalid_rows += other.invalid_rows
+        for key, (count, examples) in other.violations.items():
+            violation = self.violations.setdefault(key, [0, []])
+            violation[0] += count
+            violation[1].extend(examples[:VALIDATION_EXAMPLES - len(violation[1])])
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Forma serializzabile (picklable e JSON), con le violazioni in ordine di frequenza"""
+        violations = [
+            {"schema_path": schema_path, "message": message, "count": count,
+             "examples": [{"file": file_path, "offset": offset, "path": path} for file_path, offset, path in examples]}
+            for (schema_path, message), (count, examples) in self.violations.items()
+        ]
+        violations.sort(key=lambda v: v["count"], reverse=True)
+        return {"every": self.every, "seen_rows": self.seen_rows, "checked_rows": self.checked_rows,
+                "invalid_rows": self.invalid_rows, "violations": violations}
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "ValidationReport":
+        report = cls(data.get("every", 1))
+        report.seen_rows = data.get("seen_rows", 0)
+        report.checked_rows = data.get("checked_rows", 0)
+        report.invalid_rows = data.get("invalid_rows", 0)
+        for v in data.get("violations", []):
+            report.violations[(v["schema_path"], v["message"])] = [v["count"], [[e["file"], e["offset"], e["path"]] for e in v["examples"]]]
+        return report
+
+
+_VALIDATORS: Dict[str, CompiledValidator] = {}
+# Scorciatoia per chi passa sempre lo stesso oggetto schema: evita di riserializzarlo a ogni riga.
+# Lo schema resta referenziato, quindi il suo id non può essere riusato da un altro oggetto.
+_VALIDATORS_BY_ID: Dict[int, Tuple[Dict[str, Any], CompiledValidator]] = {}
+
+
+def get_validator(schema: Dict[str, Any]) -> CompiledValidator:
+    """Validatore compilato per lo schema, condiviso tra tutte le chiamate con lo stesso schema"""
+    cached = _VALIDATORS_BY_ID.get(id(schema))
+    if cached is not None and cached[0] is schema:
+        return cached[1]
+    key = schema_hash(schema)
+    validator = _VALIDATORS.get(key)
+    if validator is None:
+        validator = _VALIDATORS[key] = CompiledValidator(schema)
+    _VALIDATORS_BY_ID[id(schema)] = (schema, validator)
+    return validator
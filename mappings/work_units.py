@@ -0,0 +1,54 @@
+import os
+import pyarrow.parquet as pq
+from typing import List, NamedTuple, Optional, Tuple
+
+# Dimensione (compressa, su disco) sopra cui un file viene diviso in più unità di lavoro
+DEFAULT_UNIT_BYTES = 64 * 1024 * 1024
+
+
+class WorkUnit(NamedTuple):
+    """
+    Porzione di un file di input mappata da un singolo task del pool.
+    part è None per un file intero; altrimenti l'unità copre i row group [start, end) di un parquet
+    oppure i byte [start, end) di un JSON Lines o di un array JSON con un record per riga, non compressi
+    (una riga appartiene all'unità in cui cade il suo primo byte).
+    """
+    file_path: str
+    file_index: int
+    part: Optional[int] = None
+    row_groups: Optional[Tuple[int, int]] = None
+    byte_range: Optional[Tuple[int, int]] = None
+
+    def output_name(self) -> str:
+        """Nome del parquet di output: gli shard di un file, ordinati per nome, seguono l'ordine della sorgente"""
+        name = os.path.splitext(os.path.basename(self.file_path))[0]
+        if self.part is None:
+            return f"{name}_mapped_{self.file_index}.parquet"
+        return f"{name}_mapped_{self.file_index}_{self.part:05d}.parquet"
+
+
+def _parquet_units(file_path: str, file_index: int, unit_bytes: int) -> List[WorkUnit]:
+    metadata = pq.ParquetFile(file_path).metadata
+    ranges = []
+    start, size = 0, 0
+    for i in range(metadata.num_row_groups):
+        row_group = metadata.row_group(i)
+        size += sum(row_group.column(c).total_compressed_size for c in range(row_group.num_columns))
+        if size >= unit_bytes:
+            ranges.append((start, i + 1))
+            start, size = i + 1, 0
+    if start < metadata.num_row_groups:
+        ranges.append((start, metadata.num_row_groups))
+    if len(ranges) <= 1:
+        return [WorkUnit(file_path, file_index)]
+    return [WorkUnit(file_path, file_index, part, row_groups=r) for part, r in enumerate(ranges)]
+
+
+def _byte_range_units(file_path: str, file_index: int, unit_bytes: int) -> List[WorkUnit]:
+    size = os.path.getsize(file_path)
+    if size <= unit_bytes:
+        return [WorkUnit(file_path, file_index)]
+    return [
+        WorkUnit(file_path, file_index, part, byte_range=(start, min(start + unit_bytes, size)))
+        for part, start in enumerate(range(0, size, unit_bytes))
+    ]
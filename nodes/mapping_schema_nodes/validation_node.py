@@ -17,7 +17,7 @@ class ValidationNode:
     1. Extracts and repairs JSON from LLM output.
     2. Ensures mappings follow the expected structure (list of mapping objects).
     3. Applies the mappings to the provided samples via Mapper.
-    4. Validates transformed samples against the target schema.
+    4. Validates transformed samples against the target schema with a cached compiled validator.
     5. Returns a Command that decides the next step:
         - "writer_node" if mapping is valid
         - "llm_node" if mapping is invalid and needs regeneration
@@ -127,12 +127,14 @@ class ValidationNode:
             print(traceback.format_exc())
             raise RuntimeError("dst_schema is missing from the state.")
 
+        # Compile the mapping once, then validate every mapped sample in a single batch
+        plan = self.mapper.compile(generated_mapping, target_schema)
+        transformed_samples = [plan.apply(sample) for sample in state.samples]
+        all_errors = self.mapper.validate_many(transformed_samples, target_schema)
+
         valid = True
-        for i, sample in enumerate(state.samples):
-            # Apply mapping and validate sample via Mapper
-            transformed_sample, valid_mapping, errors = self.mapper.map_and_validate(
-                sample, generated_mapping, target_schema
-            )
+        for i, (transformed_sample, errors) in enumerate(zip(transformed_samples, all_errors)):
+            valid_mapping = not errors
             print(f"Sample {i+1} validation result: {valid_mapping}, Errors: {errors}, Transformed: {transformed_sample}")
             state.mapped_samples.append(transformed_sample)  # Store for overview
 
@@ -156,10 +158,7 @@ class ValidationNode:
                 update={
                     "mapping": generated_mapping,
                     "valid": True,
-                    "mapped_samples": [
-                        self.mapper.apply_mapping(sample, generated_mapping, target_schema)
-                        for sample in state.samples
-                    ],
+                    "mapped_samples": [plan.apply(sample) for sample in state.samples],
                 },
             )
         else:
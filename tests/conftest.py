@@ -0,0 +1,52 @@
+import os
+import sys
+import json
+import glob
+import pyarrow.parquet as pq
+import pytest
+from typing import Any, Dict, List
+
+# I moduli del progetto si importano dalla radice del repository
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+# "upper" non è registrata nel Mapper dei worker: il testo si copia com'è, su ogni motore
+MAPPING = [
+    {"src_field": "id", "target_field": "i"},
+    {"src_field": "text", "target_field": "t", "transformation": "upper"},
+    {"src_field": "meta.k", "target_field": "k"},
+]
+DST_SCHEMA = {
+    "type": "object",
+    "properties": {"i": {"type": "integer"}, "t": {"type": "string"}, "k": {"type": "integer"}},
+}
+
+
+def make_rows(count: int, start: int = 0) -> List[Dict[str, Any]]:
+    return [{"id": i, "text": f"testo {i}", "meta": {"k": i % 7}} for i in range(start, start + count)]
+
+
+def write_jsonl(path: str, rows: List[Any]) -> None:
+    with open(path, "w", encoding="utf-8") as f:
+        for row in rows:
+            f.write((row if isinstance(row, str) else json.dumps(row)) + "\n")
+
+
+def output_rows(output_path: str) -> List[Dict[str, Any]]:
+    """Righe di tutti gli shard di output, ordinate per "i" (i motori nominano gli shard in modo diverso)"""
+    rows = []
+    for path in sorted(glob.glob(os.path.join(output_path, "*.parquet"))):
+        rows.extend(pq.read_table(path).to_pylist())
+    return sorted(rows, key=lambda row: (row["i"], json.dumps(row, sort_keys=True)))
+
+
+def no_progress(_: float) -> None:
+    pass
+
+
+@pytest.fixture
+def input_dir(tmp_path):
+    path = tmp_path / "input"
+    path.mkdir()
+    return str(path)
@@ -0,0 +1,75 @@
+import pytest
+
+from mappings.mapper import Mapper
+from mappings.validation import get_validator
+
+SCHEMA = {
+    "type": "object",
+    "properties": {
+        "m": {"type": "array", "items": {"type": "object", "properties": {
+            "role": {"type": "string"},
+            "at": {"type": "array", "items": {"type": "object", "properties": {"url": {"type": "string"}}}},
+        }}},
+        "flat": {"type": "array"},
+        "grid": {"type": "array", "items": {"type": "array", "items": {"type": "integer"}}},
+    },
+}
+NESTED = [{"src_field": "turns[].files[].u", "target_field": "m[].at[].url"}]
+
+
+def apply(mapping, sample):
+    return Mapper().apply_mapping(sample, mapping, SCHEMA)
+
+
+def test_equal_depth_expands_every_level():
+    sample = {"turns": [{"files": [{"u": "a"}, {"u": "b"}]}, {"files": [{"u": "c"}]}]}
+    assert apply(NESTED, sample) == {"m": [{"at": [{"url": "a"}, {"url": "b"}]}, {"at": [{"url": "c"}]}]}
+
+
+def test_equal_depth_with_rules_on_both_levels():
+    mapping = NESTED + [{"src_field": "turns[].r", "target_field": "m[].role"}]
+    sample = {"turns": [{"r": "x", "files": [{"u": "a"}]}, {"r": "y", "files": [{"u": "b"}, {"u": "c"}]}]}
+    assert apply(mapping, sample) == {"m": [
+        {"role": "x", "at": [{"url": "a"}]},
+        {"role": "y", "at": [{"url": "b"}, {"url": "c"}]},
+    ]}
+
+
+@pytest.mark.parametrize("turn", [{}, {"files": []}, {"files": None}], ids=["missing", "empty", "null"])
+def test_missing_inner_array_keeps_the_outer_element(turn):
+    # L'elemento resta (allineato alla sorgente) come oggetto senza l'array interno, non come None
+    sample = {"turns": [{"files": [{"u": "a"}]}, turn, {"files": [{"u": "c"}]}]}
+    result = apply(NESTED, sample)
+    assert result == {"m": [{"at": [{"url": "a"}]}, {}, {"at": [{"url": "c"}]}]}
+    assert get_validator(SCHEMA).errors(result) == []
+
+
+def test_missing_inner_array_with_outer_rules():
+    mapping = NESTED + [{"src_field": "turns[].r", "target_field": "m[].role"}]
+    assert apply(mapping, {"turns": [{"r": "x"}, {"r": "y", "files": [{"u": "a"}]}]}) == {"m": [
+        {"role": "x"}, {"role": "y", "at": [{"url": "a"}]},
+    ]}
+
+
+def test_nested_lists_without_objects():
+    mapping = [{"src_field": "rows[][]", "target_field": "grid[][]"}]
+    assert apply(mapping, {"rows": [[1, 2], [], None, [3]]}) == {"grid": [[1, 2], [], [], [3]]}
+
+
+def test_surplus_source_level_is_bound_to_the_innermost_index():
+    # Un '[]' sorgente in più si lega all'indice del livello espanso: flat[i] = turns[i].files[i].u
+    mapping = [{"src_field": "turns[].files[].u", "target_field": "flat[]"}]
+    sample = {"turns": [{"files": [{"u": 1}, {"u": 2}]}, {"files": [{"u": 3}]}, {"files": [{"u": 4}, {"u": 5}, {"u": 6}]}]}
+    assert apply(mapping, sample) == {"flat": [1, None, 6]}
+
+
+def test_surplus_target_level_is_bound_to_the_innermost_index():
+    # Un '[]' target in più si lega allo stesso indice: m[i].at[i].url = turns[i].u
+    mapping = [{"src_field": "turns[].u", "target_field": "m[].at[].url"}]
+    assert apply(mapping, {"turns": [{"u": "a"}, {"u": "b"}]}) == {"m": [
+        {"at": [{"url": "a"}]}, {"at": [None, {"url": "b"}]},
+    ]}
+
+
+def test_empty_outer_array_writes_no_elements():
+    assert apply(NESTED, {"turns": []}) == apply(NESTED, {})
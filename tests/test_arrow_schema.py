@@ -0,0 +1,50 @@
+import os
+import json
+import glob
+import pyarrow.parquet as pq
+import pytest
+
+from conftest import make_rows, write_jsonl, no_progress
+from mappings.arrow_schema import output_schema, rows_to_table
+from mappings.parallel_mapping_process import MappingOptions, run_parallel_mapping
+from mappings.validation import get_validator, without_nulls
+
+DST_SCHEMA = {
+    "type": "object",
+    "required": ["i"],
+    "properties": {
+        "i": {"type": "integer"},
+        "t": {"type": "string"},
+        "meta": {"type": "object", "properties": {"k": {"type": "integer"}, "note": {"type": "string"}}},
+        "extra": {"type": "object", "properties": {"flag": {"type": "boolean"}}},
+        "tags": {"type": "array", "items": {"type": "string"}},
+    },
+}
+# "meta.note", "extra" e "tags" non vengono mappati
+MAPPING = [
+    {"src_field": "id", "target_field": "i"},
+    {"src_field": "text", "target_field": "t"},
+    {"src_field": "meta.k", "target_field": "meta.k"},
+]
+
+
+def test_output_schema_has_every_dst_field():
+    schema = output_schema(DST_SCHEMA, MAPPING)
+    assert schema.names == ["i", "t", "meta", "extra", "tags"]
+    table = rows_to_table([{"i": 1, "t": "a", "meta": {"k": 2}}], schema)
+    assert table.to_pylist() == [{"i": 1, "t": "a", "meta": {"k": 2, "note": None}, "extra": None, "tags": None}]
+
+
+@pytest.mark.parametrize("engine", ["python", "arrow"])
+def test_shards_validate_against_dst_schema(input_dir, tmp_path, engine):
+    write_jsonl(os.path.join(input_dir, "a.jsonl"), make_rows(200))
+    output_path = str(tmp_path / engine)
+    results = run_parallel_mapping(input_dir, output_path, MAPPING, DST_SCHEMA, no_progress, MappingOptions(engine=engine))
+    assert results["successful_files"] == 1
+    rows = [row for path in sorted(glob.glob(os.path.join(output_path, "*.parquet"))) for row in pq.read_table(path).to_pylist()]
+    assert len(rows) == 200
+    # I campi opzionali non mappati tornano come null espliciti
+    assert rows[0]["extra"] is None and rows[0]["meta"]["note"] is None
+    validator = get_validator(DST_SCHEMA)
+    assert [validator.violations(without_nulls(row)) for row in rows] == [[]] * 200
+    assert validator.violations(rows[0])
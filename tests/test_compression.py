@@ -0,0 +1,55 @@
+import os
+import bz2
+import gzip
+import json
+import lzma
+import pyarrow as pa
+import pytest
+
+from conftest import MAPPING, DST_SCHEMA, make_rows, output_rows, no_progress
+from mappings.compression import compression_of, open_source, strip_compression
+from mappings.jsonl_reader import iter_line_offsets
+from mappings.parallel_mapping_process import MappingOptions, run_parallel_mapping
+
+
+def write_compressed(path, data):
+    extension = compression_of(path)
+    if extension == ".zst":
+        if not pa.Codec.is_available("zstd"):
+            pytest.skip("pyarrow senza codec zstd")
+        with pa.output_stream(path, compression="zstd") as f:
+            f.write(data)
+        return
+    opener = {".gz": gzip.open, ".xz": lzma.open, ".bz2": bz2.open, None: open}[extension]
+    with opener(path, "wb") as f:
+        f.write(data)
+
+
+@pytest.mark.parametrize("extension", [".gz", ".zst", ".xz", ".bz2"])
+def test_open_source_decompresses_in_blocks(tmp_path, extension):
+    lines = [json.dumps(row).encode() for row in make_rows(500)]
+    path = str(tmp_path / f"a.jsonl{extension}")
+    write_compressed(path, b"\n".join(lines) + b"\n")
+    assert compression_of(path) == extension
+    assert strip_compression(path) == str(tmp_path / "a.jsonl")
+    with open_source(path) as f:
+        assert f.read(10) == lines[0][:10]
+    # Blocchi piccoli: le righe si ricompongono a cavallo dei blocchi, con gli offset del file decompresso
+    chunks = list(iter_line_offsets(path, 64, block_bytes=333))
+    assert [line for chunk, _ in chunks for line in chunk] == lines
+    assert [offset for _, offsets in chunks for offset in offsets][-1] == sum(len(line) + 1 for line in lines[:-1])
+
+
+@pytest.mark.parametrize("engine", ["python", "arrow"])
+def test_compressed_inputs_of_every_format(input_dir, tmp_path, engine):
+    rows = make_rows(300)
+    write_compressed(os.path.join(input_dir, "a.jsonl.zst"), "".join(json.dumps(row) + "\n" for row in rows[:100]).encode())
+    write_compressed(os.path.join(input_dir, "b.json.xz"), json.dumps(rows[100:200], indent=2).encode())
+    csv = "id,text\n" + "".join(f"{row['id']},{row['text']}\n" for row in rows[200:])
+    write_compressed(os.path.join(input_dir, "c.csv.bz2"), csv.encode())
+    output_path = str(tmp_path / "out")
+    # unit_bytes piccolo: i file compressi restano comunque un'unità sola
+    results = run_parallel_mapping(input_dir, output_path, MAPPING, DST_SCHEMA, no_progress, MappingOptions(engine=engine, unit_bytes=512))
+    assert results["successful_files"] == 3
+    assert [row["i"] for row in output_rows(output_path)] == list(range(300))
+    assert len([name for name in os.listdir(output_path) if name.endswith(".parquet")]) == 3
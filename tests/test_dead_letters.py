@@ -0,0 +1,158 @@
+import os
+import json
+import pyarrow.parquet as pq
+import pytest
+
+from conftest import MAPPING, DST_SCHEMA, make_rows, write_jsonl, output_rows, no_progress
+from mappings import csv_reader
+from mappings.dead_letters import DEAD_LETTER_DIRNAME
+from mappings.parallel_mapping_process import MappingOptions, run_parallel_mapping, process_unit, _MappingWorker
+from mappings.work_units import WorkUnit
+
+
+def dead_letters(output_path, name):
+    path = os.path.join(output_path, DEAD_LETTER_DIRNAME, name)
+    if path.endswith(".parquet"):
+        return pq.read_table(path).to_pylist()
+    with open(path, encoding="utf-8") as f:
+        return [json.loads(line) for line in f]
+
+
+@pytest.fixture
+def bad_jsonl(input_dir):
+    lines = [json.dumps(row) for row in make_rows(200)]
+    lines[10] = "{non json"
+    lines[20] = json.dumps({"id": {"x": 1}, "text": "t"})  # "i" non è un intero
+    lines[30] = json.dumps({"id": 30, "text": "t", "meta": {"k": "x"}})  # "k" non è un intero
+    write_jsonl(os.path.join(input_dir, "a.jsonl"), lines)
+    # Offset in byte di ogni riga nel file
+    offsets, position = [], 0
+    for line in lines:
+        offsets.append(position)
+        position += len(line) + 1
+    return input_dir, offsets
+
+
+@pytest.mark.parametrize("engine", ["python", "arrow"])
+@pytest.mark.parametrize("dead_letter_format", ["parquet", "jsonl"])
+def test_jsonl_rows_routed_to_dead_letters(bad_jsonl, tmp_path, engine, dead_letter_format):
+    input_dir, offsets = bad_jsonl
+    output_path = str(tmp_path / "out")
+    results = run_parallel_mapping(input_dir, output_path, MAPPING, DST_SCHEMA, no_progress,
+                                   MappingOptions(engine=engine, dead_letters=dead_letter_format, unit_bytes=2048))
+    assert results["successful_files"] == 1
+    assert results["dead_letter_rows"] == 3
+    assert results["file_errors"] == {os.path.join(input_dir, "a.jsonl"): 3}
+    assert [row["i"] for row in output_rows(output_path)] == [i for i in range(200) if i not in (10, 20, 30)]
+    rejected = []
+    for name in os.listdir(os.path.join(output_path, DEAD_LETTER_DIRNAME)):
+        rejected.extend(dead_letters(output_path, name))
+    assert sorted((row["offset"], row["stage"]) for row in rejected) == [
+        (offsets[10], "decode"), (offsets[20], "schema"), (offsets[30], "schema"),
+    ]
+    assert all(row["file"].endswith("a.jsonl") for row in rejected)
+
+
+def test_jsonl_without_dead_letters_fails_the_unit(bad_jsonl, tmp_path):
+    input_dir, _ = bad_jsonl
+    output_path = str(tmp_path / "out")
+    results = run_parallel_mapping(input_dir, output_path, MAPPING, DST_SCHEMA, no_progress, MappingOptions(dead_letters=None))
+    assert results["successful_files"] == 0
+    assert output_rows(output_path) == []
+
+
+@pytest.mark.parametrize("engine", ["python", "arrow"])
+def test_mapper_errors_routed_to_dead_letters(input_dir, tmp_path, engine):
+    path = os.path.join(input_dir, "a.jsonl")
+    write_jsonl(path, make_rows(100))
+    output_path = str(tmp_path / "out")
+    os.makedirs(output_path)
+    worker = _MappingWorker(MAPPING, DST_SCHEMA, output_path, MappingOptions(engine=engine, batch_size=32, dead_letters="jsonl"))
+    apply = worker.plan.apply
+
+    def failing_apply(sample, profile=None):
+        if sample["id"] in (7, 70):
+            raise KeyError("boom")
+        return apply(sample, profile)
+
+    worker.plan.apply = failing_apply
+    if worker.arrow_mapper is not None:
+        # Un errore sul batch fa rimappare le sue righe una per una con il Mapper
+        worker.arrow_mapper.map_batch = lambda batch: [][0]
+    result = worker.process(WorkUnit(path, 0))
+    assert result[1], result[3]
+    assert (result[2], result[6]) == (98, 2)
+    rejected = dead_letters(output_path, "a_mapped_0.errors.jsonl")
+    assert [(row["stage"], row["error"]) for row in rejected] == [("mapping", "KeyError: 'boom'")] * 2
+    assert [json.loads(row["record"])["id"] for row in rejected] == [7, 70]
+
+
+@pytest.fixture
+def late_bad_csv(input_dir, monkeypatch):
+    # Blocchi piccoli: i tipi si deducono dalle prime righe e i valori non conformi arrivano dopo
+    monkeypatch.setattr(csv_reader, "CSV_BLOCK_BYTES", 256)
+    path = os.path.join(input_dir, "a.csv")
+    with open(path, "w", encoding="utf-8") as f:
+        f.write("id,text\n")
+        for i in range(500):
+            f.write(f"{'x' if i in (300, 450) else i},testo {i}\n")
+    return path
+
+
+def test_csv_late_nonconforming_values_become_dead_letters(late_bad_csv, tmp_path):
+    output_path = str(tmp_path / "out")
+    os.makedirs(output_path)
+    result = process_unit(WorkUnit(late_bad_csv, 0), MAPPING, DST_SCHEMA, output_path, MappingOptions(dead_letters="jsonl", batch_size=64))
+    _, success, rows, error, _, _, rejected_count, _ = result
+    assert success, error
+    assert rows == 498
+    assert rejected_count == 2
+    rejected = dead_letters(output_path, "a_mapped_0.errors.jsonl")
+    assert [(row["offset"], row["stage"]) for row in rejected] == [(300, "decode"), (450, "decode")]
+    assert "colonna 'id'" in rejected[0]["error"]
+    assert [row["i"] for row in output_rows(output_path)] == [i for i in range(500) if i not in (300, 450)]
+
+
+def test_csv_late_nonconforming_value_without_dead_letters(late_bad_csv, tmp_path):
+    output_path = str(tmp_path / "out")
+    os.makedirs(output_path)
+    result = process_unit(WorkUnit(late_bad_csv, 0), MAPPING, DST_SCHEMA, output_path, MappingOptions(dead_letters=None, batch_size=64))
+    assert not result[1]
+    assert "tipi dedotti" in str(result[3])
+
+
+def test_csv_rows_keep_inferred_types(late_bad_csv):
+    batches = list(csv_reader.iter_csv_batches(late_bad_csv, 100, lenient=True))
+    assert {str(batch.schema.field("id").type) for batch, _, _ in batches} == {"int64"}
+    assert sum(len(indices) for _, indices, _ in batches) == 498
+
+
+def test_json_array_malformed_element_becomes_dead_letter(input_dir, tmp_path):
+    elements = [json.dumps(row, indent=2) for row in make_rows(50)]
+    elements[7] = '{"id": 7, "text": non_json}'
+    with open(os.path.join(input_dir, "a.json"), "w", encoding="utf-8") as f:
+        f.write("[\n" + ",\n".join(elements) + "\n]\n")
+    output_path = str(tmp_path / "out")
+    results = run_parallel_mapping(input_dir, output_path, MAPPING, DST_SCHEMA, no_progress, MappingOptions(dead_letters="jsonl"))
+    assert results["successful_files"] == 1
+    assert [row["i"] for row in output_rows(output_path)] == [i for i in range(50) if i != 7]
+    rejected = dead_letters(output_path, "a_mapped_0.errors.jsonl")
+    assert [(row["offset"], row["stage"], row["record"]) for row in rejected] == [(7, "decode", elements[7])]
+
+
+def test_json_array_multiline_element_after_the_sample_fails_the_unit(input_dir, tmp_path):
+    # Un record per riga per oltre ARRAY_SAMPLE_BYTES, poi un elemento su più righe: i suoi frammenti
+    # non devono diventare dead letter di decodifica
+    from mappings.json_array_reader import ARRAY_SAMPLE_BYTES
+
+    rows = make_rows(ARRAY_SAMPLE_BYTES // 40)
+    elements = [json.dumps(row) for row in rows] + [json.dumps({"id": -1, "text": "t"}, indent=2)]
+    path = os.path.join(input_dir, "a.json")
+    with open(path, "w", encoding="utf-8") as f:
+        f.write("[\n" + ",\n".join(elements) + "\n]\n")
+    assert os.path.getsize(path) > ARRAY_SAMPLE_BYTES
+    output_path = str(tmp_path / "out")
+    results = run_parallel_mapping(input_dir, output_path, MAPPING, DST_SCHEMA, no_progress, MappingOptions(dead_letters="jsonl", unit_bytes=256 * 1024))
+    assert results["successful_files"] == 0
+    assert results["dead_letter_rows"] == 0
+    assert not os.path.exists(os.path.join(output_path, DEAD_LETTER_DIRNAME))
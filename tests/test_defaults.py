@@ -0,0 +1,71 @@
+import copy
+import pytest
+
+from mappings.mapper import Mapper
+import reference_mapper
+
+SCHEMA = {
+    "type": "object",
+    "properties": {
+        "id": {"type": "integer"},
+        "lang": {"type": "string", "default": "it"},
+        "kind": {"type": "string", "enum": ["a", "b"]},
+        "tags": {"type": "array", "items": {"type": "string"}, "default": ["x"]},
+        "meta": {"type": "object", "properties": {
+            "source": {"type": "string", "default": "etl"},
+            "score": {"type": "number"},
+            "flags": {"type": "object", "properties": {"ok": {"type": "boolean", "default": True}}},
+        }, "required": ["score", "flags"]},
+        "messages": {"type": "array", "minItems": 2, "items": {"type": "object", "properties": {
+            "role": {"type": "string", "enum": ["USER", "ASSISTANT"]}, "content": {"type": "string"},
+        }, "required": ["role", "content"]}},
+    },
+    "required": ["id", "kind", "meta", "messages", "tags"],
+}
+MAPPING = [
+    {"src_field": "id", "target_field": "id"},
+    {"src_field": "m", "target_field": "meta"},
+    {"src_field": "turns[].text", "target_field": "messages[].content"},
+]
+ROWS = [
+    {"id": 1, "m": {"score": 0.5}, "turns": [{"text": "a"}, {"text": "b"}]},
+    {"id": 2, "m": {"flags": {}}, "turns": []},
+    {"id": 3, "m": "non un oggetto"},
+    {},
+]
+
+
+@pytest.mark.parametrize("mode", ["null", "dummy"])
+def test_defaults_match_reference(mode):
+    mapper, reference = Mapper(), reference_mapper.Mapper()
+    mapper.set_dummy_mode(mode)
+    reference.set_dummy_mode(mode)
+    plan = mapper.compile(MAPPING, SCHEMA)
+    assert [plan.apply(copy.deepcopy(row)) for row in ROWS] == [reference.apply_mapping(copy.deepcopy(row), MAPPING, SCHEMA) for row in ROWS]
+
+
+def test_defaults_fill_missing_fields_only():
+    result = Mapper().apply_mapping(ROWS[0], MAPPING, SCHEMA)
+    # Default dove lo schema li dà, il primo valore di enum e un'istanza minima per i required
+    assert result == {
+        "id": 1, "lang": "it", "kind": "a", "tags": ["x"],
+        "meta": {"score": 0.5, "source": "etl", "flags": {}},
+        "messages": [{"content": "a", "role": "USER"}, {"content": "b", "role": "USER"}],
+    }
+
+
+def test_dummy_mode_invalidates_cached_plans():
+    mapper = Mapper()
+    assert mapper.apply_mapping({}, MAPPING, SCHEMA)["id"] is None
+    mapper.set_dummy_mode("dummy")
+    assert mapper.apply_mapping({}, MAPPING, SCHEMA)["id"] == 0
+
+
+def test_mutable_defaults_are_not_shared_between_rows():
+    plan = Mapper().compile(MAPPING, SCHEMA)
+    first, second = plan.apply({}), plan.apply({})
+    first["tags"].append("y")
+    first["meta"]["k"] = 1
+    first["messages"][0]["role"] = "ASSISTANT"
+    assert second == plan.apply({})
+    assert second["tags"] == ["x"] and second["meta"] == {} and second["messages"] == [{}, {}]
@@ -0,0 +1,62 @@
+import os
+import json
+import pyarrow as pa
+import pyarrow.parquet as pq
+import pytest
+
+from conftest import MAPPING, DST_SCHEMA, make_rows, write_jsonl, output_rows, no_progress
+from mappings.parallel_mapping_process import MappingOptions, run_parallel_mapping
+
+ENGINES = ("python", "arrow", "duckdb")
+
+
+@pytest.fixture
+def mixed_inputs(input_dir):
+    """Stesse righe in JSON Lines, parquet, array JSON indentato e CSV"""
+    write_jsonl(os.path.join(input_dir, "a.jsonl"), make_rows(700))
+    pq.write_table(pa.Table.from_pylist(make_rows(500, start=1000)), os.path.join(input_dir, "b.parquet"), row_group_size=100)
+    with open(os.path.join(input_dir, "c.json"), "w", encoding="utf-8") as f:
+        json.dump(make_rows(300, start=2000), f, indent=2)
+    with open(os.path.join(input_dir, "d.csv"), "w", encoding="utf-8") as f:
+        f.write("id,text\n")
+        for i in range(3000, 3200):
+            f.write(f"{i},testo {i}\n")
+    return input_dir
+
+
+def expected_rows():
+    rows = [{"i": r["id"], "t": r["text"], "k": r["meta"]["k"]}
+            for r in make_rows(700) + make_rows(500, start=1000) + make_rows(300, start=2000)]
+    rows += [{"i": i, "t": f"testo {i}", "k": None} for i in range(3000, 3200)]
+    return rows
+
+
+@pytest.mark.parametrize("engine", ENGINES)
+def test_engine_output_matches_expected(mixed_inputs, tmp_path, engine):
+    if engine == "duckdb":
+        pytest.importorskip("duckdb")
+    output_path = str(tmp_path / f"out_{engine}")
+    results = run_parallel_mapping(mixed_inputs, output_path, MAPPING, DST_SCHEMA, no_progress, MappingOptions(engine=engine, unit_bytes=4096))
+    assert results["successful_files"] == 4
+    assert results["total_processed_samples"] == 1700
+    assert output_rows(output_path) == expected_rows()
+
+
+def test_engines_agree(mixed_inputs, tmp_path):
+    pytest.importorskip("duckdb")
+    outputs = {}
+    for engine in ENGINES:
+        output_path = str(tmp_path / f"out_{engine}")
+        run_parallel_mapping(mixed_inputs, output_path, MAPPING, DST_SCHEMA, no_progress, MappingOptions(engine=engine))
+        outputs[engine] = output_rows(output_path)
+    assert outputs["python"] == outputs["arrow"] == outputs["duckdb"]
+
+
+def test_split_units_keep_source_order(input_dir, tmp_path):
+    write_jsonl(os.path.join(input_dir, "a.jsonl"), make_rows(2000))
+    output_path = str(tmp_path / "out")
+    run_parallel_mapping(input_dir, output_path, MAPPING, DST_SCHEMA, no_progress, MappingOptions(unit_bytes=8192))
+    shards = sorted(name for name in os.listdir(output_path) if name.endswith(".parquet"))
+    assert len(shards) > 1
+    ids = [row["i"] for name in shards for row in pq.read_table(os.path.join(output_path, name)).to_pylist()]
+    assert ids == list(range(2000))
@@ -0,0 +1,52 @@
+import json
+import pytest
+
+from mappings import jsonl_reader
+from mappings.jsonl_reader import iter_line_offsets, lines_to_arrow, parse_line, parse_lines
+
+LINES = [
+    b'{"id": 18446744073709551617, "n": -1180591620717411303424}',
+    b'{"id": 9223372036854775807, "f": 12345678901234567890.5, "e": 1234567890123456789012e3}',
+    b'{"s": "12345678901234567890", "l": [99999999999999999999]}',
+    b'{"id": 1, "f": 2.5}',
+]
+
+
+@pytest.fixture(params=["orjson", "json"])
+def decoder(request, monkeypatch):
+    if request.param == "orjson":
+        pytest.importorskip("orjson")
+    else:
+        monkeypatch.setattr(jsonl_reader, "orjson", None)
+
+
+def test_long_integers_stay_exact(decoder):
+    assert parse_lines(LINES) == [json.loads(line) for line in LINES]
+    assert parse_line(LINES[0])["id"] == 2 ** 64 + 1
+    assert isinstance(parse_line(LINES[2])["l"][0], int)
+
+
+def test_invalid_lines_raise_value_error(decoder):
+    for line in (b'{"id": 18446744073709551617', b"{non json", b'{"a": 1} x'):
+        with pytest.raises(ValueError):
+            parse_line(line)
+
+
+def test_arrow_decoding_skips_blocks_with_long_integers():
+    assert lines_to_arrow(LINES) is None
+    assert lines_to_arrow(LINES[:1]) is None
+    batch = lines_to_arrow([b'{"id": 922337203685477580}', LINES[3]])
+    assert batch.to_pylist() == [{"id": 922337203685477580, "f": None}, {"id": 1, "f": 2.5}]
+
+
+def test_byte_ranges_cover_every_line_once(tmp_path):
+    path = tmp_path / "a.jsonl"
+    lines = [json.dumps({"i": i, "pad": "x" * (i % 13)}).encode() for i in range(200)]
+    path.write_bytes(b"\n".join(lines) + b"\n\n")
+    size = path.stat().st_size
+    seen = []
+    for start in range(0, size, 997):
+        for chunk, offsets in iter_line_offsets(str(path), 16, (start, min(start + 997, size)), block_bytes=100):
+            seen.extend(zip(offsets, chunk))
+    assert [line for _, line in seen] == lines
+    assert [offset for offset, _ in seen] == [sum(len(line) + 1 for line in lines[:i]) for i in range(200)]
@@ -0,0 +1,210 @@
+import os
+import copy
+import glob
+import json
+import random
+import pyarrow.parquet as pq
+import pytest
+
+from conftest import ROOT
+from mappings import transforms
+from mappings.mapper import Mapper, PLAN_CACHE_SIZE
+from mappings.profiling import MappingProfile
+import reference_mapper
+
+SCHEMA_TEMPLATE = os.path.join(ROOT, "schema_templates", "schema_template_2.json")
+
+
+def _dataset_cases():
+    """Mapping e righe dei dataset di esempio in data/velvet_*"""
+    cases = []
+    for folder in sorted(glob.glob(os.path.join(ROOT, "data", "velvet_v*", "*"))):
+        with open(os.path.join(folder, "mapping.json"), encoding="utf-8") as f:
+            mapping = json.load(f)
+        rows = []
+        for path in sorted(glob.glob(os.path.join(folder, "data", "*"))):
+            if path.endswith(".parquet"):
+                rows += pq.read_table(path).to_pylist()
+            elif path.endswith(".jsonl"):
+                with open(path, encoding="utf-8") as f:
+                    rows += [json.loads(line) for line in f if line.strip()]
+        cases.append(pytest.param(mapping, rows, id=os.path.basename(folder)))
+    return cases
+
+
+def _synthetic_rows(count=200, seed=0):
+    rng = random.Random(seed)
+    values = [None, "x", "12", 3, 2.5, True, {"a": 1}, [1, 2], "true", "human", "gpt"]
+    return [
+        {
+            "prompt": rng.choice(values), "response": rng.choice(values), "n": rng.choice(values),
+            "conversations": [{"from": rng.choice(["human", "gpt", "x"]), "value": rng.choice(values), "think": rng.choice(values)}
+                              for _ in range(rng.randint(0, 4))],
+            "meta": {"lang": rng.choice(values), "tags": [rng.choice(values), rng.choice(values)]},
+        }
+        for _ in range(count)
+    ]
+
+
+def _synthetic_schema():
+    with open(SCHEMA_TEMPLATE, encoding="utf-8") as f:
+        template = json.load(f)
+    return {
+        "type": "object",
+        "properties": {
+            "template": {"type": "string", "enum": ["a", "b"], "default": "a"},
+            "count": {"type": ["integer", "null"]}, "score": {"type": "number"}, "flag": {"type": "boolean"},
+            "name": {"type": "string"}, "tags": {"type": "array", "items": {"type": "string"}},
+            "meta": {"type": "object", "properties": {"lang": {"type": "string", "default": "en"}, "x": {"type": "integer"}}, "required": ["x"]},
+            "messages": {"type": "array", "items": template["properties"]["messages"]["items"], "minItems": 1},
+            "extra": {"type": "object", "properties": {"k": {"type": "string", "enum": ["z"]}}},
+            "arr": {"type": "array", "items": {"type": "integer"}, "minItems": 2},
+        },
+        "required": ["messages", "arr", "extra"],
+    }
+
+
+SYNTHETIC_MAPPINGS = [
+    pytest.param([
+        {"src_field": "n", "target_field": "count", "transformation": "src"},
+        {"src_field": "n", "target_field": "score", "transformation": "src"},
+        {"src_field": "prompt", "target_field": "flag", "transformation": "src"},
+        {"src_field": "response", "target_field": "name", "transformation": "src"},
+        {"src_field": "meta.tags[1]", "target_field": "tags[1]", "transformation": "src"},
+        {"src_field": "meta.lang", "target_field": "meta.lang", "transformation": "src"},
+        {"src_field": "conversations[].from", "target_field": "messages[].role", "transformation": {"human": "USER", "gpt": "ASSISTANT"}},
+        {"src_field": "conversations[].value", "target_field": "messages[].content", "transformation": "src"},
+        {"src_field": "N/A", "target_field": "messages[].context", "transformation": None},
+        {"src_field": "N/A", "target_field": "template", "transformation": None},
+    ], id="casts-arrays-defaults"),
+    pytest.param([
+        {"src_field": "prompt", "target_field": "messages[0].content", "transformation": "x"},
+        {"src_field": "N/A", "target_field": "messages[0].role", "transformation": "USER"},
+        {"src_field": "N/A", "target_field": "count", "transformation": "42"},
+        {"src_field": "prompt", "target_field": "template", "transformation": {"x": "b", "12": "a"}},
+        {"src_field": "N/A", "target_field": "tags[0]", "transformation": 5},
+    ], id="indexed-and-fixed"),
+]
+
+
+def _outputs(mapper, mapping, rows, schema, compiled):
+    """Output riga per riga (o il tipo dell'eccezione), confrontabile tra i due Mapper"""
+    apply = mapper.compile(mapping, schema).apply if compiled else (lambda row: mapper.apply_mapping(row, mapping, schema))
+    outputs = []
+    for row in rows:
+        try:
+            outputs.append(json.dumps(apply(copy.deepcopy(row)), default=str))
+        except Exception as e:
+            outputs.append(type(e).__name__)
+    return outputs
+
+
+def _assert_same_as_reference(mapping, rows, schema):
+    for mode in ("null", "dummy"):
+        reference, mapper = reference_mapper.Mapper(), Mapper()
+        reference.set_dummy_mode(mode)
+        mapper.set_dummy_mode(mode)
+        expected = _outputs(reference, mapping, rows, schema, compiled=False)
+        assert _outputs(mapper, mapping, rows, schema, compiled=True) == expected
+        assert _outputs(mapper, mapping, rows, schema, compiled=False) == expected
+
+
+@pytest.mark.parametrize("mapping, rows", _dataset_cases())
+def test_plan_matches_reference_on_datasets(mapping, rows):
+    with open(SCHEMA_TEMPLATE, encoding="utf-8") as f:
+        schema = json.load(f)
+    _assert_same_as_reference(mapping, rows, schema)
+
+
+@pytest.mark.parametrize("mapping", SYNTHETIC_MAPPINGS)
+def test_plan_matches_reference_on_synthetic_rows(mapping):
+    _assert_same_as_reference(mapping, _synthetic_rows(), _synthetic_schema())
+
+
+def test_apply_mapping_reuses_the_compiled_plan(monkeypatch):
+    mapper = Mapper()
+    mapper.register_transform("upper", *transforms.normalize_string(upper=True))
+    mapper.register_transform("strip", *transforms.normalize_string(strip=True))
+    mapping = [{"src_field": "a", "target_field": "x", "transformation": "upper"}]
+    schema = {"type": "object", "properties": {"x": {"type": "string"}}}
+    compiled = []
+    compile_plan = mapper.compile
+    monkeypatch.setattr(mapper, "compile", lambda *args: compiled.append(1) or compile_plan(*args))
+    for _ in range(3):
+        assert mapper.apply_mapping({"a": "b"}, mapping, schema) == {"x": "B"}
+    assert len(compiled) == 1
+    # Modifica sul posto: il piano va ricompilato
+    mapping[0]["transformation"] = "strip"
+    assert mapper.apply_mapping({"a": " b "}, mapping, schema) == {"x": "b"}
+    assert len(compiled) == 2
+    # Una trasformazione registrata di nuovo invalida i piani
+    mapper.register_transform("strip", lambda value: "!")
+    assert mapper.apply_mapping({"a": " b "}, mapping, schema) == {"x": "!"}
+    assert len(compiled) == 3
+
+
+def test_plan_cache_is_bounded():
+    mapper = Mapper()
+    schema = {"type": "object", "properties": {"x": {"type": "string"}}}
+    for _ in range(PLAN_CACHE_SIZE * 3):
+        mapper.apply_mapping({"a": "b"}, [{"src_field": "a", "target_field": "x"}], schema)
+    assert len(mapper._plans) <= PLAN_CACHE_SIZE
+
+
+@pytest.mark.parametrize("compiled", [True, False])
+def test_named_transformations_copy_the_source_unless_registered(compiled):
+    mapping = [{"src_field": "a", "target_field": f"x{i}", "transformation": name} for i, name in enumerate(("USER", "null", "lower", "src"))]
+    schema = {"type": "object", "properties": {f"x{i}": {"type": "string"} for i in range(4)}}
+    old = {f"x{i}": "Aa" for i in range(4)}
+
+    def apply(mapper):
+        return mapper.compile(mapping, schema).apply({"a": "Aa"}) if compiled else mapper.apply_mapping({"a": "Aa"}, mapping, schema)
+
+    # Comportamento storico: con src_field valorizzato i nomi non registrati (e i default) copiano la sorgente
+    mapper = Mapper()
+    assert apply(mapper) == old
+    assert reference_mapper.Mapper().apply_mapping({"a": "Aa"}, mapping, schema) == old
+    # Registrati esplicitamente si applicano, anche un nome di default
+    mapper.register_transform("lower", *transforms.normalize_string(lower=True))
+    mapper.register_transform("USER", *transforms.constant("USER"))
+    assert apply(mapper) == {"x0": "USER", "x1": "Aa", "x2": "aa", "x3": "Aa"}
+
+
+TRIE_SCHEMA = {"type": "object", "properties": {
+    "a": {"type": "object", "properties": {"b": {"type": "string"}, "c": {"type": "string"}}},
+    "x": {"type": "array", "items": {"type": "string"}},
+    "s": {"type": "string"},
+}}
+TRIE_ROWS = [
+    {"p": {"q": "1", "r": "2"}, "l": ["u", "v"], "o": {"k": "w"}},
+    {"p": None, "l": [], "o": "non un oggetto"},
+    {},
+]
+
+
+@pytest.mark.parametrize("mapping, uses_trie", [
+    pytest.param([
+        {"src_field": "p.q", "target_field": "a.b"}, {"src_field": "p.r", "target_field": "a.c"},
+        {"src_field": "l[1]", "target_field": "x[1]"}, {"src_field": "l[0]", "target_field": "x[0]"},
+        {"src_field": "N/A", "target_field": "s", "transformation": "z"},
+    ], True, id="disjoint-targets"),
+    pytest.param([{"src_field": "p.q", "target_field": "s"}, {"src_field": "o.k", "target_field": "s"}], True, id="last-rule-wins"),
+    pytest.param([{"src_field": "o", "target_field": "a"}, {"src_field": "p.q", "target_field": "a.b"}], False, id="target-prefix"),
+    pytest.param([{"src_field": "p.q", "target_field": "a.b"}, {"src_field": "o", "target_field": "a"}], False, id="prefix-written-after"),
+    pytest.param([{"src_field": "l[0]", "target_field": "x[0]"}, {"src_field": "p.q", "target_field": "x.k"}], False, id="keys-and-indices"),
+])
+def test_static_writes_fall_back_to_sequential_order(mapping, uses_trie):
+    plan = Mapper().compile(mapping, TRIE_SCHEMA)
+    assert (plan._target_trie is not None) == uses_trie
+    _assert_same_as_reference(mapping, TRIE_ROWS, TRIE_SCHEMA)
+    # Il percorso profilato scrive sempre regola per regola: deve dare lo stesso risultato (o la stessa eccezione)
+    def outcomes(profile):
+        results = []
+        for row in TRIE_ROWS:
+            try:
+                results.append(plan.apply(copy.deepcopy(row), profile))
+            except Exception as e:
+                results.append(type(e).__name__)
+        return results
+
+    assert outcomes(MappingProfile()) == outcomes(None)
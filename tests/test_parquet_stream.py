@@ -0,0 +1,48 @@
+import os
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from mappings.parallel_mapping_process import _ParquetStream
+from mappings.parquet_writer import ParquetOptions
+
+
+def read_rows(paths):
+    return [row for path in paths for row in pq.read_table(path).to_pylist()]
+
+
+def test_null_column_widens_when_values_arrive(tmp_path):
+    # File piccoli: le righe già scritte sono in più file da riscrivere
+    stream = _ParquetStream(str(tmp_path / "a.parquet"), {b"k": b"v"}, options=ParquetOptions(target_file_bytes=1, row_group_rows=4))
+    first = [{"i": i, "t": None} for i in range(10)]
+    second = [{"i": i, "t": f"v{i}"} for i in range(10, 15)]
+    stream.write_rows(first)
+    stream.write_rows(second)
+    paths = stream.close()
+    assert len(paths) > 1
+    assert read_rows(paths) == first + second
+    assert all(pq.read_schema(path).field("t").type == pa.string() for path in paths)
+    assert pq.read_schema(paths[0]).metadata[b"k"] == b"v"
+
+
+def test_struct_field_appearing_later_widens_the_struct(tmp_path):
+    stream = _ParquetStream(str(tmp_path / "a.parquet"))
+    stream.write_rows([{"m": {"x": 1}}, {"m": None}])
+    stream.write_rows([{"m": {"x": 2, "y": "a"}}])
+    assert read_rows(stream.close()) == [{"m": {"x": 1, "y": None}}, {"m": None}, {"m": {"x": 2, "y": "a"}}]
+
+
+def test_columns_are_fixed_by_the_first_batch(tmp_path):
+    # Come pa.Table.from_pylist: le colonne mancanti diventano null, quelle nuove si scartano
+    stream = _ParquetStream(str(tmp_path / "a.parquet"))
+    stream.write_rows([{"i": 1, "t": "a"}])
+    stream.write_rows([{"i": 2, "z": True}])
+    stream.write_table(pa.table({"t": ["c"], "i": [3]}))
+    assert read_rows(stream.close()) == [{"i": 1, "t": "a"}, {"i": 2, "t": None}, {"i": 3, "t": "c"}]
+
+
+def test_abort_leaves_no_files(tmp_path):
+    stream = _ParquetStream(str(tmp_path / "a.parquet"), options=ParquetOptions(target_file_bytes=1, row_group_rows=2))
+    stream.write_rows([{"i": None}] * 5)
+    stream.write_rows([{"i": 1}] * 5)
+    stream.abort()
+    assert os.listdir(tmp_path) == []
@@ -0,0 +1,84 @@
+import os
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from mappings.parquet_writer import ParquetOptions, RollingParquetWriter, read_roll_metadata, rolled_path
+
+SCHEMA = pa.schema([("a", pa.int64()), ("b", pa.null())])
+WIDE = pa.schema([("a", pa.int64()), ("b", pa.string())])
+
+
+def table(start, count, schema=SCHEMA):
+    values = range(start, start + count)
+    return pa.table({"a": list(values), "b": [f"v{i}" if schema is WIDE else None for i in values]}, schema=schema)
+
+
+def writer(tmp_path, **options):
+    return RollingParquetWriter(lambda i: rolled_path(str(tmp_path / "shard.parquet"), i), SCHEMA, ParquetOptions(**options),
+                                metadata={b"k": b"v"})
+
+
+def read_all(paths):
+    return [row["a"] for path in paths for row in pq.read_table(path).to_pylist()]
+
+
+def test_rolls_over_at_the_target_size(tmp_path):
+    # Ogni row group supera il target: un file per row group
+    rolling = writer(tmp_path, target_file_bytes=1, row_group_rows=10)
+    for start in range(0, 35, 7):
+        rolling.write_table(table(start, 7))
+    # Fino a close() su disco ci sono solo i .partial
+    assert all(name.endswith(".partial") for name in os.listdir(tmp_path))
+    paths = rolling.close()
+    assert [os.path.basename(path) for path in paths] == [
+        "shard.parquet", "shard.r00001.parquet", "shard.r00002.parquet", "shard.r00003.parquet",
+    ]
+    assert [pq.read_metadata(path).num_rows for path in paths] == [10, 10, 10, 5]
+    assert read_all(paths) == list(range(35))
+    assert [read_roll_metadata(path) for path in paths] == [
+        {"index": 0, "last": False}, {"index": 1, "last": False}, {"index": 2, "last": False}, {"index": 3, "last": True},
+    ]
+    assert pq.read_schema(paths[0]).metadata[b"k"] == b"v"
+
+
+def test_single_file_without_target(tmp_path):
+    rolling = writer(tmp_path, target_file_bytes=None, row_group_rows=10)
+    for start in range(0, 35, 7):
+        rolling.write_table(table(start, 7))
+    paths = rolling.close()
+    assert len(paths) == 1
+    assert [pq.ParquetFile(paths[0]).metadata.row_group(i).num_rows for i in range(4)] == [10, 10, 10, 5]
+    assert read_roll_metadata(paths[0]) == {"index": 0, "last": True}
+
+
+def test_row_group_bytes_closes_row_groups_early(tmp_path):
+    rolling = writer(tmp_path, target_file_bytes=None, row_group_rows=1000, row_group_bytes=table(0, 20).nbytes)
+    for start in range(0, 100, 10):
+        rolling.write_table(table(start, 10))
+    paths = rolling.close()
+    metadata = pq.read_metadata(paths[0])
+    assert [metadata.row_group(i).num_rows for i in range(metadata.num_row_groups)] == [20] * 5
+    assert read_all(paths) == list(range(100))
+
+
+def test_widen_rewrites_written_and_pending_rows(tmp_path):
+    # Come in _ParquetStream: una colonna tutta null nei primi batch prende un tipo dopo
+    rolling = writer(tmp_path, target_file_bytes=1, row_group_rows=10)
+    rolling.write_table(table(0, 25))
+    rolling.widen(WIDE)
+    rolling.write_table(table(25, 10, WIDE))
+    assert rolling.num_rows == 35
+    paths = rolling.close()
+    assert not [name for name in os.listdir(tmp_path) if name.endswith((".partial", ".tmp"))]
+    rows = [row for path in paths for row in pq.read_table(path).to_pylist()]
+    assert rows == [{"a": i, "b": None} for i in range(25)] + [{"a": i, "b": f"v{i}"} for i in range(25, 35)]
+    assert all(pq.read_schema(path).field("b").type == pa.string() and pq.read_schema(path).metadata[b"k"] == b"v" for path in paths)
+    assert [read_roll_metadata(path)["last"] for path in paths] == [False] * (len(paths) - 1) + [True]
+
+
+def test_abort_removes_partial_files(tmp_path):
+    rolling = writer(tmp_path, target_file_bytes=1, row_group_rows=10)
+    rolling.write_table(table(0, 30))
+    rolling.abort()
+    assert os.listdir(tmp_path) == []
+    assert rolling.close() == []
@@ -0,0 +1,121 @@
+import threading
+import time
+import pytest
+
+from mappings.pipeline import BackgroundWriter, prefetch
+
+
+def pipeline_threads():
+    return [t for t in threading.enumerate() if t.name in ("mapping-reader", "mapping-writer")]
+
+
+@pytest.mark.parametrize("depth", [0, 1, 3])
+def test_prefetch_keeps_order(depth):
+    assert list(prefetch(iter(range(100)), depth)) == list(range(100))
+    assert pipeline_threads() == []
+
+
+@pytest.mark.parametrize("depth", [0, 2])
+def test_prefetch_raises_reader_errors_after_earlier_items(depth):
+    def source():
+        yield 1
+        yield 2
+        raise KeyError("boom")
+
+    seen = []
+    with pytest.raises(KeyError):
+        for item in prefetch(source(), depth):
+            seen.append(item)
+    assert seen == [1, 2]
+    assert pipeline_threads() == []
+
+
+def test_closing_prefetch_stops_a_blocked_reader():
+    closed = threading.Event()
+
+    def source():
+        try:
+            for i in range(1000):
+                yield i
+        finally:
+            closed.set()
+
+    items = prefetch(source(), 1)
+    assert next(items) == 0
+    # Il lettore è fermo sulla coda piena: close() deve sbloccarlo e chiudere la sorgente
+    time.sleep(0.05)
+    items.close()
+    assert closed.is_set()
+    assert pipeline_threads() == []
+
+
+@pytest.mark.parametrize("depth", [0, 2])
+def test_background_writer_keeps_order(depth):
+    written = []
+    writer = BackgroundWriter(depth)
+    for i in range(50):
+        writer.submit(written.append, i)
+    writer.close()
+    assert written == list(range(50))
+    assert pipeline_threads() == []
+
+
+def test_background_writer_raises_errors_on_submit_or_close():
+    failed = threading.Event()
+
+    def write(i):
+        if i == 3:
+            failed.set()
+            raise OSError("disco pieno")
+
+    writer = BackgroundWriter(1)
+    for i in range(4):
+        writer.submit(write, i)
+    failed.wait(1)
+    time.sleep(0.05)
+    with pytest.raises(OSError):
+        writer.submit(write, 4)
+    with pytest.raises(OSError):
+        writer.close()
+    assert pipeline_threads() == []
+
+
+def test_background_writer_drains_after_an_error():
+    # Dopo l'errore le scritture in coda vengono scartate: i submit successivi non restano bloccati
+    writer = BackgroundWriter(1)
+    written = []
+
+    def write(i):
+        if i == 0:
+            raise ValueError("x")
+        written.append(i)
+
+    writer.submit(write, 0)
+    for i in range(1, 20):
+        try:
+            writer.submit(write, i)
+        except ValueError:
+            break
+    with pytest.raises(ValueError):
+        writer.close()
+    assert written == []
+
+
+def test_background_writer_abort_discards_pending_writes():
+    started, release = threading.Event(), threading.Event()
+    written = []
+
+    def slow(i):
+        started.set()
+        release.wait(1)
+        written.append(i)
+
+    writer = BackgroundWriter(3)
+    for i in range(4):
+        writer.submit(slow, i)
+    started.wait(1)
+    threading.Timer(0.05, release.set).start()
+    writer.abort()
+    # Finisce solo la scrittura già iniziata
+    assert written == [0]
+    assert pipeline_threads() == []
@@ -0,0 +1,75 @@
+import pyarrow as pa
+import pyarrow.parquet as pq
+import pytest
+
+from mappings.mapper import Mapper
+from mappings.projection import parquet_columns, source_paths
+from mappings.row_view import row_views
+
+ROWS = [
+    {"id": 1, "body": "x" * 100, "meta": {"k": 3, "tags": ["a", "b"], "deep": {"x": 1, "y": "q"}},
+     "turns": [{"u": "a", "f": [{"n": 1}]}, {"u": "b", "f": []}]},
+    {"id": 2, "body": None, "meta": None, "turns": None},
+]
+
+
+@pytest.fixture
+def parquet_file(tmp_path):
+    path = str(tmp_path / "a.parquet")
+    pq.write_table(pa.Table.from_pylist(ROWS), path)
+    return pq.ParquetFile(path)
+
+
+def columns(parquet_file, *src_fields):
+    return parquet_columns(parquet_file, source_paths([{"src_field": src, "target_field": "x"} for src in src_fields]))
+
+
+def test_source_paths_skip_constants_and_duplicates():
+    mapping = [{"src_field": "a.b"}, {"src_field": "N/A"}, {"src_field": None}, {"src_field": "a.b"}, {"src_field": "c[].d"}]
+    assert source_paths(mapping) == [["a", "b"], ["c", "[]", "d"]]
+
+
+@pytest.mark.parametrize("src_fields, expected", [
+    (["id"], ["id"]),
+    (["meta.k", "meta.deep.y"], ["meta.deep.y", "meta.k"]),
+    (["meta.tags[]"], ["meta.tags.list.element"]),
+    (["meta.tags[1]"], ["meta.tags.list.element"]),
+    (["turns[].u"], ["turns.list.element.u"]),
+    (["turns[].f[].n", "id"], ["id", "turns.list.element.f.list.element.n"]),
+    (["meta"], ["meta"]),
+], ids=["column", "struct-subfields", "list-elements", "list-index", "list-of-structs", "nested-lists", "whole-struct"])
+def test_projection_reads_only_referenced_leaves(parquet_file, src_fields, expected):
+    assert columns(parquet_file, *src_fields) == expected
+
+
+@pytest.mark.parametrize("src_fields, expected", [
+    (["meta.k.z"], ["meta.k"]),
+    (["meta.nope", "id"], ["id", "meta"]),
+    (["id[]"], ["id"]),
+    (["turns.u"], ["turns"]),
+    (["missing", "id"], ["id"]),
+    (["missing"], []),
+], ids=["below-a-leaf", "unknown-subfield", "index-on-scalar", "field-on-list", "missing-column", "only-missing"])
+def test_paths_outside_the_schema_read_the_deepest_valid_part(parquet_file, src_fields, expected):
+    assert columns(parquet_file, *src_fields) == expected
+
+
+def test_every_leaf_needed_reads_everything(parquet_file):
+    assert columns(parquet_file, "id", "body", "meta", "turns") is None
+    assert parquet_columns(parquet_file, None) is None
+
+
+def test_projected_rows_map_like_full_rows(parquet_file):
+    mapping = [
+        {"src_field": "meta.deep.y", "target_field": "y"}, {"src_field": "meta.k.z", "target_field": "z"},
+        {"src_field": "meta.nope", "target_field": "n"}, {"src_field": "turns[].u", "target_field": "m[].u"},
+        {"src_field": "meta.tags[1]", "target_field": "t"},
+    ]
+    schema = {"type": "object", "properties": {
+        "y": {"type": "string"}, "z": {"type": "string"}, "n": {"type": "string"}, "t": {"type": "string"},
+        "m": {"type": "array", "items": {"type": "object", "properties": {"u": {"type": "string"}}}},
+    }}
+    plan = Mapper().compile(mapping, schema)
+    projected = parquet_file.read(columns=parquet_columns(parquet_file, source_paths(mapping))).to_batches()[0]
+    assert "body" not in projected.schema.names
+    assert [plan.apply(row) for row in row_views(projected)] == [plan.apply(row) for row in ROWS]
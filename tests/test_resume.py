@@ -0,0 +1,93 @@
+import os
+import glob
+import pyarrow.parquet as pq
+import pytest
+
+from conftest import MAPPING, DST_SCHEMA, make_rows, write_jsonl, output_rows, no_progress
+from mappings.dead_letters import DEAD_LETTER_DIRNAME
+from mappings.manifest import MANIFEST_FILENAME
+from mappings.parallel_mapping_process import MappingOptions, run_parallel_mapping
+
+SOURCE_ROWS = 1500
+
+
+@pytest.fixture
+def source(input_dir):
+    write_jsonl(os.path.join(input_dir, "a.jsonl"), make_rows(1200))
+    write_jsonl(os.path.join(input_dir, "b.jsonl"), make_rows(300, start=5000))
+    return input_dir
+
+
+def rows_on_disk(output_path):
+    return sum(pq.read_metadata(path).num_rows for path in glob.glob(os.path.join(output_path, "*.parquet")))
+
+
+def run(source, output_path, **kwargs):
+    return run_parallel_mapping(source, output_path, MAPPING, DST_SCHEMA, no_progress, MappingOptions(**kwargs))
+
+
+def test_resume_skips_completed_units(source, tmp_path):
+    output_path = str(tmp_path / "out")
+    first = run(source, output_path, resume=True, unit_bytes=8192)
+    second = run(source, output_path, resume=True, unit_bytes=8192)
+    assert first["skipped_units"] == 0
+    assert second["skipped_units"] == len(glob.glob(os.path.join(output_path, "*.parquet")))
+    # Le righe delle unità saltate si contano dal manifest
+    assert second["total_processed_samples"] == SOURCE_ROWS
+    assert rows_on_disk(output_path) == SOURCE_ROWS
+
+
+@pytest.mark.parametrize("engines", [("python", "duckdb", "python"), ("arrow", "duckdb", "arrow"), ("duckdb", "duckdb")])
+def test_engine_switch_does_not_duplicate_rows(source, tmp_path, engines):
+    if "duckdb" in engines:
+        pytest.importorskip("duckdb")
+    output_path = str(tmp_path / "out")
+    for engine in engines:
+        run(source, output_path, engine=engine, resume=True, unit_bytes=8192)
+        assert rows_on_disk(output_path) == SOURCE_ROWS
+    assert len(output_rows(output_path)) == SOURCE_ROWS
+
+
+@pytest.mark.parametrize("resume", [True, False])
+def test_unit_bytes_change_replaces_shards(source, tmp_path, resume):
+    output_path = str(tmp_path / "out")
+    run(source, output_path, resume=True, unit_bytes=8192)
+    results = run(source, output_path, resume=resume, unit_bytes=65536)
+    assert results["skipped_units"] == 0
+    assert rows_on_disk(output_path) == SOURCE_ROWS
+
+
+def test_reset_removes_previous_shards_and_dead_letters(input_dir, tmp_path):
+    write_jsonl(os.path.join(input_dir, "a.jsonl"), make_rows(100) + ["{non json"])
+    output_path = str(tmp_path / "out")
+    run(input_dir, output_path)
+    assert os.listdir(os.path.join(output_path, DEAD_LETTER_DIRNAME))
+    # Un file non scritto dal mapping resta
+    with open(os.path.join(output_path, "note.txt"), "w") as f:
+        f.write("x")
+    write_jsonl(os.path.join(input_dir, "a.jsonl"), make_rows(100))
+    results = run(input_dir, output_path, resume=False)
+    assert results["removed_shards"] == 1
+    assert rows_on_disk(output_path) == 100
+    assert os.listdir(os.path.join(output_path, DEAD_LETTER_DIRNAME)) == []
+    assert os.path.exists(os.path.join(output_path, "note.txt"))
+    assert os.path.exists(os.path.join(output_path, MANIFEST_FILENAME))
+
+
+def test_resume_drops_shards_of_deleted_sources(source, tmp_path):
+    output_path = str(tmp_path / "out")
+    run(source, output_path, resume=True)
+    os.remove(os.path.join(source, "b.jsonl"))
+    results = run(source, output_path, resume=True)
+    assert results["removed_shards"] == 1
+    assert rows_on_disk(output_path) == 1200
+
+
+def test_resume_redoes_modified_sources(source, tmp_path):
+    output_path = str(tmp_path / "out")
+    run(source, output_path, resume=True)
+    write_jsonl(os.path.join(source, "b.jsonl"), make_rows(50, start=9000))
+    results = run(source, output_path, resume=True)
+    assert results["skipped_units"] == 1
+    assert results["total_processed_samples"] == 1250
+    assert [row["i"] for row in output_rows(output_path)][-50:] == list(range(9000, 9050))
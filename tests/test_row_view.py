@@ -0,0 +1,45 @@
+import pyarrow as pa
+import pytest
+
+from mappings.row_view import LazyView, ListView, StructView, row_views
+
+ROWS = [
+    {"id": 1, "meta": {"k": "a", "tags": [1, 2]}, "turns": [{"u": "x", "f": [{"n": 1}]}, None, {"u": None, "f": []}]},
+    {"id": None, "meta": None, "turns": None},
+    {"id": 3, "meta": {"k": None, "tags": []}, "turns": []},
+]
+
+
+@pytest.fixture
+def batch():
+    # Uno slice: offset e validità devono tenere conto dell'inizio del batch nell'array
+    table = pa.Table.from_pylist([{"id": 0, "meta": {"k": "z", "tags": [9]}, "turns": [{"u": "z", "f": None}]}] + ROWS)
+    return table.to_batches()[0].slice(1)
+
+
+def test_row_views_match_to_pylist(batch):
+    views = row_views(batch)
+    assert [view.materialize() for view in views] == batch.to_pylist() == ROWS
+    assert [dict(view) for view in views] == ROWS
+
+
+def test_navigation_matches_to_pylist(batch):
+    first = row_views(batch)[0]
+    meta, turns = first.step("meta"), first.step("turns")
+    assert isinstance(meta, StructView) and isinstance(turns, ListView)
+    assert meta.step("tags").materialize() == [1, 2]
+    assert [item.materialize() if isinstance(item, LazyView) else item for item in turns.items()] == ROWS[0]["turns"]
+    assert turns[0]["f"][0]["n"] == 1
+    assert turns[-1]["u"] is None
+    assert turns[1] is None
+    # Path che non esistono: None come in _get_by_segments, KeyError/IndexError con l'accesso da dict/lista
+    assert (first.step("missing"), meta.step(0), turns.step("u"), turns.step(5)) == (None, None, None, None)
+    with pytest.raises(KeyError):
+        meta["missing"]
+    with pytest.raises(IndexError):
+        turns[3]
+
+
+def test_lazy_view_is_abstract():
+    with pytest.raises(TypeError):
+        LazyView()
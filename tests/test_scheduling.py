@@ -0,0 +1,72 @@
+import os
+import gzip
+import pyarrow as pa
+import pyarrow.parquet as pq
+import pytest
+
+from mappings.compression import COMPRESSION_RATIOS
+from mappings.scheduling import ROW_COST_BYTES, ScheduleReport, estimate_cost, lpt_order, simulate_makespan
+from mappings.work_units import WorkUnit
+
+
+@pytest.fixture
+def units(tmp_path):
+    small = tmp_path / "small.jsonl"
+    small.write_bytes(b'{"a": 1}\n' * 100)
+    big = tmp_path / "big.jsonl"
+    big.write_bytes(b'{"a": 1}\n' * 5000)
+    packed = str(tmp_path / "packed.jsonl.gz")
+    with gzip.open(packed, "wb") as f:
+        f.write(b'{"a": 1}\n' * 5000)
+    table = str(tmp_path / "t.parquet")
+    pq.write_table(pa.table({"a": list(range(2000))}), table, row_group_size=500)
+    return {"small": WorkUnit(str(small), 0), "big": WorkUnit(str(big), 1), "packed": WorkUnit(packed, 2),
+            "half": WorkUnit(str(big), 1, 0, byte_range=(0, os.path.getsize(big) // 2)),
+            "table": WorkUnit(table, 3), "group": WorkUnit(table, 3, 1, row_groups=(1, 2))}
+
+
+def test_costs_follow_size_rows_and_compression(units):
+    cost = {name: estimate_cost(unit) for name, unit in units.items()}
+    assert cost["big"] == pytest.approx(9 * 5000 + 5000 * ROW_COST_BYTES)
+    assert cost["half"] == pytest.approx(cost["big"] / 2, rel=0.01)
+    # Il gzip vale come il testo decompresso stimato (COMPRESSION_RATIOS), non come i byte su disco
+    packed_size = os.path.getsize(units["packed"].file_path) * COMPRESSION_RATIOS[".gz"]
+    assert cost["packed"] == pytest.approx(packed_size + packed_size / 9 * ROW_COST_BYTES)
+    assert cost["group"] == pytest.approx(cost["table"] / 4, rel=0.05)
+
+
+def test_lpt_order_starts_from_the_most_expensive(units):
+    ordered = lpt_order(list(units.values()))
+    costs = [cost for _, cost in ordered]
+    assert costs == sorted(costs, reverse=True)
+    assert ordered[0][0] is units["big"]
+
+
+def test_simulate_makespan():
+    assert simulate_makespan([], 4) == 0.0
+    # L'ordine conta: l'unità lunga in coda allunga l'esecuzione
+    assert simulate_makespan([4, 1, 1], 2) == 4
+    assert simulate_makespan([1, 1, 4], 2) == 5
+    assert simulate_makespan([1, 2], 8) == 2
+
+
+def test_report_fits_costs_to_the_observed_throughput(units):
+    report = ScheduleReport(workers=2)
+    # Il doppio del costo in quattro volte il tempo: fitted_seconds distribuisce 5 s in proporzione ai costi
+    report.record(units["small"], 100.0, 1.0)
+    report.record(units["big"], 200.0, 4.0)
+    report.record(units["half"], 200.0, 0.0)
+    report.finish()
+    result = report.to_dict()
+    assert result["workers"] == 2
+    assert [u["unit"] for u in result["units"]][-1] == units["small"].output_name()
+    assert [u["fitted_seconds"] for u in result["units"]] == pytest.approx([2.0, 2.0, 1.0])
+    assert result["fitted_seconds"] == pytest.approx(3.0)
+    assert result["actual_seconds"] >= 0
+    assert "predicted_seconds" not in result
+
+
+def test_empty_report():
+    report = ScheduleReport(workers=4)
+    report.finish()
+    assert report.to_dict()["fitted_seconds"] == 0.0
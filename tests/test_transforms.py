@@ -0,0 +1,88 @@
+import pyarrow as pa
+import pyarrow.parquet as pq
+import pytest
+
+from mappings import transforms
+from mappings.arrow_mapper import ArrowMapper
+from mappings.mapper import Mapper
+
+ROWS = [
+    {"name": " Ada ", "role": "human", "n": 3, "meta": {"first": "Ada", "last": "L", "ok": True}},
+    {"name": None, "role": "gpt", "n": None, "meta": {"first": None, "last": "B", "ok": None}},
+    {"name": "bob", "role": None, "n": 12, "meta": None},
+]
+MAPPING = [
+    {"src_field": "name", "target_field": "name", "transformation": "clean"},
+    {"src_field": "role", "target_field": "role", "transformation": "role"},
+    {"src_field": "n", "target_field": "n", "transformation": "to_text"},
+    {"src_field": "meta", "target_field": "label", "transformation": "label"},
+    {"src_field": "name", "target_field": "tag", "transformation": "tag"},
+]
+SCHEMA = {"type": "object", "properties": {
+    "name": {"type": "string"}, "role": {"type": "string"}, "n": {"type": "string"},
+    "label": {"type": "string"}, "tag": {"type": "string"},
+}}
+
+
+def mapper(with_batch=True):
+    mapper = Mapper()
+    registered = {
+        "clean": transforms.normalize_string(strip=True, lower=True),
+        "role": transforms.lookup({"human": "USER", "gpt": "ASSISTANT"}, default="UNKNOWN"),
+        "to_text": transforms.cast_to(pa.string()),
+        "label": transforms.concat_fields(["first", "last", "ok"], "-"),
+        "tag": transforms.constant("T"),
+    }
+    for name, transform in registered.items():
+        mapper.register_transform(name, transform.fn, transform.batch if with_batch else None)
+    return mapper
+
+
+def expected_rows():
+    plan = mapper().compile(MAPPING, SCHEMA)
+    return [plan.apply(row) for row in ROWS]
+
+
+def test_row_transforms():
+    assert expected_rows() == [
+        {"name": "ada", "role": "USER", "n": "3", "label": "Ada-L-True", "tag": "T"},
+        {"name": None, "role": "ASSISTANT", "n": None, "label": "B", "tag": None},
+        {"name": "bob", "role": None, "n": "12", "label": None, "tag": "T"},
+    ]
+
+
+def test_arrow_engine_uses_batch_implementations():
+    batch = pa.RecordBatch.from_pylist(ROWS)
+    arrow = ArrowMapper(MAPPING, SCHEMA, mapper=mapper())
+    assert arrow.map_batch(batch).to_pylist() == expected_rows()
+    assert arrow._columnar[batch.schema] is True
+
+
+def test_arrow_engine_without_batch_falls_back_to_rows():
+    batch = pa.RecordBatch.from_pylist(ROWS)
+    arrow = ArrowMapper(MAPPING, SCHEMA, mapper=mapper(with_batch=False))
+    assert arrow.map_batch(batch).to_pylist() == expected_rows()
+    assert arrow._columnar[batch.schema] is False
+
+
+@pytest.mark.parametrize("with_batch", [True, False])
+def test_duckdb_engine_uses_batch_implementations_as_udfs(tmp_path, with_batch):
+    pytest.importorskip("duckdb")
+    from mappings.duckdb_mapper import DuckDBMapper
+
+    source, output = str(tmp_path / "a.parquet"), str(tmp_path / "out.parquet")
+    pq.write_table(pa.Table.from_pylist(ROWS), source)
+    written = DuckDBMapper(MAPPING, SCHEMA, mapper=mapper(with_batch)).copy_files([source], output)
+    if not with_batch:
+        # Senza implementazione batch il mapping non è traducibile in SQL e passa dal Mapper
+        assert written is None
+        return
+    assert written == len(ROWS)
+    assert pq.read_table(output).to_pylist() == expected_rows()
+
+
+def test_apply_batch_keeps_nulls_and_checks_length():
+    arr = pa.array(["a", None])
+    assert transforms.apply_batch(transforms.constant("x").batch, arr).to_pylist() == ["x", None]
+    with pytest.raises(ValueError):
+        transforms.apply_batch(lambda values: values.slice(1), arr)
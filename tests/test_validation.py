@@ -0,0 +1,94 @@
+import os
+import json
+import pytest
+import pyarrow.parquet as pq
+
+from conftest import make_rows, write_jsonl, no_progress
+from mappings import validation
+from mappings.validation import CompiledValidator, ValidationReport
+from mappings.parallel_mapping_process import MappingOptions, run_parallel_mapping
+
+SCHEMA = {
+    "type": "object",
+    "properties": {
+        "when": {"type": "string", "format": "date-time"},
+        "i": {"type": "integer", "maximum": 10},
+        "m": {"type": "object", "properties": {"k": {"type": "integer"}, "s": {"type": "string"}}},
+    },
+    "required": ["i"],
+}
+ROWS = [
+    {"i": 1, "when": "non una data"},
+    {"i": "x"},
+    {},
+    {"i": 11, "m": {"k": "y"}},
+    {"i": 2, "m": {"k": 1, "s": None}},
+]
+
+
+@pytest.fixture(params=["jsonschema", "fastjsonschema"])
+def validator(request, monkeypatch):
+    if request.param == "fastjsonschema":
+        pytest.importorskip("fastjsonschema")
+    else:
+        monkeypatch.setattr(validation, "fastjsonschema", None)
+    return CompiledValidator(SCHEMA)
+
+
+def test_validators_agree_with_jsonschema(validator):
+    # jsonschema senza format checker ignora "format": anche il controllo generato deve accettare la riga
+    assert [validator.is_valid(row) for row in ROWS] == [True, False, False, False, False]
+    assert [[(v.path, v.schema_path) for v in validator.violations(row)] for row in ROWS] == [
+        [], [("i", "properties.i.type")], [("", "required")],
+        [("i", "properties.i.maximum"), ("m.k", "properties.m.properties.k.type")],
+        [("m.s", "properties.m.properties.s.type")],
+    ]
+
+
+def test_report_treats_null_as_absent(validator):
+    report = ValidationReport(every=1)
+    report.check(validator, [{"i": 2, "m": {"k": 1}}, {"i": 2, "m": {"k": 1, "s": None}}, {"i": None}], [0, 1, 2], "f")
+    result = report.to_dict()
+    assert (result["checked_rows"], result["invalid_rows"]) == (3, 1)
+    assert [(v["schema_path"], v["message"]) for v in result["violations"]] == [("required", "'i' is a required property")]
+
+
+@pytest.mark.parametrize("every", [1, 3])
+def test_validation_report_is_the_same_for_every_engine(input_dir, tmp_path, every):
+    rows = make_rows(300)
+    for row in rows[::50]:
+        row["meta"]["k"] = 99
+    for row in rows[5::40]:
+        row["text"] = None
+    write_jsonl(os.path.join(input_dir, "a.jsonl"), rows)
+    mapping = [{"src_field": "id", "target_field": "i"}, {"src_field": "text", "target_field": "t"}, {"src_field": "meta", "target_field": "m"}]
+    schema = {"type": "object", "required": ["i"], "properties": {
+        "i": {"type": "integer"}, "t": {"type": "string"},
+        "m": {"type": "object", "properties": {"k": {"type": "integer", "maximum": 10}}},
+    }}
+    reports = {}
+    for engine in ("python", "arrow"):
+        results = run_parallel_mapping(input_dir, str(tmp_path / engine), mapping, schema, no_progress, MappingOptions(engine=engine, validate_every=every))
+        reports[engine] = json.dumps(results["validation"], sort_keys=True)
+    assert reports["python"] == reports["arrow"]
+    # Le righe con "text" a None sono valide: solo quelle con k=99, tra quelle campionate, non lo sono
+    assert json.loads(reports["python"])["invalid_rows"] == len([i for i in range(0, 300, 50) if i % every == 0])
+
+
+def test_query_view_accepts_shards_with_unmapped_optional_fields(tmp_path):
+    from mappings.arrow_schema import output_schema, rows_to_table
+    from ui.query_dataset_handler import invalid_rows
+
+    schema = {"type": "object", "properties": {
+        "a": {"type": "string"},
+        "b": {"type": "object", "properties": {"x": {"type": "string"}, "y": {"type": "integer"}}},
+    }}
+    mapping = [{"src_field": "a", "target_field": "a"}, {"src_field": "x", "target_field": "b.x"}]
+    path = str(tmp_path / "shard.parquet")
+    pq.write_table(rows_to_table([{"a": "q", "b": {"x": "z"}}], output_schema(schema, mapping)), path)
+    rows = pq.read_table(path).to_pylist()
+    # Il campo non mappato torna come null esplicito
+    assert rows == [{"a": "q", "b": {"x": "z", "y": None}}]
+    assert CompiledValidator(schema).validate_many(rows) == [["b.y: None is not of type 'integer'"]]
+    assert invalid_rows(rows, schema) == []
+    assert invalid_rows([{"a": 1, "b": {"x": "z", "y": None}}], schema) == [(0, ["a: 1 is not of type 'string'"])]
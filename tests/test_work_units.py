@@ -0,0 +1,105 @@
+import os
+import gzip
+import json
+import pyarrow as pa
+import pyarrow.parquet as pq
+import pytest
+
+from conftest import make_rows, write_jsonl
+from mappings.readers import ReadRequest, plan_work_units, reader_for
+from mappings.work_units import WorkUnit
+
+
+def read_units(units):
+    """Righe e posizioni lette unità per unità, nell'ordine dei nomi di output"""
+    rows, offsets = [], []
+    for unit in sorted(units, key=WorkUnit.output_name):
+        for batch in reader_for(unit.file_path).read(unit, ReadRequest(batch_size=64)):
+            rows.extend(batch.rows.to_pylist() if isinstance(batch.rows, pa.RecordBatch) else batch.rows)
+            offsets.extend(batch.offsets)
+    return rows, offsets
+
+
+def assert_contiguous(ranges, end):
+    assert ranges[0][0] == 0 and ranges[-1][1] == end
+    assert all(previous[1] == following[0] for previous, following in zip(ranges, ranges[1:]))
+
+
+def test_parquet_split_by_row_groups(tmp_path):
+    path = str(tmp_path / "a.parquet")
+    pq.write_table(pa.Table.from_pylist(make_rows(1000)), path, row_group_size=100)
+    units = plan_work_units([path], unit_bytes=2048)
+    assert len(units) > 1
+    assert [unit.part for unit in units] == list(range(len(units)))
+    assert_contiguous([unit.row_groups for unit in units], 10)
+    # Le posizioni sono gli indici dei record nel file, anche nelle unità successive alla prima
+    rows, offsets = read_units(units)
+    assert [row["id"] for row in rows] == list(range(1000))
+    assert list(offsets) == list(range(1000))
+
+
+def test_small_files_stay_whole(tmp_path):
+    parquet_path = str(tmp_path / "a.parquet")
+    pq.write_table(pa.Table.from_pylist(make_rows(10)), parquet_path)
+    jsonl_path = str(tmp_path / "b.jsonl")
+    write_jsonl(jsonl_path, make_rows(10))
+    assert plan_work_units([parquet_path, jsonl_path]) == [WorkUnit(parquet_path, 0), WorkUnit(jsonl_path, 1)]
+
+
+def test_jsonl_byte_ranges_cover_every_line_once(tmp_path):
+    path = str(tmp_path / "a.jsonl")
+    # Righe di lunghezza diversa: i confini delle unità cadono a metà riga
+    write_jsonl(path, [{"id": i, "text": "x" * (i % 37)} for i in range(500)])
+    size = os.path.getsize(path)
+    units = plan_work_units([path], unit_bytes=1000)
+    assert len(units) == -(-size // 1000)
+    assert_contiguous([unit.byte_range for unit in units], size)
+    rows, offsets = read_units(units)
+    assert [row["id"] for row in rows] == list(range(500))
+    with open(path, "rb") as f:
+        starts = [0] + [i + 1 for i, byte in enumerate(f.read()) if byte == ord("\n")][:-1]
+    assert list(offsets) == starts
+
+
+def test_json_array_with_a_record_per_line_is_split(tmp_path):
+    path = str(tmp_path / "a.json")
+    with open(path, "w", encoding="utf-8") as f:
+        f.write("[\n" + ",\n".join(json.dumps(row) for row in make_rows(300)) + "\n]\n")
+    units = plan_work_units([path], unit_bytes=2048)
+    assert len(units) > 1
+    assert_contiguous([unit.byte_range for unit in units], os.path.getsize(path))
+    rows, _ = read_units(units)
+    assert [row["id"] for row in rows] == list(range(300))
+
+
+@pytest.mark.parametrize("name", ["a.json", "a.jsonl.gz", "a.csv"])
+def test_unsplittable_files_stay_whole(tmp_path, name):
+    path = str(tmp_path / name)
+    rows = make_rows(300)
+    if name.endswith(".json"):
+        # Array formattato: gli elementi occupano più righe
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(rows, f, indent=2)
+    elif name.endswith(".gz"):
+        with gzip.open(path, "wt", encoding="utf-8") as f:
+            f.writelines(json.dumps(row) + "\n" for row in rows)
+    else:
+        with open(path, "w", encoding="utf-8") as f:
+            f.write("id,text\n" + "".join(f"{row['id']},{row['text']}\n" for row in rows))
+    assert os.path.getsize(path) > 512
+    assert plan_work_units([path], unit_bytes=512) == [WorkUnit(path, 0)]
+
+
+def test_output_names_follow_the_source_order():
+    units = [WorkUnit("in/a.jsonl", 3, part, byte_range=(part, part + 1)) for part in range(12)]
+    names = [unit.output_name() for unit in units]
+    assert names[0] == "a_mapped_3_00000.parquet"
+    assert sorted(names) == names
+    assert WorkUnit("in/a.jsonl", 3).output_name() == "a_mapped_3.parquet"
+
+
+def test_unsupported_extension_is_rejected(tmp_path):
+    path = str(tmp_path / "a.xml")
+    open(path, "w").close()
+    with pytest.raises(ValueError, match="non supportato"):
+        plan_work_units([path])
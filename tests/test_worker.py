@@ -0,0 +1,52 @@
+import os
+
+from conftest import MAPPING, DST_SCHEMA, make_rows, write_jsonl, output_rows
+from mappings import parallel_mapping_process
+from mappings.mapper import Mapper
+from mappings.parallel_mapping_process import MappingOptions, run_parallel_mapping, _MappingWorker, _init_worker, _process_in_worker
+from mappings.readers import plan_work_units
+
+# "items" non è uno schema: la compilazione del mapping fallisce
+BROKEN_SCHEMA = {"type": "object", "properties": {"i": {"type": "array", "items": "non uno schema"}}}
+
+
+def test_worker_compiles_the_mapping_only_at_init(input_dir, tmp_path, monkeypatch):
+    write_jsonl(os.path.join(input_dir, "a.jsonl"), make_rows(300))
+    write_jsonl(os.path.join(input_dir, "b.jsonl"), make_rows(100, start=1000))
+    output_path = str(tmp_path / "out")
+    os.makedirs(output_path)
+    compiled = []
+    compile_plan = Mapper.compile
+    monkeypatch.setattr(Mapper, "compile", lambda self, *args: compiled.append(1) or compile_plan(self, *args))
+    monkeypatch.setattr(parallel_mapping_process, "_worker", None)
+    units = plan_work_units([os.path.join(input_dir, name) for name in ("a.jsonl", "b.jsonl")], unit_bytes=4096)
+    assert len(units) > 2
+    _init_worker(MAPPING, DST_SCHEMA, output_path, MappingOptions(engine="arrow"), None)
+    at_init = len(compiled)
+    results = [_process_in_worker(unit, None) for unit in units]
+    assert all(result[1] for result in results)
+    assert sum(result[2] for result in results) == 400
+    # Nessuna compilazione per unità: piano e ArrowMapper sono quelli costruiti dall'initializer
+    assert at_init > 0 and len(compiled) == at_init
+    assert [row["i"] for row in output_rows(output_path)] == list(range(300)) + list(range(1000, 1100))
+
+
+def test_compile_error_is_reported_for_every_unit(input_dir, tmp_path):
+    write_jsonl(os.path.join(input_dir, "a.jsonl"), make_rows(300))
+    units = plan_work_units([os.path.join(input_dir, "a.jsonl")], unit_bytes=4096)
+    worker = _MappingWorker(MAPPING, BROKEN_SCHEMA, str(tmp_path))
+    assert worker.compile_error is not None
+    results = [worker.process(unit) for unit in units]
+    assert [(result[1], result[2]) for result in results] == [(False, 0)] * len(units)
+    assert all(result[3] is worker.compile_error for result in results)
+
+
+def test_compile_error_does_not_break_the_pool(input_dir, tmp_path):
+    write_jsonl(os.path.join(input_dir, "a.jsonl"), make_rows(300))
+    write_jsonl(os.path.join(input_dir, "b.jsonl"), make_rows(10))
+    progress = []
+    results = run_parallel_mapping(input_dir, str(tmp_path / "out"), MAPPING, BROKEN_SCHEMA, progress.append, MappingOptions(unit_bytes=4096))
+    assert results["successful_files"] == 0
+    assert results["total_processed_samples"] == 0
+    # Ogni unità è stata completata (con errore) dal pool
+    assert progress[-1] == 1.0
@@ -3,7 +3,9 @@ import json
 import glob
 import pyarrow.parquet as pq
 import pyarrow as pa
-from mappings.parallel_mapping_process import run_parallel_mapping
+from mappings.parallel_mapping_process import run_parallel_mapping, MappingOptions, MAPPING_ENGINES, DEFAULT_BATCH_SIZE
+from mappings.parquet_writer import ParquetOptions, PARQUET_CODECS, DEFAULT_TARGET_FILE_BYTES, DEFAULT_ROW_GROUP_ROWS
+from mappings.dead_letters import DEAD_LETTER_FORMATS
 
 
 
@@ -25,6 +27,61 @@ def show_parallel_mapping(st, processed_data_dir, metadata_path):
     st.write(f"**Percorso di output:** `{output_data_path}`")
     mapping_str=glob.glob(os.path.join(metadata_path,f"{st.session_state.selected_version}__{st.session_state.selected_dataset_name}__{st.session_state.selected_subpath}__*.json"))
     st.write(f"**Mapping PATH sorgente:** `{mapping_str}`")
+    engine = st.selectbox(
+        "Motore di mapping",
+        MAPPING_ENGINES,
+        help="'python' applica il Mapper riga per riga; 'arrow' esegue il mapping sulle colonne dei file parquet, CSV e JSON Lines; 'duckdb' traduce il mapping in una query SQL eseguita da DuckDB.",
+    )
+    profile = st.checkbox(
+        "Profila il mapping",
+        help="Misura tempo e allocazioni per regola e per fase del Mapper e salva il report JSON accanto ai file Parquet.",
+    )
+    batch_size = st.number_input(
+        "Righe per batch",
+        min_value=1,
+        value=DEFAULT_BATCH_SIZE,
+        step=1000,
+        help="Righe lette, mappate e scritte per volta da ogni processo: limita la memoria usata per file.",
+    )
+    resume = st.checkbox(
+        "Elabora solo file nuovi o modificati",
+        value=True,
+        help="Riusa gli shard già presenti nella cartella di output se file sorgente, mapping e schema non sono cambiati (anche dopo un'esecuzione interrotta) ed elimina quelli dei file sorgente cancellati.",
+    )
+    hash_sources = st.checkbox(
+        "Confronta il contenuto dei file sorgente",
+        help="Oltre a dimensione e data di modifica calcola lo sha256 di ogni file sorgente: più lento, ma rileva modifiche che non cambiano la data.",
+    )
+    compression = st.selectbox(
+        "Compressione Parquet",
+        PARQUET_CODECS,
+        help="Codec dei file di output: zstd comprime meglio, snappy è più veloce da leggere e scrivere.",
+    )
+    target_file_mb = st.number_input(
+        "Dimensione dei file di output (MB)",
+        min_value=1,
+        value=DEFAULT_TARGET_FILE_BYTES // (1024 * 1024),
+        help="Ogni shard passa a un nuovo file quando raggiunge questa dimensione compressa su disco (non applicato dal motore duckdb).",
+    )
+    row_group_rows = st.number_input(
+        "Righe per row group",
+        min_value=1,
+        value=DEFAULT_ROW_GROUP_ROWS,
+        step=10000,
+        help="Row group più grandi comprimono meglio e velocizzano le scansioni; più piccoli riducono la memoria in lettura.",
+    )
+    dead_letters = st.selectbox(
+        "Righe non valide",
+        DEAD_LETTER_FORMATS + ("interrompi il file",),
+        help="Le righe che non si decodificano, non si mappano o non rispettano lo schema vengono salvate con file, offset ed errore nella cartella dead_letters (parquet o JSON Lines) e le altre vengono scritte; altrimenti una riga non valida fa fallire il suo file.",
+    )
+    validate_every = st.number_input(
+        "Valida una riga ogni N (0 = nessuna validazione)",
+        min_value=0,
+        value=0,
+        step=1,
+        help="Valida le righe mappate contro lo schema di destinazione durante il mapping, senza rileggere l'output: 1 le valida tutte, N una ogni N. Le violazioni vengono riassunte per regola dello schema (non vale per le righe convertite da DuckDB).",
+    )
     progress_bar = st.progress(0.0)
     
     # Callback per l'aggiornamento della barra di avanzamento
@@ -55,13 +112,54 @@ def show_parallel_mapping(st, processed_data_dir, metadata_path):
         output_data_path,
         st.session_state.mapping,
         st.session_state.dst_schema,
-        update_progress
+        update_progress,
+        MappingOptions(
+            engine=engine,
+            profile=profile,
+            batch_size=int(batch_size),
+            resume=resume,
+            hash_sources=hash_sources,
+            parquet=ParquetOptions(
+                target_file_bytes=int(target_file_mb) * 1024 * 1024,
+                row_group_rows=int(row_group_rows),
+                compression=compression,
+            ),
+            dead_letters=dead_letters if dead_letters in DEAD_LETTER_FORMATS else None,
+            validate_every=int(validate_every),
+        ),
     )
     
     st.success("Elaborazione Completata!")
     st.write(f"File elaborati con successo: {results['successful_files']} / {results['total_files']}")
     st.write(f"Campioni totali elaborati: {results['total_processed_samples']}")
+    if results.get("skipped_units"):
+        st.write(f"Unità già aggiornate saltate: {results['skipped_units']}")
+    if results.get("removed_shards"):
+        st.write(f"Shard obsoleti eliminati: {results['removed_shards']}")
+    if results.get("dead_letter_rows"):
+        st.warning(f"Righe scartate: {results['dead_letter_rows']}, salvate in `{results['dead_letters_path']}`")
+        st.dataframe([{"file": file_path, "righe scartate": errors} for file_path, errors in results["file_errors"].items()])
+    validation = results.get("validation")
+    if validation:
+        if validation["invalid_rows"]:
+            st.warning(f"Righe non valide rispetto allo schema di destinazione: {validation['invalid_rows']} su {validation['checked_rows']} controllate")
+            st.dataframe([
+                {"regola": v["schema_path"], "errore": v["message"], "occorrenze": v["count"],
+                 "esempi": ", ".join(f"{os.path.basename(e['file'])}@{e['offset']}" for e in v["examples"])}
+                for v in validation["violations"]
+            ])
+        else:
+            st.write(f"Righe validate senza errori: {validation['checked_rows']}")
     st.write(f"I dati sono stati salvati in: `{output_data_path}`")
+    schedule = results.get("schedule")
+    if schedule and schedule["units"]:
+        st.write(f"Tempo ricostruito dai costi stimati: {schedule['fitted_seconds']:.1f}s, effettivo: {schedule['actual_seconds']:.1f}s ({len(schedule['units'])} unità su {schedule['workers']} worker)")
+    if "profile_report" in results:
+        with open(results["profile_report"], "r", encoding="utf-8") as f:
+            profile_report = json.load(f)
+        st.subheader("Profilo del mapping")
+        st.json(profile_report["phases"])
+        st.dataframe(profile_report["entries"][:20])
 
     parquet_files = sorted(glob.glob(os.path.join(output_data_path, "*_mapped_*.parquet")))
     if parquet_files:
@@ -1,13 +1,23 @@
 import os
 import json
 import pyarrow.parquet as pq
-import jsonschema
+from mappings.validation import get_validator
+from mappings.parquet_writer import ParquetOptions, RollingParquetWriter
+from mappings.manifest import MANIFEST_FILENAME
+from mappings.parallel_mapping_process import MAPPING_PROFILE_FILENAME
 import glob
 import duckdb
-import numpy as np  
 from pathlib import Path
 import pyarrow as pa # CORRECT: Import pyarrow core module
 
+def invalid_rows(rows, schema):
+    """
+    Righe non valide di uno shard come (indice, errori). Validatore compilato una volta per schema: si valida
+    tutto il file, non solo il primo sample. Nei parquet i campi opzionali non mappati sono null: contano come assenti.
+    """
+    row_errors = get_validator(schema).validate_many(rows, drop_nulls=True)
+    return [(i, errs) for i, errs in enumerate(row_errors) if errs]
+
 def show_query_dataset(st, base_path, processed_data_dir, metadata_path, schema_dir):
 
     st.header("Interrogazione Dataset")
@@ -38,11 +48,17 @@ def show_query_dataset(st, base_path, processed_data_dir, metadata_path, schema_
     if not dataset_data or not os.path.isdir(dataset_data):
         st.warning("Nessun dataset selezionato o percorso non valido.")
         return
-    files = os.listdir(dataset_data)
+    # I file accanto agli shard (manifest, profilo, cartella dei dead letter) non sono dati
+    sidecars = {MANIFEST_FILENAME, MAPPING_PROFILE_FILENAME}
+    files = sorted(
+        f for f in os.listdir(dataset_data)
+        if f not in sidecars and not f.endswith(".partial") and os.path.isfile(os.path.join(dataset_data, f))
+    )
     if not files:
         st.warning("Nessun file trovato nella cartella del dataset.")
         return
-    first_file = files[0]
+    # Se ci sono file Parquet si usa il primo di questi, altrimenti il primo file per segnalarne il formato
+    first_file = next((f for f in files if f.endswith(".parquet")), files[0])
     file_path = os.path.join(dataset_data, first_file)
     file_ext = os.path.splitext(first_file)[-1].lower()
     valid_for_query = False
@@ -66,9 +82,8 @@ def show_query_dataset(st, base_path, processed_data_dir, metadata_path, schema_
                 else:
                     with open(schema_path, "r", encoding="utf-8") as f:
                         schema = json.load(f)
-                    validator = jsonschema.Draft7Validator(schema)
-                    try:
-                        validator.validate(sample)
+                    invalid = invalid_rows(rows, schema)
+                    if rows and not invalid:
                         st.success("Il dataset è elegibile per interrogazioni.")
                         valid_for_query = True
 
@@ -78,8 +93,9 @@ def show_query_dataset(st, base_path, processed_data_dir, metadata_path, schema_
                         query_dataset(st,dataset_data,schema_path, src_dataset_path)
                         ##############################################################
 
-                    except jsonschema.exceptions.ValidationError:
-                        st.error("Il sample non è valido rispetto allo schema di destinazione.")
+                    elif invalid:
+                        first_row, first_errors = invalid[0]
+                        st.error(f"{len(invalid)} righe su {len(rows)} non sono valide rispetto allo schema di destinazione (prima: riga {first_row}, {first_errors[0]}).")
         except Exception as e:
             st.error(f"Errore nella lettura/parquet/validazione: {e}")
     if not valid_for_query:
@@ -465,7 +481,7 @@ def show_table_structure(st, dataset_path):
 
 def save_query_results(st, result_df, output_path, folder_name):
     """
-    Salva i risultati della query in file Parquet con dimensione massima di 120MB,
+    Salva i risultati della query in file Parquet di circa 128MB compressi (ParquetOptions),
     preservando i tipi di dati annidati.
     """
     
@@ -518,48 +534,34 @@ def save_query_results(st, result_df, output_path, folder_name):
             st.info(f"📁 Creata nuova cartella: {destination_path}")
         
         # Usa le dimensioni della PyArrow Table per il calcolo
-        estimated_size_bytes = table.nbytes
-        estimated_size_mb = estimated_size_bytes / (1024 * 1024)
+        estimated_size_mb = table.nbytes / (1024 * 1024)
         st.info(f"📊 Dimensione stimata dei dati: {estimated_size_mb:.2f} MB")
-        
-        # Dimensione massima per file (120 MB)
-        max_size_mb = 120
-        
-        # Salva direttamente la PyArrow Table, che è più efficiente
-        if estimated_size_mb <= max_size_mb:
-            output_file = destination_path / "query_results_001.parquet"
-            # USA PYARROW PER SALVARE LA TABELLA
-            pq.write_table(table, output_file) 
-            st.success(f"✅ Risultati salvati in: `{output_file}`")
-            st.info(f"📈 Salvate {table.num_rows} righe in 1 file")
-        else:
-            # Salvataggio in chunk (più complesso con PyArrow, ma necessario)
-            num_chunks = int(np.ceil(estimated_size_mb / max_size_mb))
-            chunk_size = int(np.ceil(table.num_rows / num_chunks))
-            
-            st.info(f"🔧 Dataset grande, suddiviso in {num_chunks} file da massimo {max_size_mb}MB")
-            
-            progress_bar = st.progress(0)
-            
-            for i in range(num_chunks):
-                start_idx = i * chunk_size
-                end_idx = min(start_idx + chunk_size, table.num_rows)
-                
-                # Slicing della PyArrow Table
-                chunk_table = table.slice(offset=start_idx, length=end_idx - start_idx)
-                
-                file_name = f"query_results_{i+1:03d}.parquet"
-                output_file = destination_path / file_name
-                
-                # Salva il chunk
-                pq.write_table(chunk_table, output_file)
-                
-                progress_bar.progress((i + 1) / num_chunks)
-            
-            progress_bar.progress(1.0)
-            st.success(f"✅ Salvataggio completato!")
-            st.info(f"📈 Salvate {table.num_rows} righe totali in {num_chunks} file")
-        
+
+        # File a rotazione: si passa al successivo quando quello corrente raggiunge la
+        # dimensione target su disco (già compresso), con row group di dimensione fissa
+        options = ParquetOptions()
+        writer = RollingParquetWriter(
+            lambda i: str(destination_path / f"query_results_{i+1:03d}.parquet"), table.schema, options
+        )
+        progress_bar = st.progress(0)
+        try:
+            for start in range(0, table.num_rows, options.row_group_rows):
+                writer.write_table(table.slice(start, options.row_group_rows))
+                progress_bar.progress(min(start + options.row_group_rows, table.num_rows) / table.num_rows)
+            written = writer.close()
+        except Exception:
+            writer.abort()
+            raise
+        progress_bar.progress(1.0)
+
+        if not written:
+            # Query senza righe: un file vuoto conserva comunque lo schema
+            written = [str(destination_path / "query_results_001.parquet")]
+            pq.write_table(table, written[0], **options.writer_kwargs())
+        target_mb = options.target_file_bytes / (1024 * 1024)
+        st.success(f"✅ Risultati salvati in: `{destination_path}`")
+        st.info(f"📈 Salvate {table.num_rows} righe in {len(written)} file (al massimo circa {target_mb:.0f}MB ciascuno, compressione {options.compression})")
+
         st.session_state.show_save_interface = False
         return True
         
@@ -1,9 +1,12 @@
 import os
 import json
-import gzip
 import pandas as pd
 import pyarrow.parquet as pq
 import numpy as np
+from itertools import islice
+from mappings.json_array_reader import is_json_array, iter_array_records
+from mappings.jsonl_reader import iter_line_chunks
+from mappings.compression import compression_of, open_source, strip_compression
 
 import re
 
@@ -122,7 +125,7 @@ def load_dataset_samples(data_folder, k=1):
         print(f"La cartella dei dati '{data_folder}' non esiste.")
         return None
 
-    supported_extensions = ['json', '.jsonl', '.csv', '.gz', '.parquet', '.jsonl.gz']
+    supported_extensions = ['json', '.jsonl', '.csv', '.tsv', '.gz', '.parquet', '.jsonl.gz', '.zst', '.xz', '.bz2']
     data_files = [f for f in os.listdir(data_folder) if any(f.endswith(ext) for ext in supported_extensions)]
     
     if not data_files:
@@ -130,28 +133,29 @@ def load_dataset_samples(data_folder, k=1):
         return None
         
     file_path = os.path.join(data_folder, data_files[0])
+    # Formato dal nome senza l'estensione di compressione: i file compressi si leggono in streaming
+    base_path = strip_compression(file_path)
     
     try:
-        if file_path.endswith('.jsonl') or file_path.endswith('.json'):
-            with open(file_path, 'r', encoding='utf-8') as f:
-                samples = [json.loads(line) for line in f.readlines()[:k]]
-        
-        elif file_path.endswith('.jsonl.gz') or file_path.endswith('.gz'):
-            with gzip.open(file_path, 'rt', encoding='utf-8') as f:
-                samples = [json.loads(line) for line in f.readlines()[:k]]
-        
-        elif file_path.endswith('.csv'):
-            df = pd.read_csv(file_path, nrows=k)
+        if base_path.endswith('.json') and is_json_array(file_path):
+            # Un unico array JSON: si decodificano solo i primi k elementi
+            samples = list(islice(iter_array_records(file_path), k))
+
+        elif base_path.endswith('.csv') or base_path.endswith('.tsv'):
+            with open_source(file_path) as f:
+                df = pd.read_csv(f, sep='\t' if base_path.endswith('.tsv') else ',', nrows=k)
             samples = df.to_dict('records')
         
-        elif file_path.endswith('.parquet'):
-            table = pq.read_table(file_path, columns=None)
-            df = table.to_pandas().head(k)
-            samples = df.to_dict('records')
+        elif base_path.endswith('.jsonl') or base_path.endswith('.json') or compression_of(file_path):
+            # Solo le prime k righe, anche dai file compressi
+            lines = next(iter_line_chunks(file_path, k), [])
+            samples = [json.loads(line) for line in lines]
         
-        elif file_path.endswith('.tsv'):
-            df = pd.read_csv(file_path, sep='\t', nrows=k)
-            samples = df.to_dict('records')
+        elif file_path.endswith('.parquet'):
+            parquet_file = pq.ParquetFile(file_path)
+            # Basta il primo batch: non si decodifica il resto del file
+            batch = next(parquet_file.iter_batches(batch_size=k), None)
+            samples = batch.to_pandas().to_dict('records') if batch is not None else []
         
         else:
             return None